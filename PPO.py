@@ -1,49 +1,182 @@
+import os
+
+import numpy as np
 import torch
 import torch.nn as nn
 from torch.distributions import MultivariateNormal
 from torch.distributions import Categorical
 
+import checkpoint
+import numpy_policy
+
 ################################## set device ##################################
-print("============================================================================================")
-# set device to cpu or cuda
-device = torch.device('cpu')
-if(torch.cuda.is_available()): 
-    device = torch.device('cuda:0') 
-    torch.cuda.empty_cache()
-    print("Device set to : " + str(torch.cuda.get_device_name(device)))
-else:
-    print("Device set to : cpu")
-print("============================================================================================")
+# the device is resolved on first use (not at import), so importing this module stays cheap
+# and side-effect free in env workers and evaluation scripts
+_default_device = None
+
+
+def get_device(device=None):
+    # torch device for the PPO classes: the given device, else $PPO_DEVICE, else cuda:0 when
+    # available and cpu otherwise (the default is probed once and cached)
+    global _default_device
+    if device is not None:
+        return torch.device(device)
+    if _default_device is None:
+        if os.environ.get('PPO_DEVICE'):
+            _default_device = torch.device(os.environ['PPO_DEVICE'])
+        elif torch.cuda.is_available():
+            _default_device = torch.device('cuda:0')
+        else:
+            _default_device = torch.device('cpu')
+    return _default_device
+
+
+def device_name(device):
+    # printable name of a torch device, e.g. for the training script's banner (get_device stays silent,
+    # it runs in every worker and evaluator process that builds a network)
+    device = torch.device(device)
+    if device.type == 'cuda':
+        return str(torch.cuda.get_device_name(device))
+    return str(device)
+
+
+################################## Returns ##################################
+def _episode_ends(rewards, is_terminals, truncated, final_values):
+    # (not_ended, bootstrap) of (T, num_envs) tensors: the scans stop at terminal and at truncated
+    # steps, a truncated episode is bootstrapped from the value of its last state (final_values)
+    if truncated is None:
+        truncated = torch.zeros_like(is_terminals)
+    if final_values is None:
+        final_values = torch.zeros_like(rewards)
+    not_ended = (~(is_terminals | truncated)).to(rewards.dtype)
+    bootstrap = final_values * truncated.to(rewards.dtype)
+    return not_ended, bootstrap
+
+
+def discounted_returns(rewards, is_terminals, gamma, truncated=None, final_values=None):
+    # Monte Carlo returns: one reverse scan over the time axis of (T, num_envs) tensors
+    # (the scan runs on numpy copies, per-row torch ops cost several times more)
+    not_ended, bootstrap = _episode_ends(rewards, is_terminals, truncated, final_values)
+    rewards_np = rewards.detach().cpu().numpy()
+    not_ended, bootstrap = not_ended.cpu().numpy(), bootstrap.detach().cpu().numpy()
+    returns = np.empty_like(rewards_np)
+    discounted_reward = np.zeros_like(rewards_np[0])
+    for t in range(len(rewards_np) - 1, -1, -1):
+        discounted_reward = rewards_np[t] + gamma * (discounted_reward * not_ended[t] + bootstrap[t])
+        returns[t] = discounted_reward
+    return torch.from_numpy(returns).to(rewards.device)
+
+
+def gae_advantages(rewards, state_values, is_terminals, next_state_value, gamma, gae_lambda,
+                   truncated=None, final_values=None):
+    # Generalized Advantage Estimation over (T, num_envs) tensors, returns (advantages, value targets)
+    not_ended, bootstrap = _episode_ends(rewards, is_terminals, truncated, final_values)
+    next_values = torch.cat([state_values[1:], next_state_value.reshape(1, -1)], dim=0)
+    deltas = (rewards + gamma * (next_values * not_ended + bootstrap) - state_values).cpu().numpy()
+    discount = (gamma * gae_lambda * not_ended).cpu().numpy()
+    advantages = np.empty_like(deltas)
+    last_advantage = np.zeros_like(deltas[0])
+    for t in range(len(deltas) - 1, -1, -1):
+        last_advantage = deltas[t] + discount[t] * last_advantage
+        advantages[t] = last_advantage
+    advantages = torch.from_numpy(advantages).to(rewards.device)
+    return advantages, advantages + state_values
 
 
 ################################## PPO Policy ##################################
 class RolloutBuffer:
-    def __init__(self):
-        self.actions = []
-        self.states = []
-        self.logprobs = []
-        self.rewards = []
-        self.state_values = []
-        self.is_terminals = []
-    
+    """
+    Fixed-capacity rollout storage.
+
+    Every field is one preallocated tensor with a leading (time, env) shape;
+    add_state() and add_action() fill the observations and policy outputs of
+    the current row and add_reward() completes it and advances the cursor.
+    Episodes cut off by a time limit are marked in truncated, with the
+    critic's value of their last state in final_values (the env pool has
+    already reset them, so the next row belongs to a new episode).
+    update() reads zero-copy views of the filled rows, so no per-step
+    tensors are allocated.
+    """
+    def __init__(self, buffer_size, num_envs, state_dim, action_dim, has_continuous_action_space, device=None):
+        self.num_envs = num_envs
+        self.device = get_device(device)
+        self.capacity = -(-buffer_size // num_envs)  # rows of num_envs transitions
+        self.ptr = 0
+
+        shape = (self.capacity, num_envs)
+        self.states = torch.zeros(shape + (state_dim,), dtype=torch.float32, device=self.device)
+        if has_continuous_action_space:
+            self.actions = torch.zeros(shape + (action_dim,), dtype=torch.float32, device=self.device)
+        else:
+            self.actions = torch.zeros(shape, dtype=torch.int64, device=self.device)
+        self.logprobs = torch.zeros(shape, dtype=torch.float32, device=self.device)
+        self.rewards = torch.zeros(shape, dtype=torch.float32, device=self.device)
+        self.state_values = torch.zeros(shape, dtype=torch.float32, device=self.device)
+        self.is_terminals = torch.zeros(shape, dtype=torch.bool, device=self.device)
+        self.truncated = torch.zeros(shape, dtype=torch.bool, device=self.device)
+        self.final_values = torch.zeros(shape, dtype=torch.float32, device=self.device)
+
+    def add_state(self, state):
+        # copy the observations into the current row, the row is then the policy's input
+        if self.ptr >= self.capacity:
+            raise RuntimeError('rollout buffer is full (%d rows of %d envs), call PPO.update() first'
+                               % (self.capacity, self.num_envs))
+        row = self.states[self.ptr]
+        row.copy_(state.reshape(row.shape))
+        return row
+
+    def add_action(self, action, logprob, state_value):
+        n = self.num_envs
+        self.actions[self.ptr] = action.reshape(self.actions.shape[1:])
+        self.logprobs[self.ptr] = logprob.reshape(n)
+        self.state_values[self.ptr] = state_value.reshape(n)
+
+    def add_reward(self, reward, is_terminal, truncated=None, final_value=None):
+        n = self.num_envs
+        self.rewards[self.ptr] = torch.as_tensor(reward, dtype=torch.float32).reshape(n)
+        self.is_terminals[self.ptr] = torch.as_tensor(is_terminal, dtype=torch.bool).reshape(n)
+        if truncated is None:
+            self.truncated[self.ptr] = False
+        else:
+            self.truncated[self.ptr] = torch.as_tensor(truncated, dtype=torch.bool).reshape(n)
+        if final_value is None:
+            self.final_values[self.ptr] = 0.
+        else:
+            self.final_values[self.ptr] = torch.as_tensor(final_value, dtype=torch.float32).reshape(n)
+        self.ptr += 1
+
+    def __len__(self):
+        return self.ptr * self.num_envs
+
     def clear(self):
-        del self.actions[:]
-        del self.states[:]
-        del self.logprobs[:]
-        del self.rewards[:]
-        del self.state_values[:]
-        del self.is_terminals[:]
+        self.ptr = 0
+
+    def state_dict(self):
+        # the filled rows only (views, see checkpoint.snapshot for a copy)
+        fields = ['states', 'actions', 'logprobs', 'rewards', 'state_values', 'is_terminals', 'truncated',
+                  'final_values']
+        state = {name: getattr(self, name)[:self.ptr] for name in fields}
+        state['ptr'] = self.ptr
+        return state
+
+    def load_state_dict(self, state):
+        self.ptr = state['ptr']
+        for name in ['states', 'actions', 'logprobs', 'rewards', 'state_values', 'is_terminals', 'truncated',
+                     'final_values']:
+            getattr(self, name)[:self.ptr] = state[name].to(self.device)
 
 
 class ActorCritic(nn.Module):
-    def __init__(self, state_dim, action_dim, has_continuous_action_space, action_std_init):
+    def __init__(self, state_dim, action_dim, has_continuous_action_space, action_std_init, device=None):
         super(ActorCritic, self).__init__()
 
+        self.device = get_device(device)
+
         self.has_continuous_action_space = has_continuous_action_space
         
         if has_continuous_action_space:
             self.action_dim = action_dim
-            self.action_var = torch.full((action_dim,), action_std_init * action_std_init).to(device)
+            self.action_var = torch.full((action_dim,), action_std_init * action_std_init).to(self.device)
         # actor
         if has_continuous_action_space :
             self.actor = nn.Sequential(
@@ -74,7 +207,7 @@ class ActorCritic(nn.Module):
         
     def set_action_std(self, new_action_std):
         if self.has_continuous_action_space:
-            self.action_var = torch.full((self.action_dim,), new_action_std * new_action_std).to(device)
+            self.action_var = torch.full((self.action_dim,), new_action_std * new_action_std).to(self.device)
         else:
             print("--------------------------------------------------------------------------------------------")
             print("WARNING : Calling ActorCritic::set_action_std() on discrete action space policy")
@@ -84,14 +217,16 @@ class ActorCritic(nn.Module):
         raise NotImplementedError
     
     def act(self, state):
+        # called once per rollout step, the distribution's argument checks are skipped (the
+        # actor's softmax / fixed covariance are valid by construction) to save their per-call cost
 
         if self.has_continuous_action_space:
             action_mean = self.actor(state)
             cov_mat = torch.diag(self.action_var).unsqueeze(dim=0)
-            dist = MultivariateNormal(action_mean, cov_mat)
+            dist = MultivariateNormal(action_mean, cov_mat, validate_args=False)
         else:
             action_probs = self.actor(state)
-            dist = Categorical(action_probs)
+            dist = Categorical(action_probs, validate_args=False)
 
         action = dist.sample()
         action_logprob = dist.log_prob(action)
@@ -105,7 +240,7 @@ class ActorCritic(nn.Module):
             action_mean = self.actor(state)
             
             action_var = self.action_var.expand_as(action_mean)
-            cov_mat = torch.diag_embed(action_var).to(device)
+            cov_mat = torch.diag_embed(action_var).to(self.device)
             dist = MultivariateNormal(action_mean, cov_mat)
             
             # For Single Action Environments.
@@ -122,8 +257,12 @@ class ActorCritic(nn.Module):
 
 
 class PPO:
-    def __init__(self, state_dim, action_dim, lr_actor, lr_critic, gamma, K_epochs, eps_clip, has_continuous_action_space, action_std_init=0.6):
+    def __init__(self, state_dim, action_dim, lr_actor, lr_critic, gamma, K_epochs, eps_clip, has_continuous_action_space, action_std_init=0.6,
+                 buffer_size=4000, num_envs=1, advantage_estimator='mc', gae_lambda=0.95,
+                 minibatch_size=None, target_kl=None, device=None):
 
+        # device: e.g. 'cpu' or 'cuda:0', None = get_device() default
+        self.device = get_device(device)
         self.has_continuous_action_space = has_continuous_action_space
 
         if has_continuous_action_space:
@@ -132,16 +271,33 @@ class PPO:
         self.gamma = gamma
         self.eps_clip = eps_clip
         self.K_epochs = K_epochs
+
+        # 'mc': normalized Monte Carlo returns minus the critic's values (the original estimator)
+        # 'gae': Generalized Advantage Estimation with lambda = gae_lambda
+        if advantage_estimator not in ('mc', 'gae'):
+            raise NotImplementedError('advantage estimator [%s] is not found, please choose one '
+                                      'from (mc, gae)' % advantage_estimator)
+        self.advantage_estimator = advantage_estimator
+        self.gae_lambda = gae_lambda
+
+        # minibatch_size=None: every one of the K epochs is one full-batch gradient step (the original update)
+        # otherwise each epoch is a pass of shuffled minibatches; with target_kl set the update stops
+        # early once the approximate KL divergence from the old policy exceeds it
+        self.minibatch_size = minibatch_size
+        self.target_kl = target_kl
         
-        self.buffer = RolloutBuffer()
+        self.buffer = RolloutBuffer(buffer_size, num_envs, state_dim, action_dim, has_continuous_action_space,
+                                    self.device)
 
-        self.policy = ActorCritic(state_dim, action_dim, has_continuous_action_space, action_std_init).to(device)
+        self.policy = ActorCritic(state_dim, action_dim, has_continuous_action_space, action_std_init,
+                                  self.device).to(self.device)
         self.optimizer = torch.optim.Adam([
                         {'params': self.policy.actor.parameters(), 'lr': lr_actor},
                         {'params': self.policy.critic.parameters(), 'lr': lr_critic}
                     ])
 
-        self.policy_old = ActorCritic(state_dim, action_dim, has_continuous_action_space, action_std_init).to(device)
+        self.policy_old = ActorCritic(state_dim, action_dim, has_continuous_action_space, action_std_init,
+                                  self.device).to(self.device)
         self.policy_old.load_state_dict(self.policy.state_dict())
         
         self.MseLoss = nn.MSELoss()
@@ -173,77 +329,125 @@ class PPO:
         print("--------------------------------------------------------------------------------------------")
 
     def select_action(self, state):
+        # state is either a single observation or a batch of observations (one row per env);
+        # it is written straight into the next buffer row and the policy runs once on that row
+        state = torch.from_numpy(np.asarray(state, dtype=np.float32))
+        batched = state.dim() > 1
 
-        if self.has_continuous_action_space:
-            with torch.no_grad():
-                state = torch.FloatTensor(state).to(device)
-                action, action_logprob, state_val = self.policy_old.act(state)
+        with torch.no_grad():
+            state = self.buffer.add_state(state)
+            action, action_logprob, state_val = self.policy_old.act(state)
 
-            self.buffer.states.append(state)
-            self.buffer.actions.append(action)
-            self.buffer.logprobs.append(action_logprob)
-            self.buffer.state_values.append(state_val)
+        self.buffer.add_action(action, action_logprob, state_val)
 
-            return action.detach().cpu().numpy().flatten()
+        action = action.cpu().numpy()
+        if batched:
+            return action
+        if self.has_continuous_action_space:
+            return action.flatten()
+        return action.item()
+
+    def state_value(self, state):
+        # critic value of a batch of observations, e.g. the last states of truncated episodes
+        with torch.no_grad():
+            state = torch.from_numpy(np.asarray(state, dtype=np.float32)).to(self.device)
+            return self.policy_old.critic(state).reshape(-1).cpu().numpy()
+
+    def update(self, next_state=None):
+        # next_state: observations following the last buffer row, used by GAE to bootstrap
+        # unfinished episodes (without it they are treated as ending at the buffer boundary)
+        ptr = self.buffer.ptr
+        buffer_rewards = self.buffer.rewards[:ptr]
+        buffer_terminals = self.buffer.is_terminals[:ptr]
+        buffer_truncated = self.buffer.truncated[:ptr]
+        buffer_final_values = self.buffer.final_values[:ptr]
+
+        # zero-copy views of the filled part of the buffer, flattened over (time, env)
+        num_samples = len(self.buffer)
+        old_states = self.buffer.states[:ptr].reshape(num_samples, -1)
+        old_actions = self.buffer.actions[:ptr].reshape((num_samples,) + self.buffer.actions.shape[2:])
+        old_logprobs = self.buffer.logprobs[:ptr].reshape(num_samples)
+        old_state_values = self.buffer.state_values[:ptr].reshape(num_samples)
+
+        if self.advantage_estimator == 'gae':
+            next_state_value = torch.zeros(self.buffer.num_envs, device=self.device)
+            if next_state is not None:
+                with torch.no_grad():
+                    next_state = torch.FloatTensor(next_state).to(self.device)
+                    next_state_value = self.policy_old.critic(next_state).reshape(-1)
+            advantages, returns = gae_advantages(buffer_rewards, self.buffer.state_values[:ptr], buffer_terminals,
+                                                 next_state_value, self.gamma, self.gae_lambda,
+                                                 buffer_truncated, buffer_final_values)
+            advantages, returns = advantages.reshape(-1), returns.reshape(-1)
+            advantages = (advantages - advantages.mean()) / (advantages.std() + 1e-7)
         else:
-            with torch.no_grad():
-                state = torch.FloatTensor(state).to(device)
-                action, action_logprob, state_val = self.policy_old.act(state)
-            
-            self.buffer.states.append(state)
-            self.buffer.actions.append(action)
-            self.buffer.logprobs.append(action_logprob)
-            self.buffer.state_values.append(state_val)
-
-            return action.item()
-
-    def update(self):
-        # Monte Carlo estimate of returns
-        rewards = []
-        discounted_reward = 0
-        for reward, is_terminal in zip(reversed(self.buffer.rewards), reversed(self.buffer.is_terminals)):
-            if is_terminal:
-                discounted_reward = 0
-            discounted_reward = reward + (self.gamma * discounted_reward)
-            rewards.insert(0, discounted_reward)
-            
-        # Normalizing the rewards
-        rewards = torch.tensor(rewards, dtype=torch.float32).to(device)
-        rewards = (rewards - rewards.mean()) / (rewards.std() + 1e-7)
+            # Monte Carlo estimate of returns (discounted per env)
+            # (cut at truncated steps without a bootstrap: the critic is fit to normalized returns here,
+            # so its values are not on the scale of the raw rewards)
+            returns = discounted_returns(buffer_rewards, buffer_terminals, self.gamma,
+                                         truncated=buffer_truncated).reshape(-1)
 
-        # convert list to tensor
-        old_states = torch.squeeze(torch.stack(self.buffer.states, dim=0)).detach().to(device)
-        old_actions = torch.squeeze(torch.stack(self.buffer.actions, dim=0)).detach().to(device)
-        old_logprobs = torch.squeeze(torch.stack(self.buffer.logprobs, dim=0)).detach().to(device)
-        old_state_values = torch.squeeze(torch.stack(self.buffer.state_values, dim=0)).detach().to(device)
+            # Normalizing the rewards
+            returns = (returns - returns.mean()) / (returns.std() + 1e-7)
 
-        # calculate advantages
-        advantages = rewards.detach() - old_state_values.detach()
+            # calculate advantages
+            advantages = returns.detach() - old_state_values.detach()
+
+        if self.minibatch_size is None:
+            batch_size = num_samples
+        else:
+            batch_size = min(self.minibatch_size, num_samples)
 
         # Optimize policy for K epochs
         for _ in range(self.K_epochs):
 
-            # Evaluating old actions and values
-            logprobs, state_values, dist_entropy = self.policy.evaluate(old_states, old_actions)
-
-            # match state_values tensor dimensions with rewards tensor
-            state_values = torch.squeeze(state_values)
-            
-            # Finding the ratio (pi_theta / pi_theta__old)
-            ratios = torch.exp(logprobs - old_logprobs.detach())
-
-            # Finding Surrogate Loss  
-            surr1 = ratios * advantages
-            surr2 = torch.clamp(ratios, 1-self.eps_clip, 1+self.eps_clip) * advantages
+            if batch_size < num_samples:
+                indices = torch.randperm(num_samples, device=self.device)
+            else:
+                indices = None
+
+            early_stop = False
+            for start in range(0, num_samples, batch_size):
+                if indices is None:
+                    mb_states, mb_actions, mb_logprobs = old_states, old_actions, old_logprobs
+                    mb_advantages, mb_returns = advantages, returns
+                else:
+                    mb = indices[start:start + batch_size]
+                    mb_states, mb_actions, mb_logprobs = old_states[mb], old_actions[mb], old_logprobs[mb]
+                    mb_advantages, mb_returns = advantages[mb], returns[mb]
+
+                # Evaluating old actions and values
+                logprobs, state_values, dist_entropy = self.policy.evaluate(mb_states, mb_actions)
+
+                # match state_values tensor dimensions with returns tensor
+                state_values = state_values.reshape(-1)
+
+                # Finding the ratio (pi_theta / pi_theta__old)
+                log_ratios = logprobs - mb_logprobs.detach()
+                ratios = torch.exp(log_ratios)
+
+                if self.target_kl is not None:
+                    with torch.no_grad():
+                        approx_kl = ((ratios - 1) - log_ratios).mean().item()
+                    if approx_kl > self.target_kl:
+                        early_stop = True
+                        break
+
+                # Finding Surrogate Loss
+                surr1 = ratios * mb_advantages
+                surr2 = torch.clamp(ratios, 1-self.eps_clip, 1+self.eps_clip) * mb_advantages
+
+                # final loss of clipped objective PPO
+                loss = -torch.min(surr1, surr2) + 0.5 * self.MseLoss(state_values, mb_returns) - 0.01 * dist_entropy
+
+                # take gradient step
+                self.optimizer.zero_grad()
+                loss.mean().backward()
+                self.optimizer.step()
+
+            if early_stop:
+                break
 
-            # final loss of clipped objective PPO
-            loss = -torch.min(surr1, surr2) + 0.5 * self.MseLoss(state_values, rewards) - 0.01 * dist_entropy
-            
-            # take gradient step
-            self.optimizer.zero_grad()
-            loss.mean().backward()
-            self.optimizer.step()
-            
         # Copy new weights into old policy
         self.policy_old.load_state_dict(self.policy.state_dict())
 
@@ -251,7 +455,31 @@ class PPO:
         self.buffer.clear()
     
     def save(self, checkpoint_path):
-        torch.save(self.policy_old.state_dict(), checkpoint_path)
+        checkpoint.save_atomic(self.policy_old.state_dict(), checkpoint_path)
+
+    def training_state(self):
+        # everything update() and select_action() depend on, for an exact resume (see checkpoint.CheckpointWriter)
+        state = {'policy': self.policy.state_dict(),
+                 'policy_old': self.policy_old.state_dict(),
+                 'optimizer': self.optimizer.state_dict(),
+                 'buffer': self.buffer.state_dict()}
+        if self.has_continuous_action_space:
+            state['action_std'] = self.action_std
+        return state
+
+    def load_training_state(self, state):
+        if self.has_continuous_action_space:
+            self.set_action_std(state['action_std'])
+        self.policy.load_state_dict(state['policy'])
+        self.policy_old.load_state_dict(state['policy_old'])
+        self.optimizer.load_state_dict(state['optimizer'])
+        self.buffer.load_state_dict(state['buffer'])
+
+    def export_numpy(self, npz_path):
+        # actor weights for numpy_policy.NumpyPolicy (inference without torch)
+        action_std = self.action_std if self.has_continuous_action_space else None
+        return numpy_policy.export_actor(self.policy_old.state_dict(), npz_path,
+                                         self.has_continuous_action_space, action_std)
    
     def load(self, checkpoint_path):
         self.policy_old.load_state_dict(torch.load(checkpoint_path, map_location=lambda storage, loc: storage))
@@ -0,0 +1,364 @@
+import numpy as np
+
+import rocket_kernel
+
+
+class BatchRocket(object):
+    """
+    N rockets advanced in lock-step.
+
+    The state of every rocket is held as structure-of-arrays NumPy buffers
+    (one float64 array per state variable) and step(actions) advances all of
+    them with a handful of vectorized array operations instead of N Python
+    calls to Rocket.step.
+
+    Physics, crash and landing rules and the reward follow Rocket.step,
+    Rocket.check_crash, Rocket.check_landing_success and
+    Rocket.calculate_reward, so a policy trained on one runs unchanged on
+    the other. Rockets do not reset themselves; call reset(mask) for the
+    rows that are done (or have reached max_steps).
+
+    With use_kernel (default: when numba is installed) step() runs the
+    compiled per-rocket loop of rocket_kernel instead of the NumPy
+    expressions, which avoids the temporaries of every array operation.
+
+    integrator ('explicit', 'semi_implicit' or 'rk4') and substeps choose
+    how each control step of dt is integrated; with action_repeat each
+    action is held for that many steps (a rocket stops early once it is
+    done) and the summed reward is returned, so a policy decision covers a
+    longer stretch of flight.
+
+    """
+
+    def __init__(self, num_envs, max_steps, task='hover', seed=None, use_kernel=None,
+                 integrator='explicit', substeps=1, action_repeat=1):
+
+        self.num_envs = int(num_envs)
+        self.task = task
+
+        self.g = 9.8
+        self.H = 50  # rocket height (meters)
+        self.I = 1/12*self.H*self.H  # Moment of inertia
+        self.dt = 0.05
+        self.rho = 1 / (125/(self.g/2.0))**0.5  # same air resistance as Rocket.step
+
+        self.world_x_min = -300  # meters
+        self.world_x_max = 300
+        self.world_y_min = -30
+        self.world_y_max = 570
+
+        # target point
+        if self.task == 'hover':
+            self.target_x, self.target_y, self.target_r = 0, 200, 50
+        elif self.task == 'landing':
+            self.target_x, self.target_y, self.target_r = 0, self.H/2.0, 50
+
+        self.max_steps = max_steps
+        self.rng = np.random.default_rng(seed)
+        self.use_kernel = rocket_kernel.HAS_NUMBA if use_kernel is None else use_kernel
+        self.kernel_params = rocket_kernel.kernel_params(self)
+
+        self.integrator = integrator
+        self.integrator_id = rocket_kernel.integrator_id(integrator)
+        self.substeps = int(substeps)
+        self.action_repeat = int(action_repeat)
+
+        self.action_table = self.create_action_table()
+        self.state_dims = 8
+        self.action_dims = len(self.action_table)
+
+        n = self.num_envs
+        self.x = np.zeros(n)
+        self.y = np.zeros(n)
+        self.vx = np.zeros(n)
+        self.vy = np.zeros(n)
+        self.theta = np.zeros(n)
+        self.vtheta = np.zeros(n)
+        self.phi = np.zeros(n)
+        self.f = np.zeros(n)
+        self.step_id = np.zeros(n, dtype=np.int64)
+        self.already_landing = np.zeros(n, dtype=bool)
+        self.already_crash = np.zeros(n, dtype=bool)
+
+        self.state_arrays = ('x', 'y', 'vx', 'vy', 'theta', 'vtheta', 'phi', 'f', 'step_id',
+                             'already_landing', 'already_crash')
+
+        self.reward = np.zeros(n)
+        self.obs = np.zeros([n, self.state_dims], dtype=np.float32)
+
+        self.reset()
+
+    def create_action_table(self):
+        f0 = 0.2 * self.g  # thrust
+        f1 = 1.0 * self.g
+        f2 = 2 * self.g
+        vphi0 = 0  # Nozzle angular velocity
+        vphi1 = 30 / 180 * np.pi
+        vphi2 = -30 / 180 * np.pi
+
+        action_table = [[f0, vphi0], [f0, vphi1], [f0, vphi2],
+                        [f1, vphi0], [f1, vphi1], [f1, vphi2],
+                        [f2, vphi0], [f2, vphi1], [f2, vphi2]
+                        ]
+        return np.array(action_table, dtype=np.float64)
+
+    def get_random_action(self):
+        return self.rng.integers(0, len(self.action_table), size=self.num_envs)
+
+    def create_random_state(self, idx):
+
+        # predefined locations
+        x_range = self.world_x_max - self.world_x_min
+        y_range = self.world_y_max - self.world_y_min
+        xc = (self.world_x_max + self.world_x_min) / 2.0
+        yc = (self.world_y_max + self.world_y_min) / 2.0
+        n = len(idx)
+
+        if self.task == 'landing':
+            x = self.rng.uniform(xc - x_range / 4.0, xc + x_range / 4.0, size=n)
+            self.x[idx] = x
+            self.y[idx] = yc + 0.4*y_range
+            self.theta[idx] = np.where(x <= 0, -85 / 180 * np.pi, 85 / 180 * np.pi)
+            self.vy[idx] = -50
+
+        if self.task == 'hover':
+            self.x[idx] = xc
+            self.y[idx] = yc + 0.2 * y_range
+            self.theta[idx] = self.rng.uniform(-45, 45, size=n) / 180 * np.pi
+            self.vy[idx] = -10
+
+        self.vx[idx] = 0
+        self.vtheta[idx] = 0
+        self.phi[idx] = 0
+        self.f[idx] = 0
+
+    def reset(self, mask=None):
+        """
+        Re-draw a random initial state for the rockets selected by mask
+        (boolean array or index array; all rockets if None) and return
+        the observations of the whole batch.
+        """
+        if mask is None:
+            idx = np.arange(self.num_envs)
+        else:
+            idx = np.flatnonzero(mask) if np.asarray(mask).dtype == bool else np.asarray(mask)
+
+        if len(idx) > 0:
+            self.create_random_state(idx)
+            self.step_id[idx] = 0
+            self.already_landing[idx] = False
+            self.already_crash[idx] = False
+
+        return self.flatten()
+
+    def get_state(self):
+        """
+        Copy of everything step() and reset() depend on (state arrays,
+        flags and the random generator), for set_state().
+        """
+        state = {name: getattr(self, name).copy() for name in self.state_arrays}
+        state['rng'] = self.rng.bit_generator.state
+        return state
+
+    def set_state(self, state):
+        for name in self.state_arrays:
+            getattr(self, name)[:] = state[name]
+        self.rng.bit_generator.state = state['rng']
+        return self.flatten()
+
+    def check_crash(self):
+        if self.task == 'hover':
+            return (self.y <= self.H / 2.0) | (self.y >= self.world_y_max - self.H / 2.0)
+
+        elif self.task == 'landing':
+            v = np.sqrt(self.vx**2 + self.vy**2)
+            on_ground = self.y <= 0 + self.H / 2.0
+            crash = (v >= 15.0) | (np.abs(self.x) >= self.target_r) \
+                    | (np.abs(self.theta) >= 10/180*np.pi) | (np.abs(self.vtheta) >= 10/180*np.pi)
+            return (self.y >= self.world_y_max - self.H / 2.0) | (on_ground & crash)
+
+    def crash_causes(self):
+        """
+        The check_crash conditions of every rocket as a dict of boolean
+        arrays: 'ceiling' (reached the top of the world) and, on the
+        ground, 'speed', 'position', 'angle' and 'angular_rate' for the
+        landing task or 'ground' for hover. A crash can have several causes.
+        """
+        causes = {'ceiling': self.y >= self.world_y_max - self.H / 2.0}
+        if self.task == 'hover':
+            causes['ground'] = self.y <= self.H / 2.0
+
+        elif self.task == 'landing':
+            v = np.sqrt(self.vx**2 + self.vy**2)
+            on_ground = self.y <= 0 + self.H / 2.0
+            causes['speed'] = on_ground & (v >= 15.0)
+            causes['position'] = on_ground & (np.abs(self.x) >= self.target_r)
+            causes['angle'] = on_ground & (np.abs(self.theta) >= 10/180*np.pi)
+            causes['angular_rate'] = on_ground & (np.abs(self.vtheta) >= 10/180*np.pi)
+        return causes
+
+    def check_landing_success(self):
+        if self.task == 'hover':
+            return np.zeros(self.num_envs, dtype=bool)
+
+        elif self.task == 'landing':
+            v = np.sqrt(self.vx**2 + self.vy**2)
+            return (self.y <= 0 + self.H / 2.0) & (v < 15.0) & (np.abs(self.x) < self.target_r) \
+                   & (np.abs(self.theta) < 10/180*np.pi) & (np.abs(self.vtheta) < 10/180*np.pi)
+
+    def calculate_reward(self):
+
+        x_range = self.world_x_max - self.world_x_min
+        y_range = self.world_y_max - self.world_y_min
+
+        # dist between agent and target point
+        dist_x = np.abs(self.x - self.target_x)
+        dist_y = np.abs(self.y - self.target_y)
+        dist_norm = dist_x / x_range + dist_y / y_range
+
+        dist_reward = 0.1*(1.0 - dist_norm)
+
+        abs_theta = np.abs(self.theta)
+        pose_reward = np.where(abs_theta <= np.pi / 6.0,
+                               0.1, 0.1 * (1.0 - abs_theta / (0.5*np.pi)))
+
+        reward = dist_reward + pose_reward
+
+        if self.task == 'hover':
+            dist = np.sqrt(dist_x**2 + dist_y**2)
+            reward = np.where(dist <= 2*self.target_r, 0.25, reward)  # hit target
+            reward = np.where(dist <= 1*self.target_r, 0.5, reward)  # hit target
+            reward = np.where(abs_theta > 90 / 180 * np.pi, 0., reward)
+
+        if self.task == 'landing':
+            v = np.sqrt(self.vx**2 + self.vy**2)
+            remaining = self.max_steps - self.step_id
+            bonus = 5*np.exp(-1*v/10.)
+            reward = np.where(self.already_crash, (reward + bonus) * remaining, reward)
+            reward = np.where(self.already_landing, (1.0 + bonus) * remaining, reward)
+
+        return reward
+
+    def accelerations(self, vx, vy, theta, phi, f):
+        ft, fr = -f*np.sin(phi), f*np.cos(phi)
+        cos_theta, sin_theta = np.cos(theta), np.sin(theta)
+        fx = ft*cos_theta - fr*sin_theta
+        fy = ft*sin_theta + fr*cos_theta
+        return fx-self.rho*vx, fy-self.g-self.rho*vy, ft*self.H/2 / self.I
+
+    def integrate(self, f, vphi):
+        """
+        Advance every rocket by one control step dt in self.substeps
+        substeps of self.integrator (see rocket_kernel.integrate) and return
+        the new (x, y, vx, vy, theta, vtheta, phi, f) arrays.
+        """
+        x, y, vx, vy = self.x, self.y, self.vx, self.vy
+        theta, vtheta, phi = self.theta, self.vtheta, self.phi
+
+        # rockets that already landed are frozen in place
+        landed = self.already_landing
+        keep = None
+        if landed.any():
+            keep = ~landed
+            vx, vy, theta, vtheta = vx*keep, vy*keep, theta*keep, vtheta*keep
+            phi, f = phi*keep, f*keep
+
+        def acc(vx, vy, theta, phi):
+            ax, ay, atheta = self.accelerations(vx, vy, theta, phi, f)
+            if keep is not None:
+                ax, ay, atheta = ax*keep, ay*keep, atheta*keep
+            return ax, ay, atheta
+
+        dt = self.dt / self.substeps
+        for _ in range(self.substeps):
+            if self.integrator == 'explicit':
+                ax, ay, atheta = acc(vx, vy, theta, phi)
+                x = x + vx*dt + 0.5 * ax * (dt**2)
+                y = y + vy*dt + 0.5 * ay * (dt**2)
+                vx, vy = vx + ax * dt, vy + ay * dt
+                theta, vtheta = theta + vtheta*dt + 0.5 * atheta * (dt**2), vtheta + atheta * dt
+            elif self.integrator == 'semi_implicit':
+                ax, ay, atheta = acc(vx, vy, theta, phi)
+                vx, vy, vtheta = vx + ax * dt, vy + ay * dt, vtheta + atheta * dt
+                x, y, theta = x + vx * dt, y + vy * dt, theta + vtheta * dt
+            else:
+                # the nozzle keeps turning during the substep, evaluate it at the stage times
+                phi_mid = np.clip(phi + 0.5*dt*vphi, -20/180*3.1415926, 20/180*3.1415926)
+                phi_end = np.clip(phi + dt*vphi, -20/180*3.1415926, 20/180*3.1415926)
+                ax1, ay1, at1 = acc(vx, vy, theta, phi)
+                vx2, vy2, vt2 = vx + 0.5*dt*ax1, vy + 0.5*dt*ay1, vtheta + 0.5*dt*at1
+                ax2, ay2, at2 = acc(vx2, vy2, theta + 0.5*dt*vtheta, phi_mid)
+                vx3, vy3, vt3 = vx + 0.5*dt*ax2, vy + 0.5*dt*ay2, vtheta + 0.5*dt*at2
+                ax3, ay3, at3 = acc(vx3, vy3, theta + 0.5*dt*vt2, phi_mid)
+                vx4, vy4, vt4 = vx + dt*ax3, vy + dt*ay3, vtheta + dt*at3
+                ax4, ay4, at4 = acc(vx4, vy4, theta + dt*vt3, phi_end)
+                x = x + dt/6 * (vx + 2*vx2 + 2*vx3 + vx4)
+                y = y + dt/6 * (vy + 2*vy2 + 2*vy3 + vy4)
+                theta = theta + dt/6 * (vtheta + 2*vt2 + 2*vt3 + vt4)
+                vx = vx + dt/6 * (ax1 + 2*ax2 + 2*ax3 + ax4)
+                vy = vy + dt/6 * (ay1 + 2*ay2 + 2*ay3 + ay4)
+                vtheta = vtheta + dt/6 * (at1 + 2*at2 + 2*at3 + at4)
+            phi = np.clip(phi + dt*vphi, -20/180*3.1415926, 20/180*3.1415926)
+
+        return x, y, vx, vy, theta, vtheta, phi, f
+
+    def step(self, actions):
+
+        actions = np.asarray(actions, dtype=np.int64)
+        f = self.action_table[actions, 0]
+        vphi = self.action_table[actions, 1]
+
+        if self.use_kernel:
+            rocket_kernel.step_batch_kernel(self.x, self.y, self.vx, self.vy, self.theta, self.vtheta,
+                                            self.phi, self.f, self.step_id, self.already_landing,
+                                            self.already_crash, f, vphi, self.task == 'landing',
+                                            self.integrator_id, self.substeps, self.action_repeat,
+                                            self.kernel_params, self.reward)
+            done = self.already_crash | self.already_landing
+            return self.flatten(), self.reward.copy(), done, None
+
+        reward = None
+        for i in range(self.action_repeat):
+            if i == 0:
+                active = None
+            else:
+                # only rockets that are still flying take the repeated action
+                active = ~done & (self.step_id < self.max_steps)
+                if not active.any():
+                    break
+
+            state = self.integrate(f, vphi)
+            if active is None:
+                self.x, self.y, self.vx, self.vy, self.theta, self.vtheta, self.phi, self.f = state
+                self.step_id += 1
+            else:
+                for name, value in zip(('x', 'y', 'vx', 'vy', 'theta', 'vtheta', 'phi', 'f'), state):
+                    np.copyto(getattr(self, name), value, where=active)
+                self.step_id += active
+
+            self.already_landing = self.check_landing_success()
+            self.already_crash = self.check_crash()
+            step_reward = self.calculate_reward()
+            reward = step_reward if active is None else reward + step_reward*active
+
+            done = self.already_crash | self.already_landing
+
+        return self.flatten(), reward, done, None
+
+    def flatten(self):
+        """
+        Observations of the whole batch as an (N, 8) float32 array laid out
+        like Rocket.flatten. The array is reused: it is overwritten by the
+        next step()/reset() call.
+        """
+        obs = self.obs
+        obs[:, 0] = self.x
+        obs[:, 1] = self.y
+        obs[:, 2] = self.vx
+        obs[:, 3] = self.vy
+        obs[:, 4] = self.theta
+        obs[:, 5] = self.vtheta
+        obs[:, 6] = self.step_id
+        obs[:, 7] = self.phi
+        obs /= 100.
+        return obs
@@ -0,0 +1,105 @@
+import copy
+import os
+import queue
+import random
+import threading
+
+import numpy as np
+import torch
+
+
+################################## Snapshots ##################################
+def snapshot(obj):
+    # deep copy of a (nested) training state taken on the training thread: tensors are detached
+    # and cloned to the cpu, arrays copied, so later training steps cannot change what gets written
+    if torch.is_tensor(obj):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, np.ndarray):
+        return obj.copy()
+    if isinstance(obj, dict):
+        return {key: snapshot(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(value) for value in obj)
+    return copy.deepcopy(obj)
+
+
+def rng_state():
+    # state of every global random generator the training loop draws from
+    state = {'python': random.getstate(),
+             'numpy': np.random.get_state(),
+             'torch': torch.get_rng_state()}
+    if torch.cuda.is_available():
+        state['torch_cuda'] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if 'torch_cuda' in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['torch_cuda'])
+
+
+################################## Writing ##################################
+def save_atomic(obj, path):
+    # write to a temporary file next to path and rename it over path, a crash mid-write
+    # leaves the previous file intact
+    tmp_path = path + '.tmp'
+    torch.save(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    return torch.load(path, map_location='cpu', weights_only=False)
+
+
+class CheckpointWriter(object):
+    """
+    Writes checkpoints on a background thread.
+
+    save(path, state) takes a snapshot() of the state on the calling
+    thread (a fast in-memory copy) and returns; the thread serializes it
+    with save_atomic. Saves of the same path are written in order.
+    wait() blocks until everything queued is on disk, close() also stops
+    the thread. An error of the writer thread is raised by the next
+    save(), wait() or close().
+
+    """
+
+    def __init__(self, max_queue=4):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            job = self.queue.get()
+            try:
+                if job is None:
+                    break
+                path, state = job
+                save_atomic(state, path)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def save(self, path, state):
+        self._raise_error()
+        self.queue.put((path, snapshot(state)))
+
+    def wait(self):
+        self.queue.join()
+        self._raise_error()
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        self._raise_error()
@@ -0,0 +1,159 @@
+import multiprocessing as mp
+
+import numpy as np
+
+import rocket_kernel
+from batch_rocket import BatchRocket
+
+
+def _worker(rank, pipe, shared, envs_per_worker, max_steps, task, seed, integrator, substeps, action_repeat):
+
+    lo, hi = rank * envs_per_worker, (rank + 1) * envs_per_worker
+    obs, actions, rewards, dones, truncated, landed, lengths, touchdown_speed, final_obs = \
+        [buf[lo:hi] for buf in _as_arrays(shared)]
+
+    env = BatchRocket(envs_per_worker, max_steps, task=task,
+                      seed=None if seed is None else seed + rank,
+                      integrator=integrator, substeps=substeps, action_repeat=action_repeat)
+
+    while True:
+        cmd = pipe.recv()
+        if cmd == 'step':
+            step_obs, reward, done, _ = env.step(actions)
+            timeout = (env.step_id >= max_steps) & ~done
+            rewards[:] = reward
+            dones[:] = done
+            truncated[:] = timeout
+            # outcome of the episodes that just ended, read before the reset overwrites it
+            final_obs[:] = step_obs
+            landed[:] = env.already_landing
+            lengths[:] = env.step_id
+            touchdown_speed[:] = np.where(env.y <= env.H / 2.0, np.sqrt(env.vx**2 + env.vy**2), np.nan)
+            # auto-reset finished rockets, obs then holds the first state of their next episode
+            obs[:] = env.reset(done | timeout)
+            pipe.send(None)
+        elif cmd == 'reset':
+            obs[:] = env.reset()
+            pipe.send(None)
+        elif cmd == 'get_state':
+            pipe.send(env.get_state())
+        elif cmd[0] == 'set_state':
+            obs[:] = env.set_state(cmd[1])
+            pipe.send(None)
+        elif cmd == 'close':
+            pipe.close()
+            break
+
+
+def _as_arrays(shared):
+    obs, actions, rewards, dones, truncated, landed, lengths, touchdown_speed, final_obs = shared
+    return (np.frombuffer(obs, dtype=np.float32).reshape(-1, 8),
+            np.frombuffer(actions, dtype=np.int64),
+            np.frombuffer(rewards, dtype=np.float64),
+            np.frombuffer(dones, dtype=np.bool_),
+            np.frombuffer(truncated, dtype=np.bool_),
+            np.frombuffer(landed, dtype=np.bool_),
+            np.frombuffer(lengths, dtype=np.int64),
+            np.frombuffer(touchdown_speed, dtype=np.float64),
+            np.frombuffer(final_obs, dtype=np.float32).reshape(-1, 8))
+
+
+class RocketEnvPool(object):
+    """
+    Rocket environments simulated in K subprocesses.
+
+    Every worker owns a BatchRocket of envs_per_worker rockets. Observations,
+    actions, rewards and done flags live in shared memory, so a step only
+    sends a one-word command down each worker's pipe; the workers then step
+    their slice of the batch in parallel.
+
+    Rockets that crash, land or reach max_steps are reset automatically:
+    after step() the returned observation of such a rocket is the first
+    observation of its next episode. dones marks crash/landing (the terminal
+    flag PPO stores), truncated marks episodes cut off at max_steps.
+    For those rockets, landed, episode_length and touchdown_speed (NaN
+    unless the episode ended on the ground) describe the episode that
+    ended and final_obs holds its last observation (before the reset),
+    e.g. to bootstrap the return of a truncated episode; they are valid
+    until the next step().
+
+    integrator, substeps and action_repeat are passed on to BatchRocket;
+    with action_repeat > 1 every step() advances each rocket by up to that
+    many physics steps and reports the summed reward.
+
+    """
+
+    def __init__(self, num_workers, envs_per_worker=1, max_steps=1000, task='landing',
+                 seed=None, start_method=None, integrator='explicit', substeps=1, action_repeat=1):
+
+        rocket_kernel.integrator_id(integrator)  # fail here rather than in the workers
+
+        self.num_workers = int(num_workers)
+        self.envs_per_worker = int(envs_per_worker)
+        self.num_envs = self.num_workers * self.envs_per_worker
+        self.state_dims = 8
+
+        ctx = mp.get_context(start_method)
+        n = self.num_envs
+        self._shared = (ctx.RawArray('f', n * self.state_dims),   # float32
+                        ctx.RawArray('q', n),                     # int64
+                        ctx.RawArray('d', n),                     # float64
+                        ctx.RawArray('b', n),                     # bool
+                        ctx.RawArray('b', n),
+                        ctx.RawArray('b', n),
+                        ctx.RawArray('q', n),
+                        ctx.RawArray('d', n),
+                        ctx.RawArray('f', n * self.state_dims))
+        (self.obs, self.actions, self.rewards, self.dones, self.truncated,
+         self.landed, self.episode_length, self.touchdown_speed, self.final_obs) = _as_arrays(self._shared)
+
+        self.pipes, self.processes = [], []
+        for rank in range(self.num_workers):
+            parent_pipe, child_pipe = ctx.Pipe()
+            p = ctx.Process(target=_worker, daemon=True,
+                            args=(rank, child_pipe, self._shared, self.envs_per_worker,
+                                  max_steps, task, seed, integrator, substeps, action_repeat))
+            p.start()
+            child_pipe.close()
+            self.pipes.append(parent_pipe)
+            self.processes.append(p)
+
+        self.closed = False
+
+    def _broadcast(self, cmd):
+        for pipe in self.pipes:
+            pipe.send(cmd)
+        for pipe in self.pipes:
+            pipe.recv()
+
+    def reset(self):
+        self._broadcast('reset')
+        return self.obs.copy()
+
+    def step(self, actions):
+        self.actions[:] = actions
+        self._broadcast('step')
+        return self.obs.copy(), self.rewards.copy(), self.dones.copy(), self.truncated.copy()
+
+    def get_state(self):
+        # simulator state of every worker (BatchRocket.get_state), e.g. for a training checkpoint
+        for pipe in self.pipes:
+            pipe.send('get_state')
+        return [pipe.recv() for pipe in self.pipes]
+
+    def set_state(self, states):
+        # restore the states of get_state(), returns the observations they correspond to
+        for pipe, state in zip(self.pipes, states):
+            pipe.send(('set_state', state))
+        for pipe in self.pipes:
+            pipe.recv()
+        return self.obs.copy()
+
+    def close(self):
+        if self.closed:
+            return
+        for pipe in self.pipes:
+            pipe.send('close')
+        for p in self.processes:
+            p.join()
+        self.closed = True
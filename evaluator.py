@@ -0,0 +1,270 @@
+import multiprocessing as mp
+import os
+import shutil
+
+import numpy as np
+
+from batch_rocket import BatchRocket
+from numpy_policy import NumpyPolicy
+
+
+################################## Episodes ##################################
+def run_episodes(policy, num_episodes, task='landing', max_steps=1000, num_envs=256, seed=0,
+                 deterministic=False, **rocket_kwargs):
+    """
+    Run num_episodes seeded episodes of a policy on one BatchRocket.
+
+    policy is a NumpyPolicy or the path of an exported .npz. num_envs
+    rockets fly at once and a finished rocket starts the next episode
+    until all of them have been started. Returns a dict of per-episode
+    arrays: reward, length, landed, crashed, timeout, on_ground,
+    touchdown_speed / touchdown_vx / touchdown_vy (NaN when the episode
+    did not end on the ground) and one 'crash_<cause>' flag per
+    BatchRocket.crash_causes entry.
+    """
+    if isinstance(policy, str):
+        policy = NumpyPolicy(policy, seed=seed)
+
+    num_envs = max(1, min(num_envs, num_episodes))
+    env = BatchRocket(num_envs, max_steps, task=task, seed=seed, **rocket_kwargs)
+
+    results = {'reward': np.zeros(num_episodes),
+               'length': np.zeros(num_episodes, dtype=np.int64),
+               'landed': np.zeros(num_episodes, dtype=bool),
+               'crashed': np.zeros(num_episodes, dtype=bool),
+               'timeout': np.zeros(num_episodes, dtype=bool),
+               'on_ground': np.zeros(num_episodes, dtype=bool),
+               'touchdown_speed': np.full(num_episodes, np.nan),
+               'touchdown_vx': np.full(num_episodes, np.nan),
+               'touchdown_vy': np.full(num_episodes, np.nan)}
+    for cause in env.crash_causes():
+        results['crash_' + cause] = np.zeros(num_episodes, dtype=bool)
+
+    # episode run by every rocket, -1 once no episodes are left to start
+    episode_id = np.arange(num_envs)
+    started, finished = num_envs, 0
+    ep_reward = np.zeros(num_envs)
+
+    obs = env.reset()
+    while finished < num_episodes:
+        action = policy.select_action(obs, deterministic=deterministic)
+        obs, reward, done, _ = env.step(action)
+        ep_reward += reward
+
+        timeout = (env.step_id >= max_steps) & ~done
+        end = (done | timeout) & (episode_id >= 0)
+        if not end.any():
+            continue
+
+        idx = np.flatnonzero(end)
+        ep = episode_id[idx]
+        on_ground = env.y[idx] <= env.H / 2.0
+        vx, vy = env.vx[idx], env.vy[idx]
+
+        results['reward'][ep] = ep_reward[idx]
+        results['length'][ep] = env.step_id[idx]
+        results['landed'][ep] = env.already_landing[idx]
+        results['crashed'][ep] = env.already_crash[idx]
+        results['timeout'][ep] = timeout[idx]
+        results['on_ground'][ep] = on_ground
+        results['touchdown_speed'][ep] = np.where(on_ground, np.sqrt(vx**2 + vy**2), np.nan)
+        results['touchdown_vx'][ep] = np.where(on_ground, vx, np.nan)
+        results['touchdown_vy'][ep] = np.where(on_ground, vy, np.nan)
+        for cause, flag in env.crash_causes().items():
+            results['crash_' + cause][ep] = flag[idx] & env.already_crash[idx]
+        finished += len(idx)
+
+        # hand out the remaining episodes, rockets without one keep flying unrecorded
+        num_new = min(len(idx), num_episodes - started)
+        episode_id[idx[:num_new]] = np.arange(started, started + num_new)
+        episode_id[idx[num_new:]] = -1
+        started += num_new
+        ep_reward[idx] = 0.
+
+        obs = env.reset(done | timeout)
+
+    return results
+
+
+def evaluate(policy_path, num_episodes=1000, task='landing', max_steps=1000, num_workers=1,
+             envs_per_worker=256, seed=0, deterministic=False, start_method=None, **rocket_kwargs):
+    """
+    Evaluate an exported policy (.npz) on num_episodes seeded episodes,
+    split over num_workers processes (worker k uses seed + k, as
+    RocketEnvPool does). Returns the summary of summarize().
+    """
+    num_workers = max(1, min(int(num_workers), num_episodes))
+    counts = [len(chunk) for chunk in np.array_split(np.arange(num_episodes), num_workers)]
+    jobs = [(policy_path, n, task, max_steps, envs_per_worker, seed + rank, deterministic)
+            for rank, n in enumerate(counts)]
+
+    if num_workers == 1:
+        parts = [run_episodes(*jobs[0], **rocket_kwargs)]
+    else:
+        ctx = mp.get_context(start_method)
+        with ctx.Pool(num_workers) as pool:
+            parts = pool.starmap(_run_job, [(job, rocket_kwargs) for job in jobs])
+
+    results = {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+    return summarize(results)
+
+
+def _run_job(job, rocket_kwargs):
+    return run_episodes(*job, **rocket_kwargs)
+
+
+################################## Summary ##################################
+def wilson_interval(successes, n, z=1.96):
+    # 95% (z=1.96) Wilson score interval of a binomial proportion
+    if n == 0:
+        return 0., 0.
+    p = successes / n
+    center = (p + z**2 / (2*n)) / (1 + z**2 / n)
+    half = z * np.sqrt(p*(1 - p) / n + z**2 / (4*n**2)) / (1 + z**2 / n)
+    return center - half, center + half
+
+
+def summarize(results):
+    """
+    Aggregate the per-episode arrays of run_episodes: success rate with its
+    95% Wilson interval, crash / timeout rates, the fraction of episodes
+    ending in each crash cause, touchdown velocity and episode length
+    percentiles and the episode reward. The per-episode arrays are kept
+    under 'episodes'.
+    """
+    n = len(results['reward'])
+    successes = int(results['landed'].sum())
+    percentiles = [5, 25, 50, 75, 95]
+
+    speed = results['touchdown_speed'][results['on_ground']]
+    if len(speed) > 0:
+        touchdown = dict(zip(['p%d' % q for q in percentiles], np.percentile(speed, percentiles)))
+        touchdown['mean'] = float(speed.mean())
+        touchdown['mean_vx'] = float(np.nanmean(results['touchdown_vx']))
+        touchdown['mean_vy'] = float(np.nanmean(results['touchdown_vy']))
+        touchdown['histogram'] = np.histogram(speed, bins=[0, 5, 10, 15, 20, 30, 50, np.inf])
+    else:
+        touchdown = {}
+
+    return {'episodes': results,
+            'num_episodes': n,
+            'success_rate': successes / n,
+            'success_ci95': wilson_interval(successes, n),
+            'crash_rate': float(results['crashed'].mean()),
+            'timeout_rate': float(results['timeout'].mean()),
+            'crash_causes': {key[len('crash_'):]: float(results[key].mean())
+                             for key in results if key.startswith('crash_')},
+            'touchdown_speed': touchdown,
+            'episode_length': dict(zip(['p%d' % q for q in percentiles],
+                                       np.percentile(results['length'], percentiles))),
+            'reward_mean': float(results['reward'].mean()),
+            'reward_std': float(results['reward'].std())}
+
+
+def format_report(summary):
+    lo, hi = summary['success_ci95']
+    lines = ["episodes : {}".format(summary['num_episodes']),
+             "success rate : {:.2%} (95% CI {:.2%} - {:.2%})".format(summary['success_rate'], lo, hi),
+             "crash rate : {:.2%} \t timeout rate : {:.2%}".format(summary['crash_rate'], summary['timeout_rate']),
+             "crash causes (share of episodes, causes can overlap) : " + ', '.join(
+                 '{} {:.2%}'.format(cause, rate) for cause, rate in summary['crash_causes'].items())]
+
+    touchdown = summary['touchdown_speed']
+    if touchdown:
+        lines.append("touchdown speed (m/s) : mean {:.2f}, p5 {:.2f}, p50 {:.2f}, p95 {:.2f} "
+                     "(mean vx {:.2f}, vy {:.2f})".format(touchdown['mean'], touchdown['p5'], touchdown['p50'],
+                                                          touchdown['p95'], touchdown['mean_vx'],
+                                                          touchdown['mean_vy']))
+        counts, edges = touchdown['histogram']
+        lines.append("touchdown speed histogram : " + ', '.join(
+            '[{:g}, {:g}) {}'.format(a, b, c) for a, b, c in zip(edges[:-1], edges[1:], counts)))
+
+    lengths = summary['episode_length']
+    lines.append("episode length : " + ', '.join('{} {:g}'.format(key, value) for key, value in lengths.items()))
+    lines.append("reward : {:.2f} +- {:.2f}".format(summary['reward_mean'], summary['reward_std']))
+    return '\n'.join(lines)
+
+
+################################## Checkpoint evaluation ##################################
+METRICS_HEADER = ('timestep,success_rate,success_ci_low,success_ci_high,crash_rate,timeout_rate,'
+                  'touchdown_speed_p50,touchdown_speed_p95,length_p50,reward_mean,best\n')
+
+
+def _copy_atomic(src, dst):
+    tmp = dst + '.tmp'
+    shutil.copyfile(src, tmp)
+    os.replace(tmp, dst)
+
+
+def _eval_loop(jobs, metrics_path, best_path, num_episodes, task, max_steps, num_envs, seed, rocket_kwargs):
+    # a resumed run keeps the best score of the rows already in the metrics file
+    best = None
+    with open(metrics_path) as f:
+        for line in f.readlines()[1:]:
+            parts = line.split(',')
+            score = (float(parts[1]), float(parts[9]))
+            best = score if best is None else max(best, score)
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        timestep, checkpoint_path, npz_path = job
+
+        results = run_episodes(npz_path, num_episodes, task=task, max_steps=max_steps, num_envs=num_envs,
+                               seed=seed, **rocket_kwargs)
+        summary = summarize(results)
+
+        # best so far: highest success rate, ties broken by the mean episode reward
+        score = (summary['success_rate'], summary['reward_mean'])
+        is_best = best is None or score > best
+        if is_best:
+            best = score
+            if best_path is not None:
+                _copy_atomic(checkpoint_path, best_path)
+                _copy_atomic(npz_path, os.path.splitext(best_path)[0] + '.npz')
+
+        touchdown = summary['touchdown_speed']
+        lo, hi = summary['success_ci95']
+        with open(metrics_path, 'a') as f:
+            f.write('{},{:.4f},{:.4f},{:.4f},{:.4f},{:.4f},{:.3f},{:.3f},{:g},{:.4f},{}\n'.format(
+                timestep, summary['success_rate'], lo, hi, summary['crash_rate'], summary['timeout_rate'],
+                touchdown.get('p50', np.nan), touchdown.get('p95', np.nan), summary['episode_length']['p50'],
+                summary['reward_mean'], int(is_best)))
+
+
+class CheckpointEvaluator(object):
+    """
+    Evaluates training checkpoints in a separate process.
+
+    submit() queues a saved checkpoint (its .pth and the exported .npz of
+    its actor) and returns immediately; the process runs the same seeded
+    suite of num_episodes episodes on every checkpoint (run_episodes,
+    NumPy inference, no torch) and appends one row per checkpoint to the
+    CSV at metrics_path. The best checkpoint so far (success rate, then
+    mean reward) is copied to best_path together with its .npz. stop()
+    waits for the queued checkpoints and joins the process.
+
+    """
+
+    def __init__(self, metrics_path, best_path=None, num_episodes=1000, task='landing', max_steps=1000,
+                 num_envs=250, seed=0, **rocket_kwargs):
+        ctx = mp.get_context()
+        self.metrics_path = metrics_path
+        self.best_path = best_path
+
+        if not os.path.exists(metrics_path):
+            with open(metrics_path, 'w') as f:
+                f.write(METRICS_HEADER)
+
+        self.jobs = ctx.Queue()
+        self.process = ctx.Process(target=_eval_loop, daemon=True,
+                                   args=(self.jobs, metrics_path, best_path, num_episodes, task, max_steps,
+                                         num_envs, seed, rocket_kwargs))
+        self.process.start()
+
+    def submit(self, timestep, checkpoint_path, npz_path):
+        self.jobs.put((timestep, checkpoint_path, npz_path))
+
+    def stop(self):
+        self.jobs.put(None)
+        self.process.join()
@@ -1,19 +1,45 @@
+import os
+import sys
+
 import torch
 import torch.nn as nn
 from torch.distributions import MultivariateNormal
 from torch.distributions import Categorical
 
+# numpy_policy is shared with the repository root, one copy; appended, so this folder's
+# own modules still take precedence
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy_policy
+
 ################################## set device ##################################
-print("============================================================================================")
-# set device to cpu or cuda
-device = torch.device('cpu')
-if(torch.cuda.is_available()): 
-    device = torch.device('cuda:0') 
-    torch.cuda.empty_cache()
-    print("Device set to : " + str(torch.cuda.get_device_name(device)))
-else:
-    print("Device set to : cpu")
-print("============================================================================================")
+# the device is resolved on first use (not at import), so importing this module stays cheap
+# and side-effect free in env workers and evaluation scripts
+_default_device = None
+
+
+def get_device(device=None):
+    # torch device for the PPO classes: the given device, else $PPO_DEVICE, else cuda:0 when
+    # available and cpu otherwise (the default is probed once and cached)
+    global _default_device
+    if device is not None:
+        return torch.device(device)
+    if _default_device is None:
+        if os.environ.get('PPO_DEVICE'):
+            _default_device = torch.device(os.environ['PPO_DEVICE'])
+        elif torch.cuda.is_available():
+            _default_device = torch.device('cuda:0')
+        else:
+            _default_device = torch.device('cpu')
+    return _default_device
+
+
+def device_name(device):
+    # printable name of a torch device, e.g. for the training script's banner (get_device stays silent,
+    # it runs in every worker and evaluator process that builds a network)
+    device = torch.device(device)
+    if device.type == 'cuda':
+        return str(torch.cuda.get_device_name(device))
+    return str(device)
 
 
 ################################## PPO Policy ##################################
@@ -36,14 +62,16 @@ class RolloutBuffer:
 
 
 class ActorCritic(nn.Module):
-    def __init__(self, state_dim, action_dim, has_continuous_action_space, action_std_init):
+    def __init__(self, state_dim, action_dim, has_continuous_action_space, action_std_init, device=None):
         super(ActorCritic, self).__init__()
 
+        self.device = get_device(device)
+
         self.has_continuous_action_space = has_continuous_action_space
         
         if has_continuous_action_space:
             self.action_dim = action_dim
-            self.action_var = torch.full((action_dim,), action_std_init * action_std_init).to(device)
+            self.action_var = torch.full((action_dim,), action_std_init * action_std_init).to(self.device)
         # actor
         if has_continuous_action_space :
             self.actor = nn.Sequential(
@@ -74,7 +102,7 @@ class ActorCritic(nn.Module):
         
     def set_action_std(self, new_action_std):
         if self.has_continuous_action_space:
-            self.action_var = torch.full((self.action_dim,), new_action_std * new_action_std).to(device)
+            self.action_var = torch.full((self.action_dim,), new_action_std * new_action_std).to(self.device)
         else:
             print("--------------------------------------------------------------------------------------------")
             print("WARNING : Calling ActorCritic::set_action_std() on discrete action space policy")
@@ -105,7 +133,7 @@ class ActorCritic(nn.Module):
             action_mean = self.actor(state)
             
             action_var = self.action_var.expand_as(action_mean)
-            cov_mat = torch.diag_embed(action_var).to(device)
+            cov_mat = torch.diag_embed(action_var).to(self.device)
             dist = MultivariateNormal(action_mean, cov_mat)
             
             # For Single Action Environments.
@@ -122,8 +150,11 @@ class ActorCritic(nn.Module):
 
 
 class PPO:
-    def __init__(self, state_dim, action_dim, lr_actor, lr_critic, gamma, K_epochs, eps_clip, has_continuous_action_space, action_std_init=0.6):
+    def __init__(self, state_dim, action_dim, lr_actor, lr_critic, gamma, K_epochs, eps_clip, has_continuous_action_space, action_std_init=0.6,
+                 device=None):
 
+        # device: e.g. 'cpu' or 'cuda:0', None = get_device() default
+        self.device = get_device(device)
         self.has_continuous_action_space = has_continuous_action_space
 
         if has_continuous_action_space:
@@ -135,13 +166,15 @@ class PPO:
         
         self.buffer = RolloutBuffer()
 
-        self.policy = ActorCritic(state_dim, action_dim, has_continuous_action_space, action_std_init).to(device)
+        self.policy = ActorCritic(state_dim, action_dim, has_continuous_action_space, action_std_init,
+                                  self.device).to(self.device)
         self.optimizer = torch.optim.Adam([
                         {'params': self.policy.actor.parameters(), 'lr': lr_actor},
                         {'params': self.policy.critic.parameters(), 'lr': lr_critic}
                     ])
 
-        self.policy_old = ActorCritic(state_dim, action_dim, has_continuous_action_space, action_std_init).to(device)
+        self.policy_old = ActorCritic(state_dim, action_dim, has_continuous_action_space, action_std_init,
+                                  self.device).to(self.device)
         self.policy_old.load_state_dict(self.policy.state_dict())
         
         self.MseLoss = nn.MSELoss()
@@ -176,7 +209,7 @@ class PPO:
 
         if self.has_continuous_action_space:
             with torch.no_grad():
-                state = torch.FloatTensor(state).to(device)
+                state = torch.FloatTensor(state).to(self.device)
                 action, action_logprob, state_val = self.policy_old.act(state)
 
             self.buffer.states.append(state)
@@ -187,7 +220,7 @@ class PPO:
             return action.detach().cpu().numpy().flatten()
         else:
             with torch.no_grad():
-                state = torch.FloatTensor(state).to(device)
+                state = torch.FloatTensor(state).to(self.device)
                 action, action_logprob, state_val = self.policy_old.act(state)
             
             self.buffer.states.append(state)
@@ -208,14 +241,14 @@ class PPO:
             rewards.insert(0, discounted_reward)
             
         # Normalizing the rewards
-        rewards = torch.tensor(rewards, dtype=torch.float32).to(device)
+        rewards = torch.tensor(rewards, dtype=torch.float32).to(self.device)
         rewards = (rewards - rewards.mean()) / (rewards.std() + 1e-7)
 
         # convert list to tensor
-        old_states = torch.squeeze(torch.stack(self.buffer.states, dim=0)).detach().to(device)
-        old_actions = torch.squeeze(torch.stack(self.buffer.actions, dim=0)).detach().to(device)
-        old_logprobs = torch.squeeze(torch.stack(self.buffer.logprobs, dim=0)).detach().to(device)
-        old_state_values = torch.squeeze(torch.stack(self.buffer.state_values, dim=0)).detach().to(device)
+        old_states = torch.squeeze(torch.stack(self.buffer.states, dim=0)).detach().to(self.device)
+        old_actions = torch.squeeze(torch.stack(self.buffer.actions, dim=0)).detach().to(self.device)
+        old_logprobs = torch.squeeze(torch.stack(self.buffer.logprobs, dim=0)).detach().to(self.device)
+        old_state_values = torch.squeeze(torch.stack(self.buffer.state_values, dim=0)).detach().to(self.device)
 
         # calculate advantages
         advantages = rewards.detach() - old_state_values.detach()
@@ -252,6 +285,12 @@ class PPO:
     
     def save(self, checkpoint_path):
         torch.save(self.policy_old.state_dict(), checkpoint_path)
+
+    def export_numpy(self, npz_path):
+        # actor weights for numpy_policy.NumpyPolicy (inference without torch)
+        action_std = self.action_std if self.has_continuous_action_space else None
+        return numpy_policy.export_actor(self.policy_old.state_dict(), npz_path,
+                                         self.has_continuous_action_space, action_std)
    
     def load(self, checkpoint_path):
         self.policy_old.load_state_dict(torch.load(checkpoint_path, map_location=lambda storage, loc: storage))
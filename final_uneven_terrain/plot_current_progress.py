@@ -2,6 +2,8 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 
+import utils
+
 # Read the training log
 df = pd.read_csv('PPO_logs/RocketLanding/PPO_RocketLanding_log_0.csv')
 
@@ -22,8 +24,8 @@ plt.plot(df['timestep'], df['reward'], alpha=0.3, color='blue', label='Raw Rewar
 # Calculate moving average
 window = 20
 if len(df) >= window:
-    moving_avg = df['reward'].rolling(window=window).mean()
-    plt.plot(df['timestep'], moving_avg, color='red', linewidth=2, label=f'Moving Avg ({window} episodes)')
+    moving_avg, _ = utils.windowed_curve(df['reward'].values, window)
+    plt.plot(df['timestep'].values[window-1:], moving_avg, color='red', linewidth=2, label=f'Moving Avg ({window} episodes)')
 
 plt.xlabel('Timesteps')
 plt.ylabel('Reward')
@@ -36,8 +38,8 @@ plt.subplot(1, 2, 2)
 plt.plot(df['episode'], df['reward'], alpha=0.3, color='green', label='Raw Reward')
 
 if len(df) >= window:
-    moving_avg = df['reward'].rolling(window=window).mean()
-    plt.plot(df['episode'], moving_avg, color='orange', linewidth=2, label=f'Moving Avg ({window} episodes)')
+    moving_avg, _ = utils.windowed_curve(df['reward'].values, window)
+    plt.plot(df['episode'].values[window-1:], moving_avg, color='orange', linewidth=2, label=f'Moving Avg ({window} episodes)')
 
 plt.xlabel('Episodes')
 plt.ylabel('Reward')
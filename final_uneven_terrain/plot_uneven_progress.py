@@ -4,6 +4,8 @@ import numpy as np
 import glob
 import os
 
+import utils
+
 # Find the latest log file
 log_files = glob.glob('PPO_logs/RocketLanding_UnevenTerrain/*.csv')
 if not log_files:
@@ -34,8 +36,8 @@ plt.plot(df['timestep'], df['reward'], alpha=0.3, color='blue', label='Raw Rewar
 # Calculate moving average
 window = 20
 if len(df) >= window:
-    moving_avg = df['reward'].rolling(window=window).mean()
-    plt.plot(df['timestep'], moving_avg, color='red', linewidth=2, label=f'Moving Avg ({window} episodes)')
+    moving_avg, _ = utils.windowed_curve(df['reward'].values, window)
+    plt.plot(df['timestep'].values[window-1:], moving_avg, color='red', linewidth=2, label=f'Moving Avg ({window} episodes)')
 
 plt.xlabel('Timesteps')
 plt.ylabel('Reward')
@@ -48,8 +50,8 @@ plt.subplot(1, 2, 2)
 plt.plot(df['episode'], df['reward'], alpha=0.3, color='green', label='Raw Reward')
 
 if len(df) >= window:
-    moving_avg = df['reward'].rolling(window=window).mean()
-    plt.plot(df['episode'], moving_avg, color='orange', linewidth=2, label=f'Moving Avg ({window} episodes)')
+    moving_avg, _ = utils.windowed_curve(df['reward'].values, window)
+    plt.plot(df['episode'].values[window-1:], moving_avg, color='orange', linewidth=2, label=f'Moving Avg ({window} episodes)')
 
 plt.xlabel('Episodes')
 plt.ylabel('Reward')
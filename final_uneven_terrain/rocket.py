@@ -5,6 +5,11 @@ import utils
 import os
 
 
+# layout of the rocket state vector (Rocket.state), the first 8 entries are the observation
+X, Y, VX, VY, THETA, VTHETA, T, PHI, F, ACTION = range(10)
+STATE_KEYS = ('x', 'y', 'vx', 'vy', 'theta', 'vtheta', 't', 'phi', 'f', 'action_')
+
+
 class Rocket(object):
     """
     Rocket and environment with UNEVEN TERRAIN support.
@@ -35,12 +40,16 @@ class Rocket(object):
 
     def __init__(self, max_steps, task='hover', rocket_type='falcon',
                  viewport_h=768, path_to_bg_img=None, 
-                 terrain_difficulty='moderate', enable_terrain=True):
+                 terrain_difficulty='moderate', enable_terrain=True, terrain_points=100,
+                 terrain_bank=None, record_trajectory=True, trajectory_fields=None, seed=None):
 
         self.task = task
         self.rocket_type = rocket_type
         self.enable_terrain = enable_terrain
         self.terrain_difficulty = terrain_difficulty
+        self.terrain_points = terrain_points  # heightmap resolution
+        self.terrain_bank = terrain_bank  # utils.TerrainBank, new terrain from the bank on every reset
+        self.rng = np.random.default_rng(seed)  # own generator for the bank draws, independent of np.random
 
         self.g = 9.8
         self.H = 50  # rocket height (meters)
@@ -53,8 +62,9 @@ class Rocket(object):
         self.world_y_max = 570
         
         # Generate uneven terrain
+        self.terrain_index = None
         if self.enable_terrain:
-            self.terrain = self.generate_terrain(difficulty=terrain_difficulty)
+            self.select_terrain()
         else:
             self.terrain = None
 
@@ -74,107 +84,106 @@ class Rocket(object):
         self.viewport_h = int(viewport_h)
         self.viewport_w = int(viewport_h * (self.world_x_max-self.world_x_min) \
                           / (self.world_y_max - self.world_y_min))
+        # world -> pixel transform (uniform scale about the world's lower-left corner, y flipped), see wd2pxl
+        self.pxl_scale = self.viewport_w / (self.world_x_max - self.world_x_min)
+        self.pxl_origin = np.array([self.world_x_min, self.world_y_min], dtype=np.float64)
         self.step_id = 0
 
         self.state = self.create_random_state()
         self.action_table = self.create_action_table()
+        self.rocket_template = self.create_rocket_template()
 
         self.state_dims = 8
         self.action_dims = len(self.action_table)
+        self.obs = np.zeros(self.state_dims, dtype=np.float32)  # reused by flatten
 
         if path_to_bg_img is None:
             # Get the directory where this script is located
             script_dir = os.path.dirname(os.path.abspath(__file__))
             path_to_bg_img = os.path.join(script_dir, task+'.jpg')
         self.bg_img = utils.load_bg_img(path_to_bg_img, w=self.viewport_w, h=self.viewport_h)
+        self.static_layer = None  # background + terrain + target region, composited on first render
 
-        self.state_buffer = []
+        # per-step record of the state vector (trajectory_fields = which entries, None = all),
+        # record_trajectory=False turns it off when nothing draws or inspects it
+        self.trajectory = utils.TrajectoryBuffer(max_steps, len(STATE_KEYS), trajectory_fields) \
+            if record_trajectory else None
+        self.window_open = False  # set once render(show=True) has opened a cv2 window
 
     def generate_terrain(self, difficulty='moderate'):
         """
         Generate uneven terrain with craters and hills.
         Returns a dictionary with terrain points and parameters.
         """
-        terrain = {
-            'points': [],
-            'difficulty': difficulty
-        }
-        
-        # Configure terrain roughness based on difficulty
-        if difficulty == 'easy':
-            num_features = 3
-            max_height_variation = 15  # meters
-            crater_depth = 10
-        elif difficulty == 'moderate':
-            num_features = 5
-            max_height_variation = 25
-            crater_depth = 15
-        else:  # hard
-            num_features = 8
-            max_height_variation = 40
-            crater_depth = 20
-        
-        # Generate terrain points from left to right
-        x_points = np.linspace(self.world_x_min, self.world_x_max, 100)
-        y_base = 0  # base ground level
-        
-        # Start with flat terrain
-        y_points = np.ones_like(x_points) * y_base
-        
-        # Add random features (craters and hills)
-        for _ in range(num_features):
-            feature_center = np.random.uniform(self.world_x_min + 50, self.world_x_max - 50)
-            feature_width = np.random.uniform(30, 80)
-            feature_type = np.random.choice(['crater', 'hill'])
-            
-            if feature_type == 'crater':
-                feature_depth = -np.random.uniform(crater_depth * 0.5, crater_depth)
-            else:
-                feature_depth = np.random.uniform(max_height_variation * 0.3, max_height_variation)
-            
-            # Apply Gaussian-like feature
-            for i, x in enumerate(x_points):
-                distance = abs(x - feature_center)
-                if distance < feature_width:
-                    influence = np.exp(-((distance / feature_width) ** 2) * 3)
-                    y_points[i] += feature_depth * influence
-        
-        # Smooth the terrain
-        window_size = 5
-        y_points = np.convolve(y_points, np.ones(window_size)/window_size, mode='same')
-        
-        # Store terrain points
-        for x, y in zip(x_points, y_points):
-            terrain['points'].append((x, y))
-        
-        return terrain
-    
+        x_points, heights = utils.generate_terrains(1, self.world_x_min, self.world_x_max,
+                                                    difficulty=difficulty, num_points=self.terrain_points)
+        return utils.make_terrain(x_points, heights[0], difficulty)
+
+    def select_terrain(self, terrain_index=None):
+        """
+        Use terrain `terrain_index` of the terrain bank (a random one if None),
+        or generate a new terrain when the env has no bank.
+        """
+        if self.terrain_bank is None:
+            self.terrain_index = None
+            self.terrain = self.generate_terrain(difficulty=self.terrain_difficulty)
+        else:
+            if terrain_index is None:
+                terrain_index = self.terrain_bank.sample_index(self.rng)
+            self.terrain_index = int(terrain_index)
+            self.terrain = self.terrain_bank.get_terrain(self.terrain_index)
+
     def get_terrain_height(self, x_pos):
         """
-        Get the terrain height at a given x position using interpolation.
+        Get the terrain height at a given x position (scalar or array) using
+        linear interpolation between heightmap samples, clamped at the edges.
         """
         if not self.enable_terrain or self.terrain is None:
-            return 0
-        
-        points = self.terrain['points']
-        x_coords = [p[0] for p in points]
-        y_coords = [p[1] for p in points]
-        
-        # Linear interpolation
-        return np.interp(x_pos, x_coords, y_coords)
+            return 0 if np.isscalar(x_pos) else np.zeros(np.shape(x_pos))
+
+        heights = self.terrain['heights']
+        last = len(heights) - 1
 
+        if np.isscalar(x_pos):
+            # grid cell found by index arithmetic, no search
+            u = (x_pos - self.terrain['x0']) / self.terrain['dx']
+            if u <= 0:
+                return heights[0]
+            if u >= last:
+                return heights[last]
+            i = int(u)
+            return heights[i] + (u - i) * (heights[i+1] - heights[i])
 
-    def reset(self, state_dict=None):
+        u = np.clip((np.asarray(x_pos, dtype=np.float64) - self.terrain['x0']) / self.terrain['dx'], 0, last)
+        i = np.minimum(u.astype(np.intp), last - 1)
+        return heights[i] + (u - i) * (heights[i+1] - heights[i])
 
+
+    def reset(self, state_dict=None, terrain_index=None):
+
+        if self.enable_terrain and self.terrain_bank is not None:
+            # next terrain of the bank: the landing target and the cached background move with it
+            self.select_terrain(terrain_index)
+            if self.task == 'landing':
+                self.target_y = self.get_terrain_height(0) + self.H/2.0
+            self.static_layer = None
+
+        # the state array is updated in place, state_dict can be a state vector or a dict with STATE_KEYS
         if state_dict is None:
-            self.state = self.create_random_state()
+            self.state[:] = self.create_random_state()
+        elif isinstance(state_dict, dict):
+            self.state[:] = [state_dict.get(key, 0) for key in STATE_KEYS]
         else:
-            self.state = state_dict
+            self.state[:] = state_dict
 
-        self.state_buffer = []
+        if self.trajectory is not None:
+            self.trajectory.clear()
         self.step_id = 0
         self.already_landing = False
-        cv2.destroyAllWindows()
+        # only tear down the window render() opened, headless OpenCV builds have no window support
+        if self.window_open:
+            cv2.destroyAllWindows()
+            self.window_open = False
         return self.flatten(self.state)
 
     def create_action_table(self):
@@ -217,19 +226,14 @@ class Rocket(object):
             theta = random.uniform(-45, 45) / 180 * np.pi
             vy = -10
 
-        state = {
-            'x': x, 'y': y, 'vx': 0, 'vy': vy,
-            'theta': theta, 'vtheta': 0,
-            'phi': 0, 'f': 0,
-            't': 0, 'a_': 0
-        }
+        state = np.zeros(len(STATE_KEYS), dtype=np.float64)
+        state[X], state[Y], state[VY], state[THETA] = x, y, vy, theta
 
         return state
 
     def check_crash(self, state):
         if self.task == 'hover':
-            x, y = state['x'], state['y']
-            theta = state['theta']
+            x, y, theta = state[X], state[Y], state[THETA]
             crash = False
             if y <= self.H / 2.0:
                 crash = True
@@ -238,10 +242,7 @@ class Rocket(object):
             return crash
 
         elif self.task == 'landing':
-            x, y = state['x'], state['y']
-            vx, vy = state['vx'], state['vy']
-            theta = state['theta']
-            vtheta = state['vtheta']
+            x, y, vx, vy, theta, vtheta = state[:VTHETA+1].tolist()
             v = (vx**2 + vy**2)**0.5
             
             # Get terrain height at current x position
@@ -265,10 +266,7 @@ class Rocket(object):
         if self.task == 'hover':
             return False
         elif self.task == 'landing':
-            x, y = state['x'], state['y']
-            vx, vy = state['vx'], state['vy']
-            theta = state['theta']
-            vtheta = state['vtheta']
+            x, y, vx, vy, theta, vtheta = state[:VTHETA+1].tolist()
             v = (vx**2 + vy**2)**0.5
             
             # Get terrain height at current x position
@@ -281,18 +279,19 @@ class Rocket(object):
 
         x_range = self.world_x_max - self.world_x_min
         y_range = self.world_y_max - self.world_y_min
+        x, y, vx, vy, theta = state[:THETA+1].tolist()
 
         # dist between agent and target point
-        dist_x = abs(state['x'] - self.target_x)
-        dist_y = abs(state['y'] - self.target_y)
+        dist_x = abs(x - self.target_x)
+        dist_y = abs(y - self.target_y)
         dist_norm = dist_x / x_range + dist_y / y_range
 
         dist_reward = 0.1*(1.0 - dist_norm)
 
-        if abs(state['theta']) <= np.pi / 6.0:
+        if abs(theta) <= np.pi / 6.0:
             pose_reward = 0.1
         else:
-            pose_reward = abs(state['theta']) / (0.5*np.pi)
+            pose_reward = abs(theta) / (0.5*np.pi)
             pose_reward = 0.1 * (1.0 - pose_reward)
 
         reward = dist_reward + pose_reward
@@ -301,10 +300,10 @@ class Rocket(object):
             reward = 0.25
         if self.task == 'hover' and (dist_x**2 + dist_y**2)**0.5 <= 1*self.target_r:  # hit target
             reward = 0.5
-        if self.task == 'hover' and abs(state['theta']) > 90 / 180 * np.pi:
+        if self.task == 'hover' and abs(theta) > 90 / 180 * np.pi:
             reward = 0
 
-        v = (state['vx'] ** 2 + state['vy'] ** 2) ** 0.5
+        v = (vx ** 2 + vy ** 2) ** 0.5
         if self.task == 'landing' and self.already_crash:
             reward = (reward + 5*np.exp(-1*v/10.)) * (self.max_steps - self.step_id)
         if self.task == 'landing' and self.already_landing:
@@ -314,9 +313,7 @@ class Rocket(object):
 
     def step(self, action):
 
-        x, y, vx, vy = self.state['x'], self.state['y'], self.state['vx'], self.state['vy']
-        theta, vtheta = self.state['theta'], self.state['vtheta']
-        phi = self.state['phi']
+        x, y, vx, vy, theta, vtheta, _, phi = self.state[:PHI+1].tolist()
 
         f, vphi = self.action_table[action]
 
@@ -345,13 +342,10 @@ class Rocket(object):
         phi = max(phi, -20/180*3.1415926)
         phi = min(phi, 20/180*3.1415926)
 
-        self.state = {
-            'x': x_new, 'y': y_new, 'vx': vx_new, 'vy': vy_new,
-            'theta': theta_new, 'vtheta': vtheta_new,
-            'phi': phi, 'f': f,
-            't': self.step_id, 'action_': action
-        }
-        self.state_buffer.append(self.state)
+        self.state[:] = (x_new, y_new, vx_new, vy_new, theta_new, vtheta_new,
+                         self.step_id, phi, f, action)
+        if self.trajectory is not None:
+            self.trajectory.append(self.state)
 
         self.already_landing = self.check_landing_success(self.state)
         self.already_crash = self.check_crash(self.state)
@@ -365,34 +359,26 @@ class Rocket(object):
         return self.flatten(self.state), reward, done, None
 
     def flatten(self, state):
-        x = [state['x'], state['y'], state['vx'], state['vy'],
-             state['theta'], state['vtheta'], state['t'],
-             state['phi']]
-        return np.array(x, dtype=np.float32)/100.
+        # written into self.obs, the returned array is overwritten by the next step / reset
+        self.obs[:] = state[:PHI+1]
+        self.obs /= 100.
+        return self.obs
 
     def render(self, window_name='env', wait_time=1,
                with_trajectory=True, with_camera_tracking=True,
-               crop_scale=0.4):
+               crop_scale=0.4, show=True):
+        # show=False skips the cv2 window (headless), the frames are only returned
 
-        canvas = np.copy(self.bg_img)
-        
-        # Draw terrain first (if enabled)
-        if self.enable_terrain and self.terrain is not None:
-            self.draw_terrain(canvas)
-        
+        # background, terrain and target region come pre-composited
+        canvas = self.get_static_layer().copy()
         polys = self.create_polygons()
 
-        # draw target region
-        for poly in polys['target_region']:
-            self.draw_a_polygon(canvas, poly)
         # draw rocket
-        for poly in polys['rocket']:
-            self.draw_a_polygon(canvas, poly)
+        self.draw_polygons(canvas, polys['rocket'])
         frame_0 = canvas.copy()
 
         # draw engine work
-        for poly in polys['engine_work']:
-            self.draw_a_polygon(canvas, poly)
+        self.draw_polygons(canvas, polys['engine_work'])
         frame_1 = canvas.copy()
 
         if with_camera_tracking:
@@ -408,10 +394,12 @@ class Rocket(object):
         self.draw_text(frame_0, color=(0, 0, 0))
         self.draw_text(frame_1, color=(0, 0, 0))
 
-        cv2.imshow(window_name, frame_0[:,:,::-1])
-        cv2.waitKey(wait_time)
-        cv2.imshow(window_name, frame_1[:,:,::-1])
-        cv2.waitKey(wait_time)
+        if show:
+            self.window_open = True
+            cv2.imshow(window_name, frame_0[:,:,::-1])
+            cv2.waitKey(wait_time)
+            cv2.imshow(window_name, frame_1[:,:,::-1])
+            cv2.waitKey(wait_time)
         return frame_0, frame_1
     
     def draw_terrain(self, canvas):
@@ -419,21 +407,12 @@ class Rocket(object):
         if self.terrain is None:
             return
         
-        points = self.terrain['points']
-        terrain_pts = []
-        
-        for x, y in points:
-            terrain_pts.append([x, y])
-        
         # Convert to pixel coordinates
-        terrain_pts_px = self.wd2pxl(terrain_pts)
+        terrain_pts_px = self.wd2pxl(self.terrain['points']).astype(np.int32)
         
         # Draw terrain as a filled polygon (extend to bottom of canvas)
         # Create closed polygon
-        pts_with_base = terrain_pts_px.tolist()
-        pts_with_base.append([self.viewport_w, self.viewport_h])
-        pts_with_base.append([0, self.viewport_h])
-        pts_with_base = np.array(pts_with_base, dtype=np.int32)
+        pts_with_base = np.concatenate([terrain_pts_px, [[self.viewport_w, self.viewport_h], [0, self.viewport_h]]]).astype(np.int32)
         
         # Fill terrain
         cv2.fillPoly(canvas, [pts_with_base], color=(139, 90, 60), lineType=cv2.LINE_AA)
@@ -444,33 +423,63 @@ class Rocket(object):
         
         return canvas
 
-    def create_polygons(self):
+    def create_target_polygons(self):
+
+        target_region = []
+        if self.task == 'hover':
+            pts1 = utils.create_rectangle_poly(center=(self.target_x, self.target_y), w=0, h=self.target_r/3.0)
+            pts2 = utils.create_rectangle_poly(center=(self.target_x, self.target_y), w=self.target_r/3.0, h=0)
+            target_region.append({'pts': pts1, 'face_color': None, 'edge_color': (242, 242, 242)})
+            target_region.append({'pts': pts2, 'face_color': None, 'edge_color': (242, 242, 242)})
+        else:
+            # For landing with terrain, position target at terrain surface
+            target_y_pos = self.get_terrain_height(0) if self.enable_terrain else 0
+            pts1 = utils.create_ellipse_poly(center=(0, target_y_pos), rx=self.target_r, ry=self.target_r/4.0)
+            pts2 = utils.create_rectangle_poly(center=(0, target_y_pos), w=self.target_r/3.0, h=0)
+            pts3 = utils.create_rectangle_poly(center=(0, target_y_pos), w=0, h=self.target_r/6.0)
+            target_region.append({'pts': pts1, 'face_color': None, 'edge_color': (242, 242, 242)})
+            target_region.append({'pts': pts2, 'face_color': None, 'edge_color': (242, 242, 242)})
+            target_region.append({'pts': pts3, 'face_color': None, 'edge_color': (242, 242, 242)})
+
+        return target_region
+
+    def get_static_layer(self):
+        # the background, terrain and target region never move: composite them once and reuse
+        if self.static_layer is None:
+            canvas = np.copy(self.bg_img)
+            if self.enable_terrain and self.terrain is not None:
+                self.draw_terrain(canvas)
+            self.draw_polygons(canvas, self.create_target_polygons())
+            self.static_layer = canvas
+        return self.static_layer
 
-        polys = {'rocket': [], 'engine_work': [], 'target_region': []}
+    def create_rocket_template(self):
+        # body-frame geometry of the rocket, built once per rocket type: the vertices of all
+        # polygons packed into one (N, 2) array, polygon i is pts[offsets[i]:offsets[i+1]]
+
+        polys = []
 
         if self.rocket_type == 'falcon':
 
             H, W = self.H, self.H/10
-            dl = self.H / 30
 
             # rocket main body
             pts = [[-W/2, H/2], [W/2, H/2], [W/2, -H/2], [-W/2, -H/2]]
-            polys['rocket'].append({'pts': pts, 'face_color': (242, 242, 242), 'edge_color': None})
+            polys.append({'pts': pts, 'face_color': (242, 242, 242), 'edge_color': None})
             # rocket paint
             pts = utils.create_rectangle_poly(center=(0, -0.35*H), w=W, h=0.1*H)
-            polys['rocket'].append({'pts': pts, 'face_color': (42, 42, 42), 'edge_color': None})
+            polys.append({'pts': pts, 'face_color': (42, 42, 42), 'edge_color': None})
             pts = utils.create_rectangle_poly(center=(0, -0.46*H), w=W, h=0.02*H)
-            polys['rocket'].append({'pts': pts, 'face_color': (42, 42, 42), 'edge_color': None})
+            polys.append({'pts': pts, 'face_color': (42, 42, 42), 'edge_color': None})
             # rocket landing rack
             pts = [[-W/2, -H/2], [-W/2-H/10, -H/2-H/20], [-W/2, -H/2+H/20]]
-            polys['rocket'].append({'pts': pts, 'face_color': None, 'edge_color': (0, 0, 0)})
+            polys.append({'pts': pts, 'face_color': None, 'edge_color': (0, 0, 0)})
             pts = [[W/2, -H/2], [W/2+H/10, -H/2-H/20], [W/2, -H/2+H/20]]
-            polys['rocket'].append({'pts': pts, 'face_color': None, 'edge_color': (0, 0, 0)})
+            polys.append({'pts': pts, 'face_color': None, 'edge_color': (0, 0, 0)})
 
         elif self.rocket_type == 'starship':
 
             H, W = self.H, self.H / 2.6
-            dl = self.H / 30
 
             # rocket main body (right half)
             pts = np.array([[ 0.        ,  0.5006878 ],
@@ -481,9 +490,7 @@ class Rocket(object):
                            [ 0.2326389 ,  0.23796424],
                            [ 0.2326389 , -0.49931225],
                            [ 0.        , -0.49931225]], dtype=np.float32)
-            pts[:, 0] = pts[:, 0] * W
-            pts[:, 1] = pts[:, 1] * H
-            polys['rocket'].append({'pts': pts, 'face_color': (242, 242, 242), 'edge_color': None})
+            polys.append({'pts': pts, 'face_color': (242, 242, 242), 'edge_color': None})
 
             # rocket main body (left half)
             pts = np.array([[-0.        ,  0.5006878 ],
@@ -494,106 +501,114 @@ class Rocket(object):
                            [-0.2326389 ,  0.23796424],
                            [-0.2326389 , -0.49931225],
                            [-0.        , -0.49931225]], dtype=np.float32)
-            pts[:, 0] = pts[:, 0] * W
-            pts[:, 1] = pts[:, 1] * H
-            polys['rocket'].append({'pts': pts, 'face_color': (212, 212, 232), 'edge_color': None})
+            polys.append({'pts': pts, 'face_color': (212, 212, 232), 'edge_color': None})
 
             # upper wing (right)
             pts = np.array([[0.15972222, 0.3933975 ],
                            [0.3784722 , 0.303989  ],
                            [0.3784722 , 0.2352132 ],
                            [0.22916667, 0.23658872]], dtype=np.float32)
-            pts[:, 0] = pts[:, 0] * W
-            pts[:, 1] = pts[:, 1] * H
-            polys['rocket'].append({'pts': pts, 'face_color': (42, 42, 42), 'edge_color': None})
+            polys.append({'pts': pts, 'face_color': (42, 42, 42), 'edge_color': None})
 
             # upper wing (left)
             pts = np.array([[-0.15972222,  0.3933975 ],
                            [-0.3784722 ,  0.303989  ],
                            [-0.3784722 ,  0.2352132 ],
                            [-0.22916667,  0.23658872]], dtype=np.float32)
-            pts[:, 0] = pts[:, 0] * W
-            pts[:, 1] = pts[:, 1] * H
-            polys['rocket'].append({'pts': pts, 'face_color': (42, 42, 42), 'edge_color': None})
+            polys.append({'pts': pts, 'face_color': (42, 42, 42), 'edge_color': None})
 
             # lower wing (right)
             pts = np.array([[ 0.2326389 , -0.16368638],
                            [ 0.4548611 , -0.33562586],
                            [ 0.4548611 , -0.48555708],
                            [ 0.2638889 , -0.48555708]], dtype=np.float32)
-            pts[:, 0] = pts[:, 0] * W
-            pts[:, 1] = pts[:, 1] * H
-            polys['rocket'].append({'pts': pts, 'face_color': (100, 100, 100), 'edge_color': None})
+            polys.append({'pts': pts, 'face_color': (100, 100, 100), 'edge_color': None})
 
             # lower wing (left)
             pts = np.array([[-0.2326389 , -0.16368638],
                            [-0.4548611 , -0.33562586],
                            [-0.4548611 , -0.48555708],
                            [-0.2638889 , -0.48555708]], dtype=np.float32)
-            pts[:, 0] = pts[:, 0] * W
-            pts[:, 1] = pts[:, 1] * H
-            polys['rocket'].append({'pts': pts, 'face_color': (100, 100, 100), 'edge_color': None})
+            polys.append({'pts': pts, 'face_color': (100, 100, 100), 'edge_color': None})
+
+            # outlines are given in units of the rocket size
+            for poly in polys:
+                poly['pts'] = poly['pts'] * np.array([W, H], dtype=np.float32)
 
         else:
             raise NotImplementedError('rocket type [%s] is not found, please choose one '
                                       'from (falcon, starship)' % self.rocket_type)
 
-        # engine work
-        f, phi = self.state['f'], self.state['phi']
-        c, s = np.cos(phi), np.sin(phi)
+        # engine flame: up to 4 squares of side size*dl below the nozzle, the k-th one is
+        # pushed k*dl further along the nozzle direction (flame_dist), see create_polygons
+        dl = self.H / 30
+        flame_pts, flame_dist = [], []
+        for k, size in [(2, 1), (5, 1.5), (8, 2), (12, 3)]:
+            flame_pts.append(utils.create_rectangle_poly(center=(0, -self.H/2), w=size*dl, h=size*dl))
+            flame_dist.append([k*dl] * 4)
+
+        sizes = [len(poly['pts']) for poly in polys]
+        return {
+            'pts': np.concatenate([np.asarray(poly['pts'], dtype=np.float64) for poly in polys]),
+            'offsets': np.concatenate([[0], np.cumsum(sizes)]),
+            'colors': [(poly['face_color'], poly['edge_color']) for poly in polys],
+            'flame_pts': np.array(flame_pts, dtype=np.float64).reshape(-1, 2),
+            'flame_dist': np.array(flame_dist, dtype=np.float64).reshape(-1, 1),
+        }
+
+    def create_polygons(self):
+
+        template = self.rocket_template
 
+        # engine work: the number of flame squares grows with the thrust
+        f, phi = self.state[F], self.state[PHI]
         if f > 0 and f < 0.5 * self.g:
-            pts1 = utils.create_rectangle_poly(center=(2 * dl * s, -H / 2 - 2 * dl * c), w=dl, h=dl)
-            pts2 = utils.create_rectangle_poly(center=(5 * dl * s, -H / 2 - 5 * dl * c), w=1.5 * dl, h=1.5 * dl)
-            polys['engine_work'].append({'pts': pts1, 'face_color': (255, 255, 255), 'edge_color': None})
-            polys['engine_work'].append({'pts': pts2, 'face_color': (255, 255, 255), 'edge_color': None})
+            n_flames = 2
         elif f > 0.5 * self.g and f < 1.5 * self.g:
-            pts1 = utils.create_rectangle_poly(center=(2 * dl * s, -H / 2 - 2 * dl * c), w=dl, h=dl)
-            pts2 = utils.create_rectangle_poly(center=(5 * dl * s, -H / 2 - 5 * dl * c), w=1.5 * dl, h=1.5 * dl)
-            pts3 = utils.create_rectangle_poly(center=(8 * dl * s, -H / 2 - 8 * dl * c), w=2 * dl, h=2 * dl)
-            polys['engine_work'].append({'pts': pts1, 'face_color': (255, 255, 255), 'edge_color': None})
-            polys['engine_work'].append({'pts': pts2, 'face_color': (255, 255, 255), 'edge_color': None})
-            polys['engine_work'].append({'pts': pts3, 'face_color': (255, 255, 255), 'edge_color': None})
+            n_flames = 3
         elif f > 1.5 * self.g:
-            pts1 = utils.create_rectangle_poly(center=(2 * dl * s, -H / 2 - 2 * dl * c), w=dl, h=dl)
-            pts2 = utils.create_rectangle_poly(center=(5 * dl * s, -H / 2 - 5 * dl * c), w=1.5 * dl, h=1.5 * dl)
-            pts3 = utils.create_rectangle_poly(center=(8 * dl * s, -H / 2 - 8 * dl * c), w=2 * dl, h=2 * dl)
-            pts4 = utils.create_rectangle_poly(center=(12 * dl * s, -H / 2 - 12 * dl * c), w=3 * dl, h=3 * dl)
-            polys['engine_work'].append({'pts': pts1, 'face_color': (255, 255, 255), 'edge_color': None})
-            polys['engine_work'].append({'pts': pts2, 'face_color': (255, 255, 255), 'edge_color': None})
-            polys['engine_work'].append({'pts': pts3, 'face_color': (255, 255, 255), 'edge_color': None})
-            polys['engine_work'].append({'pts': pts4, 'face_color': (255, 255, 255), 'edge_color': None})
-        # target region
-        if self.task == 'hover':
-            pts1 = utils.create_rectangle_poly(center=(self.target_x, self.target_y), w=0, h=self.target_r/3.0)
-            pts2 = utils.create_rectangle_poly(center=(self.target_x, self.target_y), w=self.target_r/3.0, h=0)
-            polys['target_region'].append({'pts': pts1, 'face_color': None, 'edge_color': (242, 242, 242)})
-            polys['target_region'].append({'pts': pts2, 'face_color': None, 'edge_color': (242, 242, 242)})
+            n_flames = 4
         else:
-            # For landing with terrain, position target at terrain surface
-            target_y_pos = self.get_terrain_height(0) if self.enable_terrain else 0
-            pts1 = utils.create_ellipse_poly(center=(0, target_y_pos), rx=self.target_r, ry=self.target_r/4.0)
-            pts2 = utils.create_rectangle_poly(center=(0, target_y_pos), w=self.target_r/3.0, h=0)
-            pts3 = utils.create_rectangle_poly(center=(0, target_y_pos), w=0, h=self.target_r/6.0)
-            polys['target_region'].append({'pts': pts1, 'face_color': None, 'edge_color': (242, 242, 242)})
-            polys['target_region'].append({'pts': pts2, 'face_color': None, 'edge_color': (242, 242, 242)})
-            polys['target_region'].append({'pts': pts3, 'face_color': None, 'edge_color': (242, 242, 242)})
-
-        # apply transformation
-        for poly in polys['rocket'] + polys['engine_work']:
-            M = utils.create_pose_matrix(tx=self.state['x'], ty=self.state['y'], rz=self.state['theta'])
-            pts = np.array(poly['pts'])
-            pts = np.concatenate([pts, np.ones_like(pts)], axis=-1)  # attach z=1, w=1
-            pts = np.matmul(M, pts.T).T
-            poly['pts'] = pts[:, 0:2]
+            n_flames = 0
+        flame_dir = np.array([np.sin(phi), -np.cos(phi)])
+        flame_pts = template['flame_pts'][:4*n_flames] + template['flame_dist'][:4*n_flames] * flame_dir
+
+        # apply transformation: one 2D rotation + translation for all vertices
+        c, s = np.cos(self.state[THETA]), np.sin(self.state[THETA])
+        pts = np.concatenate([template['pts'], flame_pts])
+        pts = np.matmul(pts, np.array([[c, s], [-s, c]])) + np.array([self.state[X], self.state[Y]])
+
+        offsets = template['offsets']
+        polys = {'rocket': [], 'engine_work': []}
+        for (face_color, edge_color), i0, i1 in zip(template['colors'], offsets[:-1], offsets[1:]):
+            polys['rocket'].append({'pts': pts[i0:i1], 'face_color': face_color, 'edge_color': edge_color})
+        for i0 in range(offsets[-1], len(pts), 4):
+            polys['engine_work'].append({'pts': pts[i0:i0+4], 'face_color': (255, 255, 255), 'edge_color': None})
 
         return polys
 
 
-    def draw_a_polygon(self, canvas, poly):
+    def draw_a_polygon(self, canvas, poly, offset=(0, 0)):
+        # offset: pixel position of the canvas' top-left corner in the full viewport
+
+        pts_px = self.wd2pxl(poly['pts']) - np.array(offset, dtype=int)
+        return self.draw_a_polygon_px(canvas, pts_px, poly['face_color'], poly['edge_color'])
+
+
+    def draw_polygons(self, canvas, polys, offset=(0, 0)):
+        # like draw_a_polygon for a list of polygons, with a single world -> pixel transform for all of them
+
+        if len(polys) == 0:
+            return canvas
+        offset = np.array(offset, dtype=int)
+        for poly, pts_px in zip(polys, self.wd2pxl_batch([poly['pts'] for poly in polys])):
+            self.draw_a_polygon_px(canvas, pts_px - offset, poly['face_color'], poly['edge_color'])
+
+        return canvas
+
+
+    def draw_a_polygon_px(self, canvas, pts_px, face_color, edge_color):
 
-        pts, face_color, edge_color = poly['pts'], poly['face_color'], poly['edge_color']
-        pts_px = self.wd2pxl(pts)
         if face_color is not None:
             cv2.fillPoly(canvas, [pts_px], color=face_color, lineType=cv2.LINE_AA)
         if edge_color is not None:
@@ -603,22 +618,23 @@ class Rocket(object):
 
 
     def wd2pxl(self, pts, to_int=True):
+        # pts: array-like of world points (..., 2), all converted at once
 
-        pts_px = np.zeros_like(pts)
-
-        scale = self.viewport_w / (self.world_x_max - self.world_x_min)
-        for i in range(len(pts)):
-            pt = pts[i]
-            x_p = (pt[0] - self.world_x_min) * scale
-            y_p = (pt[1] - self.world_y_min) * scale
-            y_p = self.viewport_h - y_p
-            pts_px[i] = [x_p, y_p]
+        pts_px = (np.asarray(pts, dtype=np.float64) - self.pxl_origin) * self.pxl_scale
+        pts_px[..., 1] = self.viewport_h - pts_px[..., 1]
 
         if to_int:
             return pts_px.astype(int)
         else:
             return pts_px
 
+    def wd2pxl_batch(self, pts_list, to_int=True):
+        # many point sets (e.g. polygons) converted with one call: concatenate, transform, split back
+
+        sizes = [len(pts) for pts in pts_list]
+        pts = np.concatenate([np.asarray(pts, dtype=np.float64).reshape(-1, 2) for pts in pts_list])
+        return np.split(self.wd2pxl(pts, to_int=to_int), np.cumsum(sizes)[:-1])
+
     def draw_text(self, canvas, color=(255, 255, 0)):
 
         def put_text(vis, text, pt):
@@ -635,17 +651,17 @@ class Rocket(object):
 
         pt = (10, 60)
         text = "x: %.2f m, y: %.2f m" % \
-               (self.state['x'], self.state['y'])
+               (self.state[X], self.state[Y])
         put_text(canvas, text, pt)
 
         pt = (10, 80)
         text = "vx: %.2f m/s, vy: %.2f m/s" % \
-               (self.state['vx'], self.state['vy'])
+               (self.state[VX], self.state[VY])
         put_text(canvas, text, pt)
 
         pt = (10, 100)
         text = "a: %.2f degree, va: %.2f degree/s" % \
-               (self.state['theta'] * 180 / np.pi, self.state['vtheta'] * 180 / np.pi)
+               (self.state[THETA] * 180 / np.pi, self.state[VTHETA] * 180 / np.pi)
         put_text(canvas, text, pt)
 
 
@@ -656,39 +672,26 @@ class Rocket(object):
 
         sw, sh = pannel_w/self.viewport_w, pannel_h/self.viewport_h  # scale factors
 
-        # draw horizon line
+        # draw horizon line and vertical line
         range_x, range_y = self.world_x_max - self.world_x_min, self.world_y_max - self.world_y_min
-        pts = [[self.world_x_min + range_x/3, self.H/2], [self.world_x_max - range_x/3, self.H/2]]
-        pts_px = self.wd2pxl(pts)
-        x1, y1 = int(pts_px[0][0]*sw), int(pts_px[0][1]*sh)
-        x2, y2 = int(pts_px[1][0]*sw), int(pts_px[1][1]*sh)
-        cv2.line(traj_pannel, pt1=(x1, y1), pt2=(x2, y2),
+        pts = [[self.world_x_min + range_x/3, self.H/2], [self.world_x_max - range_x/3, self.H/2],
+               [0, self.H/2], [0, self.H/2+range_y/20]]
+        pts_px = (self.wd2pxl(pts) * [sw, sh]).astype(int)
+        cv2.line(traj_pannel, pt1=tuple(pts_px[0]), pt2=tuple(pts_px[1]),
                  color=(0, 0, 0), thickness=1, lineType=cv2.LINE_AA)
-
-        # draw vertical line
-        pts = [[0, self.H/2], [0, self.H/2+range_y/20]]
-        pts_px = self.wd2pxl(pts)
-        x1, y1 = int(pts_px[0][0]*sw), int(pts_px[0][1]*sh)
-        x2, y2 = int(pts_px[1][0]*sw), int(pts_px[1][1]*sh)
-        cv2.line(traj_pannel, pt1=(x1, y1), pt2=(x2, y2),
+        cv2.line(traj_pannel, pt1=tuple(pts_px[2]), pt2=tuple(pts_px[3]),
                  color=(0, 0, 0), thickness=1, lineType=cv2.LINE_AA)
 
-        if len(self.state_buffer) < 2:
+        traj = self.trajectory
+        if traj is None or len(traj) < 2 or X not in traj.fields or Y not in traj.fields:
             return
 
-        # draw traj
-        pts = []
-        for state in self.state_buffer:
-            pts.append([state['x'], state['y']])
-        pts_px = self.wd2pxl(pts)
-
+        # draw traj (every dn-th point)
         dn = 5
-        for i in range(0, len(pts_px)-dn, dn):
-
-            x1, y1 = int(pts_px[i][0]*sw), int(pts_px[i][1]*sh)
-            x1_, y1_ = int(pts_px[i+dn][0]*sw), int(pts_px[i+dn][1]*sh)
-
-            cv2.line(traj_pannel, pt1=(x1, y1), pt2=(x1_, y1_), color=color, thickness=2, lineType=cv2.LINE_AA)
+        pts = np.stack([traj.column(X)[::dn], traj.column(Y)[::dn]], axis=1)
+        pts_px = (self.wd2pxl(pts) * [sw, sh]).astype(int)
+        for i in range(len(pts_px) - 1):
+            cv2.line(traj_pannel, pt1=tuple(pts_px[i]), pt2=tuple(pts_px[i+1]), color=color, thickness=2, lineType=cv2.LINE_AA)
 
         roi_x1, roi_x2 = self.viewport_w - 10 - pannel_w, self.viewport_w - 10
         roi_y1, roi_y2 = 10, 10 + pannel_h
@@ -696,8 +699,8 @@ class Rocket(object):
 
 
 
-    def crop_alongwith_camera(self, vis, crop_scale=0.4):
-        x, y = self.state['x'], self.state['y']
+    def camera_crop_box(self, crop_scale=0.4):
+        x, y = self.state[X], self.state[Y]
         xp, yp = self.wd2pxl([[x, y]])[0]
         crop_w_half, crop_h_half = int(self.viewport_w*crop_scale), int(self.viewport_h*crop_scale)
         # check boundary
@@ -710,9 +713,35 @@ class Rocket(object):
         if yp >= self.viewport_h - crop_h_half - 1:
             yp = self.viewport_h - crop_h_half - 1
 
-        x1, x2, y1, y2 = xp-crop_w_half, xp+crop_w_half, yp-crop_h_half, yp+crop_h_half
+        return xp-crop_w_half, xp+crop_w_half, yp-crop_h_half, yp+crop_h_half
+
+    def crop_alongwith_camera(self, vis, crop_scale=0.4):
+        x1, x2, y1, y2 = self.camera_crop_box(crop_scale=crop_scale)
         vis = vis[y1:y2, x1:x2, :]
 
         vis = cv2.resize(vis, (self.viewport_w, self.viewport_h))
         return vis
 
+    def render_offscreen(self, with_trajectory=True, with_camera_tracking=True,
+                         crop_scale=0.4):
+        """
+        Render one RGB frame (rocket with engine flame) without opening any window.
+        Only the rocket and flame are drawn per frame, on top of the cached static
+        layer; with camera tracking only the cropped region is copied and drawn.
+        """
+        if with_camera_tracking:
+            x1, x2, y1, y2 = self.camera_crop_box(crop_scale=crop_scale)
+        else:
+            x1, x2, y1, y2 = 0, self.viewport_w, 0, self.viewport_h
+        canvas = self.get_static_layer()[y1:y2, x1:x2].copy()
+
+        polys = self.create_polygons()
+        self.draw_polygons(canvas, polys['rocket'] + polys['engine_work'], offset=(x1, y1))
+
+        if with_camera_tracking:
+            canvas = cv2.resize(canvas, (self.viewport_w, self.viewport_h))
+
+        if with_trajectory:
+            self.draw_trajectory(canvas)
+        self.draw_text(canvas, color=(0, 0, 0))
+        return canvas
@@ -1,11 +1,14 @@
 import os
+import sys
 import time
 from datetime import datetime
 
-import torch
 import numpy as np
 
-from PPO import PPO  # Assuming PPO is your policy class
+# numpy_policy is shared with the repository root, one copy; appended, so this folder's
+# own modules still take precedence
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from numpy_policy import NumpyPolicy, export_actor
 from rocket import Rocket  # Import your Rocket environment class
 
 #################################### Testing ###################################
@@ -23,6 +26,7 @@ def test():
     frame_delay = 1             # Delay between frames (in seconds)
 
     total_test_episodes = 10    # Total number of testing episodes
+    use_numpy_policy = True     # Run the actor with NumPy (exported .npz next to the .pth), torch is not imported
 
     K_epochs = 80               # Update policy for K epochs
     eps_clip = 0.2              # Clip parameter for PPO
@@ -39,19 +43,35 @@ def test():
     state_dim = env.state_dims
     action_dim = env.action_dims
 
-    # Initialize a PPO agent
-    ppo_agent = PPO(state_dim, action_dim, lr_actor, lr_critic, gamma, K_epochs, eps_clip, has_continuous_action_space)
-
     # Pretrained weights directory
     random_seed = 0             # Set this to load a specific checkpoint trained on a random seed
     run_num_pretrained = 13      # Set this to load a specific checkpoint number
 
     directory = "PPO_preTrained" + '/' + env_name + '/'
     checkpoint_path = directory + "PPO_{}_{}_{}.pth".format(env_name, random_seed, run_num_pretrained)
-    print("loading network from : " + checkpoint_path)
 
-    # Load pretrained model
-    ppo_agent.load(checkpoint_path)
+    if use_numpy_policy:
+        npz_path = os.path.splitext(checkpoint_path)[0] + '.npz'
+        # re-exported whenever the checkpoint is newer, a stale .npz would run the old weights;
+        # a shipped .npz alone is enough (the .pth, and torch, are then never touched)
+        if os.path.exists(checkpoint_path):
+            if not os.path.exists(npz_path) or os.path.getmtime(checkpoint_path) > os.path.getmtime(npz_path):
+                print("exporting actor weights to : " + npz_path)
+                export_actor(checkpoint_path, npz_path, has_continuous_action_space)
+        elif not os.path.exists(npz_path):
+            raise FileNotFoundError('neither the checkpoint [%s] nor its exported actor [%s] is found'
+                                    % (checkpoint_path, npz_path))
+        print("loading network from : " + npz_path)
+        ppo_agent = NumpyPolicy(npz_path)
+    else:
+        from PPO import PPO
+
+        # Initialize a PPO agent
+        ppo_agent = PPO(state_dim, action_dim, lr_actor, lr_critic, gamma, K_epochs, eps_clip, has_continuous_action_space)
+        print("loading network from : " + checkpoint_path)
+
+        # Load pretrained model
+        ppo_agent.load(checkpoint_path)
 
     print("--------------------------------------------------------------------------------------------")
 
@@ -74,7 +94,8 @@ def test():
                 break
 
         # Clear PPO agent buffer after each episode
-        ppo_agent.buffer.clear()
+        if not use_numpy_policy:
+            ppo_agent.buffer.clear()
 
         test_running_reward += ep_reward
         print('Episode: {} \t\t Reward: {}'.format(ep, round(ep_reward, 2)))
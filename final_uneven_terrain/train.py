@@ -1,15 +1,23 @@
 import os
+import sys
 import time
 from datetime import datetime
 
 import torch
 import numpy as np
 
-from PPO import PPO  # Assuming PPO is your policy class
+# live_plot and numpy_policy (imported by PPO) are shared with the repository root, one copy each;
+# appended, so this folder's own utils, rocket and PPO still take precedence
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PPO import PPO, device_name  # Assuming PPO is your policy class
 from rocket import Rocket  # Import your Rocket environment class
+from live_plot import update_live_plot
+import utils
 
 import matplotlib.pyplot as plt
 
+
 ################################### Training ###################################
 def train():
     print("============================================================================================")
@@ -32,6 +40,8 @@ def train():
     # Uneven terrain parameters
     enable_terrain = True
     terrain_difficulty = 'moderate'  # 'easy', 'moderate', 'hard'
+    terrain_bank_size = 0            # > 0: new terrain every episode, drawn from a fixed seeded bank of this size
+    terrain_bank_dir = "terrain_bank"  # one bank per difficulty, generated on first use
     #####################################################
 
     ################ PPO hyperparameters ################
@@ -48,8 +58,13 @@ def train():
     print("terrain enabled: %s, difficulty: %s" % (enable_terrain, terrain_difficulty))
 
     # Initialize the Rocket environment with uneven terrain
+    terrain_bank = None
+    if enable_terrain and terrain_bank_size > 0:
+        terrain_bank = utils.build_terrain_banks(terrain_bank_dir, terrain_bank_size, seed=random_seed)[terrain_difficulty]
     env = Rocket(max_steps=max_ep_len, task=task, rocket_type='starship', 
-                 enable_terrain=enable_terrain, terrain_difficulty=terrain_difficulty)  # Adjust as needed for the hover task
+                 enable_terrain=enable_terrain, terrain_difficulty=terrain_difficulty,
+                 terrain_bank=terrain_bank, record_trajectory=render,
+                 seed=random_seed or None)  # Adjust as needed for the hover task
 
     # Set state and action dimensions
     state_dim = env.state_dims
@@ -84,6 +99,9 @@ def train():
 
     # Initialize a PPO agent
     ppo_agent = PPO(state_dim, action_dim, lr_actor, lr_critic, gamma, K_epochs, eps_clip, has_continuous_action_space)
+    print("============================================================================================")
+    print("Device set to : " + device_name(ppo_agent.device))
+    print("============================================================================================")
 
     # Track total training time
     start_time = datetime.now().replace(microsecond=0)
@@ -103,6 +121,12 @@ def train():
 
     episode_rewards = []
     window_size = 10  # Window size for moving average and standard deviation
+    plot_interval = 1.0  # Redraw the live plot at most once per this many seconds
+
+    # moving average / std over the last window_size episodes, O(1) per episode
+    reward_window = utils.WindowedStats(window_size)
+    reward_curve = {'episode': [], 'mean': [], 'std': []}
+    last_plot_time = 0.0
 
     # Initialize the plot for real-time updating
     plt.ion()  # Turn on interactive mode
@@ -111,7 +135,6 @@ def train():
     ax.set_ylabel('Reward')
     ax.set_title('Training Progress')
     plt.show(block=False)
-    window_size = 10  # Window size for moving average and standard deviation
 
     # Training loop
     while time_step <= max_training_timesteps:
@@ -165,46 +188,19 @@ def train():
         
         episode_rewards.append(current_ep_reward)
 
+        reward_window.update(current_ep_reward)
+        if reward_window.full:
+            reward_curve['episode'].append(len(episode_rewards) - 1)
+            reward_curve['mean'].append(reward_window.mean)
+            reward_curve['std'].append(reward_window.std)
+
         # Update the plot
-        if len(episode_rewards) >= window_size:
-            # Calculate moving average and standard deviation
-            moving_avg = np.convolve(
-                episode_rewards, np.ones(window_size)/window_size, mode='valid'
-            )
-            moving_std = np.array([
-                np.std(episode_rewards[i-window_size+1:i+1]) 
-                for i in range(window_size-1, len(episode_rewards))
-            ])
-            episodes = np.arange(window_size-1, len(episode_rewards))
-
-            # Clear the axis and redraw
-            ax.clear()
-            ax.plot(episodes, moving_avg, label='Moving Average Reward')
-
-            # Shade the area between (mean - std) and (mean + std)
-            lower_bound = moving_avg - moving_std
-            upper_bound = moving_avg + moving_std
-            ax.fill_between(episodes, lower_bound, upper_bound, color='blue', alpha=0.2, label='Standard Deviation')
-
-            # Set labels and title
-            ax.set_xlabel('Episode')
-            ax.set_ylabel('Reward')
-            ax.set_title('Training Progress with Variability Shading')
-            ax.legend()
-            plt.draw()
-            plt.pause(0.01)
-        else:
-            # For initial episodes where we don't have enough data for moving average
-            ax.clear()
-            ax.plot(range(len(episode_rewards)), episode_rewards, label='Episode Reward')
-            ax.set_xlabel('Episode')
-            ax.set_ylabel('Reward')
-            ax.set_title('Training Progress')
-            ax.legend()
-            plt.draw()
-            plt.pause(0.01)
+        if time.time() - last_plot_time >= plot_interval:
+            update_live_plot(ax, episode_rewards, reward_curve)
+            last_plot_time = time.time()
 
     log_f.close()
+    update_live_plot(ax, episode_rewards, reward_curve)
     
     # Save final training graph
     print("Saving final training graph...")
@@ -0,0 +1,37 @@
+import numpy as np
+import matplotlib.pyplot as plt
+
+
+def update_live_plot(ax, episode_rewards, reward_curve):
+    # reward_curve holds the moving average / std, updated incrementally once per episode
+    if len(reward_curve['episode']) > 0:
+        episodes = np.asarray(reward_curve['episode'])
+        moving_avg = np.asarray(reward_curve['mean'])
+        moving_std = np.asarray(reward_curve['std'])
+
+        # Clear the axis and redraw
+        ax.clear()
+        ax.plot(episodes, moving_avg, label='Moving Average Reward')
+
+        # Shade the area between (mean - std) and (mean + std)
+        lower_bound = moving_avg - moving_std
+        upper_bound = moving_avg + moving_std
+        ax.fill_between(episodes, lower_bound, upper_bound, color='blue', alpha=0.2, label='Standard Deviation')
+
+        # Set labels and title
+        ax.set_xlabel('Episode')
+        ax.set_ylabel('Reward')
+        ax.set_title('Training Progress with Variability Shading')
+        ax.legend()
+        plt.draw()
+        plt.pause(0.01)
+    else:
+        # For initial episodes where we don't have enough data for moving average
+        ax.clear()
+        ax.plot(range(len(episode_rewards)), episode_rewards, label='Episode Reward')
+        ax.set_xlabel('Episode')
+        ax.set_ylabel('Reward')
+        ax.set_title('Training Progress')
+        ax.legend()
+        plt.draw()
+        plt.pause(0.01)
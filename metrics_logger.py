@@ -0,0 +1,188 @@
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+
+################################## Columns ##################################
+def columns_dir(csv_path):
+    # directory holding the columnar copy of a CSV log, one raw binary file per column
+    return os.path.splitext(csv_path)[0] + '_columns'
+
+
+def read_columns(csv_path):
+    """
+    Load the columnar copy of a MetricsLogger CSV as a dict of 1-D arrays
+    (column name -> array), in the column order of the CSV header.
+    """
+    directory = columns_dir(csv_path)
+    with open(os.path.join(directory, 'columns.txt')) as f:
+        columns = [line.split() for line in f.read().splitlines() if line]
+    data = {}
+    for name, dtype in columns:
+        data[name] = np.fromfile(os.path.join(directory, name + '.' + dtype), dtype=dtype)
+    # a column can be a few rows ahead of the others if a write was interrupted
+    n = min(len(values) for values in data.values())
+    return {name: values[:n] for name, values in data.items()}
+
+
+def truncate(csv_path, max_value, column='timestep'):
+    """
+    Drop the rows whose `column` is above max_value from a CSV log (and
+    from its columnar copy, if any), e.g. the rows a crashed run logged
+    after the checkpoint it is resumed from. Rows must be sorted by column.
+    """
+    if not os.path.exists(csv_path):
+        return
+    with open(csv_path) as f:
+        lines = f.readlines()
+    index = lines[0].strip().split(',').index(column)
+    kept = lines[:1] + [line for line in lines[1:] if float(line.split(',')[index]) <= max_value]
+    with open(csv_path, 'w') as f:
+        f.writelines(kept)
+
+    directory = columns_dir(csv_path)
+    if os.path.exists(os.path.join(directory, 'columns.txt')):
+        num_rows = len(kept) - 1
+        with open(os.path.join(directory, 'columns.txt')) as f:
+            for name, dtype in (line.split() for line in f.read().splitlines() if line):
+                path = os.path.join(directory, name + '.' + dtype)
+                size = num_rows * np.dtype(dtype).itemsize
+                if os.path.exists(path) and os.path.getsize(path) > size:
+                    with open(path, 'r+b') as f_col:
+                        f_col.truncate(size)
+
+
+################################## Logger ##################################
+class MetricsLogger(object):
+    """
+    Buffered CSV logger with a columnar copy, written on a background thread.
+
+    columns is a list of (name, dtype) pairs, e.g. ('timestep', 'i8'),
+    ('reward', 'f8'), ('landed', '?'). log(*values) only appends the row
+    to an in-memory list; every batch_size rows, or when flush_interval
+    seconds have passed since the last hand-off, the rows go to a writer
+    thread that appends them to the CSV (kept open for the whole run) and
+    to one raw binary file per column in <csv name>_columns/, which
+    read_columns() loads back with np.fromfile.
+
+    With append=True an existing log is continued (e.g. after a resume),
+    otherwise it is overwritten; a columnar copy that is missing or does
+    not match the CSV is then rebuilt from the CSV. flush() blocks until
+    every logged row is on disk, close() also stops the thread (closing
+    twice is a no-op). An error of the writer thread is raised by the next
+    log(), flush() or close().
+
+    """
+
+    def __init__(self, csv_path, columns, columnar=True, batch_size=256, flush_interval=5.0, append=False):
+        self.csv_path = csv_path
+        self.names = [name for name, _ in columns]
+        self.dtypes = [np.dtype(dtype) for _, dtype in columns]
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        append = append and os.path.exists(csv_path)
+        self.csv_f = open(csv_path, 'a' if append else 'w')
+        if not append:
+            self.csv_f.write(','.join(self.names) + '\n')
+            self.csv_f.flush()
+
+        self.column_fs = []
+        if columnar:
+            directory = columns_dir(csv_path)
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            with open(os.path.join(directory, 'columns.txt'), 'w') as f:
+                f.writelines('{} {}\n'.format(name, dtype.name) for name, dtype in zip(self.names, self.dtypes))
+            paths = [os.path.join(directory, name + '.' + dtype.name) for name, dtype in zip(self.names, self.dtypes)]
+            if append and not self._columns_match_csv(paths):
+                # missing or out of step with the CSV (e.g. the log was written with columnar=False)
+                self._rebuild_columns(paths)
+            self.column_fs = [open(path, 'ab' if append else 'wb') for path in paths]
+
+        self.closed = False
+        self.rows = []
+        self.last_flush = time.time()
+        self.queue = queue.Queue()
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _csv_rows(self):
+        with open(self.csv_path) as f:
+            lines = f.read().splitlines()
+        return lines[0].split(','), [line.split(',') for line in lines[1:] if line]
+
+    def _columns_match_csv(self, paths):
+        _, rows = self._csv_rows()
+        return all(os.path.exists(path) and os.path.getsize(path) == len(rows) * dtype.itemsize
+                   for path, dtype in zip(paths, self.dtypes))
+
+    def _rebuild_columns(self, paths):
+        # columnar copy rewritten from the rows already in the CSV
+        header, rows = self._csv_rows()
+        for name, dtype, path in zip(self.names, self.dtypes, paths):
+            index = header.index(name)
+            values = np.array([row[index] for row in rows], dtype=np.float64)
+            with open(path, 'wb') as f:
+                f.write(values.astype(dtype).tobytes())
+
+    def _run(self):
+        while True:
+            rows = self.queue.get()
+            try:
+                if rows is None:
+                    break
+                self._write(rows)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def _write(self, rows):
+        # one array per column, then a single write per file
+        columns = [np.array(values, dtype=dtype) for values, dtype in zip(zip(*rows), self.dtypes)]
+        formatted = [values.astype(np.int64) if dtype.kind == 'b' else values.tolist()
+                     for values, dtype in zip(columns, self.dtypes)]
+        self.csv_f.write(''.join(','.join(map(str, row)) + '\n' for row in zip(*formatted)))
+        self.csv_f.flush()
+        for f, values in zip(self.column_fs, columns):
+            f.write(values.tobytes())
+            f.flush()
+
+    def _raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _hand_off(self):
+        if self.rows:
+            self.queue.put(self.rows)
+            self.rows = []
+        self.last_flush = time.time()
+
+    def log(self, *values):
+        self.rows.append(values)
+        if len(self.rows) >= self.batch_size or time.time() - self.last_flush >= self.flush_interval:
+            self._raise_error()
+            self._hand_off()
+
+    def flush(self):
+        self._hand_off()
+        self.queue.join()
+        self._raise_error()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._hand_off()
+        self.queue.put(None)
+        self.thread.join()
+        self.csv_f.close()
+        for f in self.column_fs:
+            f.close()
+        self._raise_error()
@@ -0,0 +1,110 @@
+import numpy as np
+
+
+################################## Export ##################################
+def export_actor(checkpoint, npz_path, has_continuous_action_space=False, action_std=None):
+    """
+    Dump the actor of a PPO ActorCritic to a compact .npz file for NumpyPolicy.
+
+    checkpoint is a path to a PPO .pth file (as written by PPO.save) or an
+    already loaded state dict. Only the three linear layers of the actor
+    are kept, transposed to (in, out) float32 matrices. action_std is the
+    exploration std of a continuous policy (it is not part of the state
+    dict); without it NumpyPolicy returns the mean action.
+    """
+    if isinstance(checkpoint, dict):
+        state_dict = checkpoint
+    else:
+        import torch  # only needed for reading .pth files
+        state_dict = torch.load(checkpoint, map_location=lambda storage, loc: storage)
+
+    arrays = {}
+    for i, key in enumerate(['actor.0', 'actor.2', 'actor.4']):
+        arrays['w%d' % i] = np.ascontiguousarray(state_dict[key + '.weight'].cpu().numpy().T, dtype=np.float32)
+        arrays['b%d' % i] = np.asarray(state_dict[key + '.bias'].cpu().numpy(), dtype=np.float32)
+    arrays['continuous'] = np.array(has_continuous_action_space)
+    if action_std is not None:
+        arrays['action_std'] = np.array(action_std, dtype=np.float32)
+
+    np.savez(npz_path, **arrays)
+    return npz_path
+
+
+################################## Inference ##################################
+class NumpyPolicy(object):
+    """
+    Pure NumPy inference of an exported PPO actor (8 -> 64 -> 64 -> actions MLP).
+
+    Runs on a single observation or a batch (one row per env) in float32
+    without torch or autograd, with preallocated hidden buffers for the
+    batch size of the previous call. select_action mirrors
+    PPO.select_action: a discrete policy samples from the softmax (argmax
+    with deterministic=True), a continuous one returns the tanh mean plus
+    Gaussian noise of the exported action_std.
+
+    """
+
+    def __init__(self, npz_path, seed=None):
+
+        with np.load(npz_path) as data:
+            self.weights = [data['w0'], data['w1'], data['w2']]
+            self.biases = [data['b0'], data['b1'], data['b2']]
+            self.has_continuous_action_space = bool(data['continuous'])
+            self.action_std = float(data['action_std']) if 'action_std' in data else None
+
+        self.state_dim = self.weights[0].shape[0]
+        self.action_dim = self.weights[-1].shape[1]
+        self.rng = np.random.default_rng(seed)
+        self._buffers = None
+
+    def _get_buffers(self, n):
+        if self._buffers is None or self._buffers[0].shape[0] != n:
+            self._buffers = [np.empty((n, w.shape[1]), dtype=np.float32) for w in self.weights]
+        return self._buffers
+
+    def forward(self, state):
+        """
+        Actor output for an (N, state_dim) batch: action probabilities of a
+        discrete policy or tanh action means of a continuous one. The result
+        is overwritten by the next call.
+        """
+        h1, h2, out = self._get_buffers(len(state))
+
+        np.dot(state, self.weights[0], out=h1)
+        h1 += self.biases[0]
+        np.tanh(h1, out=h1)
+        np.dot(h1, self.weights[1], out=h2)
+        h2 += self.biases[1]
+        np.tanh(h2, out=h2)
+        np.dot(h2, self.weights[2], out=out)
+        out += self.biases[2]
+
+        if self.has_continuous_action_space:
+            np.tanh(out, out=out)
+        else:
+            # softmax over the actions
+            out -= out.max(axis=1, keepdims=True)
+            np.exp(out, out=out)
+            out /= out.sum(axis=1, keepdims=True)
+        return out
+
+    def select_action(self, state, deterministic=False):
+        # state is either a single observation or a batch of observations (one row per env)
+        state = np.asarray(state, dtype=np.float32)
+        batched = state.ndim > 1
+        out = self.forward(state.reshape(-1, self.state_dim))
+
+        if self.has_continuous_action_space:
+            action = out.copy()
+            if not deterministic and self.action_std is not None:
+                action += self.action_std * self.rng.standard_normal(action.shape, dtype=np.float32)
+            return action if batched else action.flatten()
+
+        if deterministic:
+            action = out.argmax(axis=1)
+        else:
+            # inverse-CDF sampling of one action per row
+            cdf = np.cumsum(out, axis=1)
+            u = self.rng.random((len(out), 1), dtype=np.float32) * cdf[:, -1:]
+            action = np.minimum((cdf <= u).sum(axis=1), self.action_dim - 1)
+        return action if batched else int(action[0])
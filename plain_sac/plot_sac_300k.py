@@ -6,6 +6,8 @@ import numpy as np
 import matplotlib.pyplot as plt
 import os
 
+import utils
+
 
 def plot_sac_results():
     log_file = './SAC_logs/training_log.csv'
@@ -54,7 +56,7 @@ def plot_sac_results():
     
     # Calculate moving average
     window = min(20, len(rewards))
-    moving_avg = np.convolve(rewards, np.ones(window)/window, mode='valid')
+    moving_avg, _ = utils.windowed_curve(rewards, window)
     
     # Create figure with 2 subplots
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
@@ -12,6 +12,11 @@ import os
 import random
 
 
+# layout of the rocket state vector (RocketLandingEnv.state), the first 8 entries are the observation
+X, Y, VX, VY, THETA, VTHETA, T, PHI, F, ACTION = range(10)
+STATE_KEYS = ('x', 'y', 'vx', 'vy', 'theta', 'vtheta', 't', 'phi', 'f', 'action_')
+
+
 class RocketLandingEnv(gym.Env):
     """
     Continuous action space rocket landing environment for SAC.
@@ -31,7 +36,8 @@ class RocketLandingEnv(gym.Env):
     metadata = {'render_modes': ['human', 'rgb_array'], 'render_fps': 20}
     
     def __init__(self, max_steps=1000, task='landing', rocket_type='starship',
-                 viewport_h=768, path_to_bg_img=None, render_mode=None):
+                 viewport_h=768, path_to_bg_img=None, render_mode=None,
+                 record_trajectory=True, trajectory_fields=None):
         super().__init__()
         
         self.task = task
@@ -70,7 +76,10 @@ class RocketLandingEnv(gym.Env):
             path_to_bg_img = os.path.join(script_dir, task+'.jpg')
         self.bg_img = utils.load_bg_img(path_to_bg_img, w=self.viewport_w, h=self.viewport_h)
         
-        self.state_buffer = []
+        # per-step record of the state vector (trajectory_fields = which entries, None = all),
+        # record_trajectory=False turns it off when nothing draws or inspects it
+        self.trajectory = utils.TrajectoryBuffer(max_steps, len(STATE_KEYS), trajectory_fields) \
+            if record_trajectory else None
         
         # Define action and observation spaces for Gymnasium
         # Action: [thrust, nozzle_angle_velocity]
@@ -87,7 +96,9 @@ class RocketLandingEnv(gym.Env):
             dtype=np.float32
         )
         
-        self.state = None
+        # state vector (see STATE_KEYS) and observation, both updated in place
+        self.state = np.zeros(len(STATE_KEYS), dtype=np.float64)
+        self.obs = np.zeros(8, dtype=np.float32)
         
     def reset(self, seed=None, options=None):
         super().reset(seed=seed)
@@ -96,13 +107,14 @@ class RocketLandingEnv(gym.Env):
             np.random.seed(seed)
             random.seed(seed)
         
-        self.state = self.create_random_state()
-        self.state_buffer = []
+        self.state[:] = self.create_random_state()
+        if self.trajectory is not None:
+            self.trajectory.clear()
         self.step_id = 0
         self.already_landing = False
         self.already_crash = False
         
-        observation = self.flatten(self.state)
+        observation = self.flatten(self.state).copy()
         info = {}
         
         return observation, info
@@ -113,10 +125,7 @@ class RocketLandingEnv(gym.Env):
         vphi = np.clip(action[1], -30/180*np.pi, 30/180*np.pi)  # nozzle angular velocity
         
         # Current state
-        x, y = self.state['x'], self.state['y']
-        vx, vy = self.state['vx'], self.state['vy']
-        theta, vtheta = self.state['theta'], self.state['vtheta']
-        phi = self.state['phi']
+        x, y, vx, vy, theta, vtheta, _, phi = self.state[:PHI+1].tolist()
         
         # Physics simulation
         ft, fr = -f*np.sin(phi), f*np.cos(phi)
@@ -144,14 +153,11 @@ class RocketLandingEnv(gym.Env):
         phi_new = max(phi_new, -20/180*np.pi)
         phi_new = min(phi_new, 20/180*np.pi)
         
-        # Update state dictionary
-        self.state = {
-            'x': x_new, 'y': y_new, 'vx': vx_new, 'vy': vy_new,
-            'theta': theta_new, 'vtheta': vtheta_new,
-            'phi': phi_new, 'f': f,
-            't': self.step_id, 'action_': 0
-        }
-        self.state_buffer.append(self.state)
+        # Update state vector
+        self.state[:] = (x_new, y_new, vx_new, vy_new, theta_new, vtheta_new,
+                         self.step_id, phi_new, f, 0)
+        if self.trajectory is not None:
+            self.trajectory.append(self.state)
         
         # Check terminal conditions
         self.already_landing = self.check_landing_success(self.state)
@@ -161,7 +167,7 @@ class RocketLandingEnv(gym.Env):
         done = self.already_crash or self.already_landing or self.step_id >= self.max_steps
         truncated = self.step_id >= self.max_steps
         
-        observation = self.flatten(self.state)
+        observation = self.flatten(self.state).copy()
         info = {
             'landed': self.already_landing,
             'crashed': self.already_crash,
@@ -180,25 +186,20 @@ class RocketLandingEnv(gym.Env):
         theta = np.random.uniform(-10/180*np.pi, 10/180*np.pi)
         vtheta = np.random.uniform(-5/180*np.pi, 5/180*np.pi)
         
-        state_dict = {
-            'x': x, 'y': y, 'vx': vx, 'vy': vy,
-            'theta': theta, 'vtheta': vtheta,
-            'phi': 0, 'f': 0,
-            't': 0, 'action_': 0
-        }
-        return state_dict
+        state = np.zeros(len(STATE_KEYS), dtype=np.float64)
+        state[X], state[Y], state[VX], state[VY], state[THETA], state[VTHETA] = x, y, vx, vy, theta, vtheta
+        return state
     
     def flatten(self, state):
-        x = np.array([
-            state['x'], state['y'], state['vx'], state['vy'],
-            state['theta'], state['vtheta'], state['t'],
-            state['phi']
-        ], dtype=np.float32) / 100.
-        return x
+        # written into self.obs; reset / step return a copy since wrappers keep
+        # references to past observations (e.g. VecEnv terminal_observation)
+        self.obs[:] = state[:PHI+1]
+        self.obs /= 100.
+        return self.obs
     
     def check_crash(self, state):
         if self.task == 'hover':
-            x, y = state['x'], state['y']
+            x, y = state[X], state[Y]
             if x < self.world_x_min or x > self.world_x_max:
                 return True
             if y < self.world_y_min or y > self.world_y_max:
@@ -206,10 +207,7 @@ class RocketLandingEnv(gym.Env):
             return False
         
         elif self.task == 'landing':
-            x, y = state['x'], state['y']
-            vx, vy = state['vx'], state['vy']
-            theta = state['theta']
-            vtheta = state['vtheta']
+            x, y, vx, vy, theta, vtheta = state[:VTHETA+1].tolist()
             v = (vx**2 + vy**2)**0.5
             
             crash = False
@@ -229,10 +227,7 @@ class RocketLandingEnv(gym.Env):
         if self.task == 'hover':
             return False
         elif self.task == 'landing':
-            x, y = state['x'], state['y']
-            vx, vy = state['vx'], state['vy']
-            theta = state['theta']
-            vtheta = state['vtheta']
+            x, y, vx, vy, theta, vtheta = state[:VTHETA+1].tolist()
             v = (vx**2 + vy**2)**0.5
             return True if y <= 0 + self.H / 2.0 and v < 15.0 and abs(x) < self.target_r \
                            and abs(theta) < 10/180*np.pi and abs(vtheta) < 10/180*np.pi else False
@@ -241,17 +236,19 @@ class RocketLandingEnv(gym.Env):
         x_range = self.world_x_max - self.world_x_min
         y_range = self.world_y_max - self.world_y_min
         
+        x, y, vx, vy, theta = state[:THETA+1].tolist()
+
         # Distance reward
-        dist_x = abs(state['x'] - self.target_x)
-        dist_y = abs(state['y'] - self.target_y)
+        dist_x = abs(x - self.target_x)
+        dist_y = abs(y - self.target_y)
         dist_norm = dist_x / x_range + dist_y / y_range
         dist_reward = 0.1*(1.0 - dist_norm)
         
         # Pose reward
-        if abs(state['theta']) <= np.pi / 6.0:
+        if abs(theta) <= np.pi / 6.0:
             pose_reward = 0.1
         else:
-            pose_reward = abs(state['theta']) / (0.5*np.pi)
+            pose_reward = abs(theta) / (0.5*np.pi)
             pose_reward = 0.1 * (1.0 - pose_reward)
         
         reward = dist_reward + pose_reward
@@ -261,10 +258,10 @@ class RocketLandingEnv(gym.Env):
             reward = 0.25
         if self.task == 'hover' and (dist_x**2 + dist_y**2)**0.5 <= 1*self.target_r:
             reward = 0.5
-        if self.task == 'hover' and abs(state['theta']) > 90 / 180 * np.pi:
+        if self.task == 'hover' and abs(theta) > 90 / 180 * np.pi:
             reward = 0
         
-        v = (state['vx'] ** 2 + state['vy'] ** 2) ** 0.5
+        v = (vx ** 2 + vy ** 2) ** 0.5
         if self.task == 'landing' and self.already_crash:
             reward = (reward + 5*np.exp(-1*v/10.)) * (self.max_steps - self.step_id)
         if self.task == 'landing' and self.already_landing:
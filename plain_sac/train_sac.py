@@ -4,12 +4,18 @@ Uses Stable-Baselines3 implementation
 """
 
 import os
+import sys
 import numpy as np
 from stable_baselines3 import SAC
 from stable_baselines3.common.callbacks import BaseCallback
 from stable_baselines3.common.logger import configure
 import matplotlib.pyplot as plt
 from rocket_env import RocketLandingEnv
+# metrics_logger is shared with the repository root, one copy; appended, so this folder's
+# own modules still take precedence
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metrics_logger import MetricsLogger
+import utils
 import random
 
 
@@ -20,26 +26,55 @@ class TrainingCallback(BaseCallback):
         super().__init__()
         self.check_freq = check_freq
         self.log_dir = log_dir
-        self.episode_rewards = []
-        self.episode_lengths = []
+        # incremental summaries, O(1) per episode (no per-episode history is kept)
+        self.reward_stats = utils.RunningStats()
+        self.reward_window = utils.WindowedStats(100)
+        self.length_stats = utils.RunningStats()
         self.current_episode_reward = 0
         self.current_episode_length = 0
+        # rows are buffered and written in batches by a background thread
+        self.open_logs(append=False)
+        
+    def open_logs(self, append):
+        self.training_log = MetricsLogger(os.path.join(self.log_dir, 'training_log.csv'),
+                                          [('timestep', 'i8'), ('episode', 'i8'), ('reward', 'f8')],
+                                          append=append)
+        self.episode_log = MetricsLogger(os.path.join(self.log_dir, 'episodes.csv'),
+                                         [('timestep', 'i8'), ('episode', 'i8'), ('reward', 'f8'),
+                                          ('length', 'i8'), ('landed', '?'), ('crashed', '?'),
+                                          ('timeout', '?'), ('touchdown_speed', 'f8')],
+                                         append=append)
+
+    def close_logs(self):
+        self.training_log.close()
+        self.episode_log.close()
+
+    def _on_training_start(self):
+        self.rocket_height = self.training_env.get_attr('H')[0]
         
     def _on_step(self):
         self.current_episode_reward += self.locals['rewards'][0]
         self.current_episode_length += 1
         
         if self.locals['dones'][0]:
-            self.episode_rewards.append(self.current_episode_reward)
-            self.episode_lengths.append(self.current_episode_length)
+            self.reward_stats.update(self.current_episode_reward)
+            self.reward_window.update(self.current_episode_reward)
+            self.length_stats.update(self.current_episode_length)
+            num_episodes = self.reward_stats.count
+
+            info = self.locals['infos'][0]
+            ground = info['y'] - info.get('terrain_height', 0.) <= self.rocket_height / 2.0
+            self.episode_log.log(self.num_timesteps, num_episodes, self.current_episode_reward,
+                                 self.current_episode_length, info['landed'], info['crashed'],
+                                 not (info['landed'] or info['crashed']),
+                                 info['velocity'] if ground else np.nan)
+
+            # Log to file
+            if num_episodes % 10 == 0:
+                self.training_log.log(self.num_timesteps, num_episodes, self.current_episode_reward)
+
             self.current_episode_reward = 0
             self.current_episode_length = 0
-            
-            # Log to file
-            if len(self.episode_rewards) % 10 == 0:
-                log_file = os.path.join(self.log_dir, 'training_log.csv')
-                with open(log_file, 'a') as f:
-                    f.write(f"{self.num_timesteps},{len(self.episode_rewards)},{self.episode_rewards[-1]}\n")
         
         return True
 
@@ -58,10 +93,8 @@ def train_sac():
     os.makedirs(model_dir, exist_ok=True)
     os.makedirs(graph_dir, exist_ok=True)
     
-    # Initialize log file
+    # training_log.csv and episodes.csv are (re)created by the callback
     log_file = os.path.join(log_dir, 'training_log.csv')
-    with open(log_file, 'w') as f:
-        f.write('timestep,episode,reward\n')
     
     print("=" * 50)
     print("SAC Training - Plain Surface")
@@ -73,7 +106,8 @@ def train_sac():
     print("=" * 50)
     
     # Create environment
-    env = RocketLandingEnv(max_steps=1000, task='landing', rocket_type='starship')
+    env = RocketLandingEnv(max_steps=1000, task='landing', rocket_type='starship',
+                           record_trajectory=False)
     
     # Create SAC model
     model = SAC(
@@ -101,24 +135,28 @@ def train_sac():
     total_timesteps = 500000
     save_freq = 50000
     
-    for i in range(0, total_timesteps, save_freq):
-        remaining = min(save_freq, total_timesteps - i)
-        model.learn(
-            total_timesteps=remaining,
-            callback=callback,
-            reset_num_timesteps=False,
-            progress_bar=True
-        )
+    try:
+        for i in range(0, total_timesteps, save_freq):
+            remaining = min(save_freq, total_timesteps - i)
+            model.learn(
+                total_timesteps=remaining,
+                callback=callback,
+                reset_num_timesteps=False,
+                progress_bar=True
+            )
         
-        # Save model checkpoint
-        checkpoint_path = os.path.join(model_dir, f'sac_rocket_{i+remaining}.zip')
-        model.save(checkpoint_path)
-        print(f"\nCheckpoint saved: {checkpoint_path}")
-    
-    # Save final model
-    final_model_path = os.path.join(model_dir, 'sac_rocket_final.zip')
-    model.save(final_model_path)
-    print(f"\nFinal model saved: {final_model_path}")
+            # Save model checkpoint
+            checkpoint_path = os.path.join(model_dir, f'sac_rocket_{i+remaining}.zip')
+            model.save(checkpoint_path)
+            print(f"\nCheckpoint saved: {checkpoint_path}")
+    
+        # Save final model
+        final_model_path = os.path.join(model_dir, 'sac_rocket_final.zip')
+        model.save(final_model_path)
+        print(f"\nFinal model saved: {final_model_path}")
+    finally:
+        # flush and close the logs even if training stops early (error or Ctrl+C)
+        callback.close_logs()
     
     # Plot training progress
     plot_training_results(log_file, graph_dir)
@@ -126,9 +164,9 @@ def train_sac():
     print("\n" + "=" * 50)
     print("Training Complete!")
     print("=" * 50)
-    print(f"Total Episodes: {len(callback.episode_rewards)}")
-    print(f"Average Reward (last 100): {np.mean(callback.episode_rewards[-100:]):.2f}")
-    print(f"Max Reward: {np.max(callback.episode_rewards):.2f}")
+    print(f"Total Episodes: {callback.reward_stats.count}")
+    print(f"Average Reward (last 100): {callback.reward_window.mean:.2f}")
+    print(f"Max Reward: {callback.reward_stats.max:.2f}")
     print(f"Models saved in: {model_dir}")
     print(f"Graphs saved in: {graph_dir}")
     print("=" * 50)
@@ -156,7 +194,7 @@ def plot_training_results(log_file, save_dir):
     
     # Calculate moving average
     window = min(20, len(rewards))
-    moving_avg = np.convolve(rewards, np.ones(window)/window, mode='valid')
+    moving_avg, _ = utils.windowed_curve(rewards, window)
     
     # Create figure with 2 subplots
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
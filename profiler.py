@@ -0,0 +1,89 @@
+import time
+
+
+class _NullPhase(object):
+    # stands in for every phase of a disabled PhaseTimer
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase(object):
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name):
+        self.timer, self.name, self.start = timer, name, 0.
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.timer.totals[self.name] += time.perf_counter() - self.start
+        self.timer.calls[self.name] += 1
+        return False
+
+
+class PhaseTimer(object):
+    """
+    Wall-clock time spent in each phase of a loop, plus its throughput.
+
+    Wrap every phase in `with timer.phase(name):` and count the env steps
+    with add_steps(). report() returns the figures of the window since the
+    previous report: steps/s, the share of the wall time spent in each
+    phase (the rest is 'other') and the mean milliseconds per call.
+
+    With enabled=False phase() returns a shared no-op context manager, so
+    the timers cost close to nothing, and only steps/s is reported.
+
+    """
+
+    def __init__(self, phases, enabled=True):
+        self.phase_names = list(phases)
+        self.enabled = enabled
+        self._phases = {name: _Phase(self, name) for name in self.phase_names}
+        self.total_steps = 0
+        self._reset_window(time.perf_counter())
+
+    def _reset_window(self, now):
+        self.window_start = now
+        self.steps = 0
+        self.totals = dict.fromkeys(self.phase_names, 0.)
+        self.calls = dict.fromkeys(self.phase_names, 0)
+
+    def phase(self, name):
+        if not self.enabled:
+            return _NULL_PHASE
+        phase = self._phases.get(name)
+        if phase is None:
+            raise NotImplementedError('phase [%s] is not found, please choose one from (%s)'
+                                      % (name, ', '.join(self.phase_names)))
+        return phase
+
+    def add_steps(self, n):
+        self.steps += n
+        self.total_steps += n
+
+    def report(self):
+        now = time.perf_counter()
+        elapsed = max(now - self.window_start, 1e-9)
+        report = {'elapsed': elapsed, 'steps': self.steps, 'steps_per_s': self.steps / elapsed}
+        if self.enabled:
+            report['percent'] = {name: 100. * self.totals[name] / elapsed for name in self.phase_names}
+            report['percent']['other'] = max(0., 100. - sum(report['percent'].values()))
+            report['ms_per_call'] = {name: 1000. * self.totals[name] / self.calls[name]
+                                     for name in self.phase_names if self.calls[name] > 0}
+        self._reset_window(now)
+        return report
+
+
+def format_report(report):
+    line = "steps/s : {:.0f}".format(report['steps_per_s'])
+    if 'percent' in report:
+        line += " \t " + ', '.join('{} {:.1f}%'.format(name, pct) for name, pct in report['percent'].items())
+    return line
@@ -0,0 +1,120 @@
+import multiprocessing as mp
+import os
+
+import numpy as np
+from matplotlib.figure import Figure
+
+import utils
+
+
+class ProgressCurve(object):
+    """
+    Moving average / std of the rewards in the CSV log written by train.py
+    (episode,timestep,reward). read() only parses rows appended since the
+    previous call and updates the window statistics incrementally.
+    """
+
+    def __init__(self, log_f_name, window_size=10):
+        self.log_f_name = log_f_name
+        self.offset = 0
+        self.window = utils.WindowedStats(window_size)
+        self.timesteps, self.rewards = [], []
+        self.mean, self.std = [], []
+
+    def read(self):
+        try:
+            with open(self.log_f_name, 'rb') as f:
+                f.seek(self.offset)
+                chunk = f.read()
+        except OSError:
+            return 0
+
+        # only consume complete lines, the trainer may be halfway through writing one
+        end = chunk.rfind(b'\n') + 1
+        self.offset += end
+        num_rows = 0
+        for line in chunk[:end].decode().splitlines():
+            parts = line.split(',')
+            try:
+                timestep, reward = int(parts[1]), float(parts[2])
+            except (IndexError, ValueError):
+                continue  # header
+            self.timesteps.append(timestep)
+            self.rewards.append(reward)
+            self.window.update(reward)
+            self.mean.append(self.window.mean)
+            self.std.append(self.window.std)
+            num_rows += 1
+        return num_rows
+
+
+def plot_progress(curve, graph_path):
+    # redraw the training curve, returns False if there is nothing to plot yet
+    if len(curve.rewards) == 0:
+        return False
+
+    timesteps = np.asarray(curve.timesteps)
+    window_size = curve.window.window
+
+    # Figure without pyplot: no GUI backend is touched, safe on headless servers
+    fig = Figure(figsize=(10, 6))
+    ax = fig.add_subplot(1, 1, 1)
+
+    if len(curve.rewards) >= window_size:
+        steps = timesteps[window_size-1:]
+        moving_avg = np.asarray(curve.mean[window_size-1:])
+        moving_std = np.asarray(curve.std[window_size-1:])
+
+        ax.plot(steps, moving_avg, label='Moving Average Reward')
+        ax.fill_between(steps, moving_avg - moving_std, moving_avg + moving_std,
+                        color='blue', alpha=0.2, label='Standard Deviation')
+        ax.set_title('Training Progress with Variability Shading')
+    else:
+        ax.plot(timesteps, curve.rewards, label='Average Reward')
+        ax.set_title('Training Progress')
+
+    ax.set_xlabel('Timestep')
+    ax.set_ylabel('Reward')
+    ax.legend()
+
+    graph_dir = os.path.dirname(graph_path)
+    if graph_dir and not os.path.exists(graph_dir):
+        os.makedirs(graph_dir)
+    # write to a temp file first so readers never see a half-written png
+    tmp_path = graph_path + '.tmp.png'
+    fig.savefig(tmp_path, dpi=150, bbox_inches='tight')
+    os.replace(tmp_path, graph_path)
+    return True
+
+
+def _plot_loop(log_f_name, graph_path, interval, window_size, stop_event):
+    curve = ProgressCurve(log_f_name, window_size)
+    while not stop_event.wait(interval):
+        if curve.read() > 0:
+            plot_progress(curve, graph_path)
+    curve.read()
+    plot_progress(curve, graph_path)
+
+
+class ProgressPlotter(object):
+    """
+    Live training curve drawn by a separate process.
+
+    The process reads the rows appended to the CSV log every interval
+    seconds and saves the plot to graph_path, so the training loop never
+    waits on matplotlib. stop() draws the final graph once more and joins
+    the process.
+
+    """
+
+    def __init__(self, log_f_name, graph_path, interval=30.0, window_size=10):
+        ctx = mp.get_context()
+        self.graph_path = graph_path
+        self.stop_event = ctx.Event()
+        self.process = ctx.Process(target=_plot_loop, daemon=True,
+                                   args=(log_f_name, graph_path, interval, window_size, self.stop_event))
+        self.process.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.process.join()
@@ -0,0 +1,72 @@
+import os
+import queue
+import threading
+
+import cv2
+
+
+class VideoRecorder(object):
+    """
+    Offscreen replacement for the cv2.imshow window of Rocket.render.
+
+    Frames (RGB arrays as returned by Rocket.render) are handed to a
+    background thread that encodes them into one video file per episode,
+    so the caller never waits on the encoder. With render_fn the caller
+    hands over whatever describes a frame (e.g. a copy of the rocket
+    state) and render_fn draws it on the background thread, so the
+    drawing is kept off the caller's loop too. When the queue is full new
+    frames are dropped rather than blocking the training loop.
+
+    """
+
+    def __init__(self, video_dir, fps=20, fourcc='mp4v', ext='.mp4', max_queue=512, render_fn=None):
+
+        self.video_dir = video_dir
+        self.fps = fps
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self.ext = ext
+        self.render_fn = render_fn
+        self.dropped_frames = 0
+
+        if not os.path.exists(video_dir):
+            os.makedirs(video_dir)
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        writer, path = None, None
+        while True:
+            cmd, arg = self.queue.get()
+            if cmd == 'frame' and path is not None:
+                if self.render_fn is not None:
+                    arg = self.render_fn(arg)
+                if writer is None:
+                    h, w = arg.shape[:2]
+                    writer = cv2.VideoWriter(path, self.fourcc, self.fps, (w, h))
+                writer.write(arg[:, :, ::-1])
+            elif cmd in ('open', 'end', 'close'):
+                if writer is not None:
+                    writer.release()
+                writer, path = None, None
+                if cmd == 'open':
+                    path = arg
+                elif cmd == 'close':
+                    break
+
+    def start_episode(self, name):
+        self.queue.put(('open', os.path.join(self.video_dir, name + self.ext)))
+
+    def add_frame(self, frame):
+        try:
+            self.queue.put_nowait(('frame', frame))
+        except queue.Full:
+            self.dropped_frames += 1
+
+    def end_episode(self):
+        self.queue.put(('end', None))
+
+    def close(self):
+        self.queue.put(('close', None))
+        self.thread.join()
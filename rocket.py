@@ -4,6 +4,9 @@ import cv2
 import utils
 import os
 
+import rocket_kernel
+from rocket_kernel import X, Y, VX, VY, THETA, VTHETA, T, PHI, F, ACTION, STATE_KEYS
+
 
 class Rocket(object):
     """
@@ -29,7 +32,9 @@ class Rocket(object):
     """
 
     def __init__(self, max_steps, task='hover', rocket_type='falcon',
-                 viewport_h=768, path_to_bg_img=None):
+                 viewport_h=768, path_to_bg_img=None,
+                 record_trajectory=True, trajectory_fields=None,
+                 integrator='explicit', substeps=1, action_repeat=1):
 
         self.task = task
         self.rocket_type = rocket_type
@@ -53,39 +58,64 @@ class Rocket(object):
         self.already_landing = False
         self.already_crash = False
         self.max_steps = max_steps
+        self.kernel_params = rocket_kernel.kernel_params(self)
+
+        # each dt is integrated in `substeps` substeps of `integrator` (explicit, semi_implicit, rk4),
+        # step() holds an action for `action_repeat` steps of dt and returns the summed reward
+        self.integrator = integrator
+        self.integrator_id = rocket_kernel.integrator_id(integrator)
+        self.substeps = int(substeps)
+        self.action_repeat = int(action_repeat)
 
         # viewport height x width (pixels)
         self.viewport_h = int(viewport_h)
         self.viewport_w = int(viewport_h * (self.world_x_max-self.world_x_min) \
                           / (self.world_y_max - self.world_y_min))
+        # world -> pixel transform (uniform scale about the world's lower-left corner, y flipped), see wd2pxl
+        self.pxl_scale = self.viewport_w / (self.world_x_max - self.world_x_min)
+        self.pxl_origin = np.array([self.world_x_min, self.world_y_min], dtype=np.float64)
         self.step_id = 0
 
         self.state = self.create_random_state()
         self.action_table = self.create_action_table()
+        self.rocket_template = self.create_rocket_template()
 
         self.state_dims = 8
         self.action_dims = len(self.action_table)
+        self.obs = np.zeros(self.state_dims, dtype=np.float32)  # reused by flatten
 
         if path_to_bg_img is None:
             # Get the directory where this script is located
             script_dir = os.path.dirname(os.path.abspath(__file__))
             path_to_bg_img = os.path.join(script_dir, task+'.jpg')
         self.bg_img = utils.load_bg_img(path_to_bg_img, w=self.viewport_w, h=self.viewport_h)
+        self.static_layer = None  # background + target region, composited on first render
 
-        self.state_buffer = []
+        # per-step record of the state vector (trajectory_fields = which entries, None = all),
+        # record_trajectory=False turns it off when nothing draws or inspects it
+        self.trajectory = utils.TrajectoryBuffer(max_steps, len(STATE_KEYS), trajectory_fields) \
+            if record_trajectory else None
+        self.window_open = False  # set once render(show=True) has opened a cv2 window
 
 
     def reset(self, state_dict=None):
 
+        # the state array is updated in place, state_dict can be a state vector or a dict with STATE_KEYS
         if state_dict is None:
-            self.state = self.create_random_state()
+            self.state[:] = self.create_random_state()
+        elif isinstance(state_dict, dict):
+            self.state[:] = [state_dict.get(key, 0) for key in STATE_KEYS]
         else:
-            self.state = state_dict
+            self.state[:] = state_dict
 
-        self.state_buffer = []
+        if self.trajectory is not None:
+            self.trajectory.clear()
         self.step_id = 0
         self.already_landing = False
-        cv2.destroyAllWindows()
+        # only tear down the window render() opened, headless OpenCV builds have no window support
+        if self.window_open:
+            cv2.destroyAllWindows()
+            self.window_open = False
         return self.flatten(self.state)
 
     def create_action_table(self):
@@ -128,19 +158,14 @@ class Rocket(object):
             theta = random.uniform(-45, 45) / 180 * np.pi
             vy = -10
 
-        state = {
-            'x': x, 'y': y, 'vx': 0, 'vy': vy,
-            'theta': theta, 'vtheta': 0,
-            'phi': 0, 'f': 0,
-            't': 0, 'a_': 0
-        }
+        state = np.zeros(len(STATE_KEYS), dtype=np.float64)
+        state[X], state[Y], state[VY], state[THETA] = x, y, vy, theta
 
         return state
 
     def check_crash(self, state):
         if self.task == 'hover':
-            x, y = state['x'], state['y']
-            theta = state['theta']
+            x, y, theta = state[X], state[Y], state[THETA]
             crash = False
             if y <= self.H / 2.0:
                 crash = True
@@ -149,10 +174,7 @@ class Rocket(object):
             return crash
 
         elif self.task == 'landing':
-            x, y = state['x'], state['y']
-            vx, vy = state['vx'], state['vy']
-            theta = state['theta']
-            vtheta = state['vtheta']
+            x, y, vx, vy, theta, vtheta = state[:VTHETA+1].tolist()
             v = (vx**2 + vy**2)**0.5
 
             crash = False
@@ -172,10 +194,7 @@ class Rocket(object):
         if self.task == 'hover':
             return False
         elif self.task == 'landing':
-            x, y = state['x'], state['y']
-            vx, vy = state['vx'], state['vy']
-            theta = state['theta']
-            vtheta = state['vtheta']
+            x, y, vx, vy, theta, vtheta = state[:VTHETA+1].tolist()
             v = (vx**2 + vy**2)**0.5
             return True if y <= 0 + self.H / 2.0 and v < 15.0 and abs(x) < self.target_r \
                            and abs(theta) < 10/180*np.pi and abs(vtheta) < 10/180*np.pi else False
@@ -184,18 +203,19 @@ class Rocket(object):
 
         x_range = self.world_x_max - self.world_x_min
         y_range = self.world_y_max - self.world_y_min
+        x, y, vx, vy, theta = state[:THETA+1].tolist()
 
         # dist between agent and target point
-        dist_x = abs(state['x'] - self.target_x)
-        dist_y = abs(state['y'] - self.target_y)
+        dist_x = abs(x - self.target_x)
+        dist_y = abs(y - self.target_y)
         dist_norm = dist_x / x_range + dist_y / y_range
 
         dist_reward = 0.1*(1.0 - dist_norm)
 
-        if abs(state['theta']) <= np.pi / 6.0:
+        if abs(theta) <= np.pi / 6.0:
             pose_reward = 0.1
         else:
-            pose_reward = abs(state['theta']) / (0.5*np.pi)
+            pose_reward = abs(theta) / (0.5*np.pi)
             pose_reward = 0.1 * (1.0 - pose_reward)
 
         reward = dist_reward + pose_reward
@@ -204,10 +224,10 @@ class Rocket(object):
             reward = 0.25
         if self.task == 'hover' and (dist_x**2 + dist_y**2)**0.5 <= 1*self.target_r:  # hit target
             reward = 0.5
-        if self.task == 'hover' and abs(state['theta']) > 90 / 180 * np.pi:
+        if self.task == 'hover' and abs(theta) > 90 / 180 * np.pi:
             reward = 0
 
-        v = (state['vx'] ** 2 + state['vy'] ** 2) ** 0.5
+        v = (vx ** 2 + vy ** 2) ** 0.5
         if self.task == 'landing' and self.already_crash:
             reward = (reward + 5*np.exp(-1*v/10.)) * (self.max_steps - self.step_id)
         if self.task == 'landing' and self.already_landing:
@@ -217,80 +237,60 @@ class Rocket(object):
 
     def step(self, action):
 
-        x, y, vx, vy = self.state['x'], self.state['y'], self.state['vx'], self.state['vy']
-        theta, vtheta = self.state['theta'], self.state['vtheta']
-        phi = self.state['phi']
+        x, y, vx, vy, theta, vtheta, _, phi = self.state[:PHI+1].tolist()
 
         f, vphi = self.action_table[action]
 
-        ft, fr = -f*np.sin(phi), f*np.cos(phi)
-        fx = ft*np.cos(theta) - fr*np.sin(theta)
-        fy = ft*np.sin(theta) + fr*np.cos(theta)
-
-        rho = 1 / (125/(self.g/2.0))**0.5  # suppose after 125 m free fall, then air resistance = mg
-        ax, ay = fx-rho*vx, fy-self.g-rho*vy
-        atheta = ft*self.H/2 / self.I
-
-        # update agent
-        if self.already_landing:
-            vx, vy, ax, ay, theta, vtheta, atheta = 0, 0, 0, 0, 0, 0, 0
-            phi, f = 0, 0
-            action = 0
-
-        self.step_id += 1
-        x_new = x + vx*self.dt + 0.5 * ax * (self.dt**2)
-        y_new = y + vy*self.dt + 0.5 * ay * (self.dt**2)
-        vx_new, vy_new = vx + ax * self.dt, vy + ay * self.dt
-        theta_new = theta + vtheta*self.dt + 0.5 * atheta * (self.dt**2)
-        vtheta_new = vtheta + atheta * self.dt
-        phi = phi + self.dt*vphi
-
-        phi = max(phi, -20/180*3.1415926)
-        phi = min(phi, 20/180*3.1415926)
-
-        self.state = {
-            'x': x_new, 'y': y_new, 'vx': vx_new, 'vy': vy_new,
-            'theta': theta_new, 'vtheta': vtheta_new,
-            'phi': phi, 'f': f,
-            't': self.step_id, 'action_': action
-        }
-        self.state_buffer.append(self.state)
+        total_reward = 0.
+        for _ in range(self.action_repeat):
 
-        self.already_landing = self.check_landing_success(self.state)
-        self.already_crash = self.check_crash(self.state)
-        reward = self.calculate_reward(self.state)
+            if self.already_landing:
+                action = 0
+            self.step_id += 1
+
+            # dynamics, check_landing_success, check_crash and calculate_reward in one call
+            # (compiled when numba is installed, see rocket_kernel)
+            x, y, vx, vy, theta, vtheta, phi, f, self.already_landing, self.already_crash, reward = \
+                rocket_kernel.step_kernel(x, y, vx, vy, theta, vtheta, phi, f, vphi, self.already_landing,
+                                          self.step_id, self.task == 'landing', self.integrator_id,
+                                          self.substeps, self.kernel_params)
+
+            self.state[:] = (x, y, vx, vy, theta, vtheta, self.step_id, phi, f, action)
+            if self.trajectory is not None:
+                self.trajectory.append(self.state)
+
+            total_reward += reward
+            if self.already_crash or self.already_landing or self.step_id >= self.max_steps:
+                break
 
         if self.already_crash or self.already_landing:
             done = True
         else:
             done = False
 
-        return self.flatten(self.state), reward, done, None
+        return self.flatten(self.state), total_reward, done, None
 
     def flatten(self, state):
-        x = [state['x'], state['y'], state['vx'], state['vy'],
-             state['theta'], state['vtheta'], state['t'],
-             state['phi']]
-        return np.array(x, dtype=np.float32)/100.
+        # written into self.obs, the returned array is overwritten by the next step / reset
+        self.obs[:] = state[:PHI+1]
+        self.obs /= 100.
+        return self.obs
 
     def render(self, window_name='env', wait_time=1,
                with_trajectory=True, with_camera_tracking=True,
-               crop_scale=0.4):
+               crop_scale=0.4, show=True):
+        # show=False skips the cv2 window (headless), the frames are only returned
 
-        canvas = np.copy(self.bg_img)
+        # background and target region come pre-composited
+        canvas = self.get_static_layer().copy()
         polys = self.create_polygons()
 
-        # draw target region
-        for poly in polys['target_region']:
-            self.draw_a_polygon(canvas, poly)
         # draw rocket
-        for poly in polys['rocket']:
-            self.draw_a_polygon(canvas, poly)
+        self.draw_polygons(canvas, polys['rocket'])
         frame_0 = canvas.copy()
 
         # draw engine work
-        for poly in polys['engine_work']:
-            self.draw_a_polygon(canvas, poly)
+        self.draw_polygons(canvas, polys['engine_work'])
         frame_1 = canvas.copy()
 
         if with_camera_tracking:
@@ -306,39 +306,67 @@ class Rocket(object):
         self.draw_text(frame_0, color=(0, 0, 0))
         self.draw_text(frame_1, color=(0, 0, 0))
 
-        cv2.imshow(window_name, frame_0[:,:,::-1])
-        cv2.waitKey(wait_time)
-        cv2.imshow(window_name, frame_1[:,:,::-1])
-        cv2.waitKey(wait_time)
+        if show:
+            self.window_open = True
+            cv2.imshow(window_name, frame_0[:,:,::-1])
+            cv2.waitKey(wait_time)
+            cv2.imshow(window_name, frame_1[:,:,::-1])
+            cv2.waitKey(wait_time)
         return frame_0, frame_1
 
-    def create_polygons(self):
+    def create_target_polygons(self):
 
-        polys = {'rocket': [], 'engine_work': [], 'target_region': []}
+        target_region = []
+        if self.task == 'hover':
+            pts1 = utils.create_rectangle_poly(center=(self.target_x, self.target_y), w=0, h=self.target_r/3.0)
+            pts2 = utils.create_rectangle_poly(center=(self.target_x, self.target_y), w=self.target_r/3.0, h=0)
+            target_region.append({'pts': pts1, 'face_color': None, 'edge_color': (242, 242, 242)})
+            target_region.append({'pts': pts2, 'face_color': None, 'edge_color': (242, 242, 242)})
+        else:
+            pts1 = utils.create_ellipse_poly(center=(0, 0), rx=self.target_r, ry=self.target_r/4.0)
+            pts2 = utils.create_rectangle_poly(center=(0, 0), w=self.target_r/3.0, h=0)
+            pts3 = utils.create_rectangle_poly(center=(0, 0), w=0, h=self.target_r/6.0)
+            target_region.append({'pts': pts1, 'face_color': None, 'edge_color': (242, 242, 242)})
+            target_region.append({'pts': pts2, 'face_color': None, 'edge_color': (242, 242, 242)})
+            target_region.append({'pts': pts3, 'face_color': None, 'edge_color': (242, 242, 242)})
+
+        return target_region
+
+    def get_static_layer(self):
+        # the background and target region never move: composite them once and reuse
+        if self.static_layer is None:
+            canvas = np.copy(self.bg_img)
+            self.draw_polygons(canvas, self.create_target_polygons())
+            self.static_layer = canvas
+        return self.static_layer
+
+    def create_rocket_template(self):
+        # body-frame geometry of the rocket, built once per rocket type: the vertices of all
+        # polygons packed into one (N, 2) array, polygon i is pts[offsets[i]:offsets[i+1]]
+
+        polys = []
 
         if self.rocket_type == 'falcon':
 
             H, W = self.H, self.H/10
-            dl = self.H / 30
 
             # rocket main body
             pts = [[-W/2, H/2], [W/2, H/2], [W/2, -H/2], [-W/2, -H/2]]
-            polys['rocket'].append({'pts': pts, 'face_color': (242, 242, 242), 'edge_color': None})
+            polys.append({'pts': pts, 'face_color': (242, 242, 242), 'edge_color': None})
             # rocket paint
             pts = utils.create_rectangle_poly(center=(0, -0.35*H), w=W, h=0.1*H)
-            polys['rocket'].append({'pts': pts, 'face_color': (42, 42, 42), 'edge_color': None})
+            polys.append({'pts': pts, 'face_color': (42, 42, 42), 'edge_color': None})
             pts = utils.create_rectangle_poly(center=(0, -0.46*H), w=W, h=0.02*H)
-            polys['rocket'].append({'pts': pts, 'face_color': (42, 42, 42), 'edge_color': None})
+            polys.append({'pts': pts, 'face_color': (42, 42, 42), 'edge_color': None})
             # rocket landing rack
             pts = [[-W/2, -H/2], [-W/2-H/10, -H/2-H/20], [-W/2, -H/2+H/20]]
-            polys['rocket'].append({'pts': pts, 'face_color': None, 'edge_color': (0, 0, 0)})
+            polys.append({'pts': pts, 'face_color': None, 'edge_color': (0, 0, 0)})
             pts = [[W/2, -H/2], [W/2+H/10, -H/2-H/20], [W/2, -H/2+H/20]]
-            polys['rocket'].append({'pts': pts, 'face_color': None, 'edge_color': (0, 0, 0)})
+            polys.append({'pts': pts, 'face_color': None, 'edge_color': (0, 0, 0)})
 
         elif self.rocket_type == 'starship':
 
             H, W = self.H, self.H / 2.6
-            dl = self.H / 30
 
             # rocket main body (right half)
             pts = np.array([[ 0.        ,  0.5006878 ],
@@ -349,9 +377,7 @@ class Rocket(object):
                            [ 0.2326389 ,  0.23796424],
                            [ 0.2326389 , -0.49931225],
                            [ 0.        , -0.49931225]], dtype=np.float32)
-            pts[:, 0] = pts[:, 0] * W
-            pts[:, 1] = pts[:, 1] * H
-            polys['rocket'].append({'pts': pts, 'face_color': (242, 242, 242), 'edge_color': None})
+            polys.append({'pts': pts, 'face_color': (242, 242, 242), 'edge_color': None})
 
             # rocket main body (left half)
             pts = np.array([[-0.        ,  0.5006878 ],
@@ -362,104 +388,114 @@ class Rocket(object):
                            [-0.2326389 ,  0.23796424],
                            [-0.2326389 , -0.49931225],
                            [-0.        , -0.49931225]], dtype=np.float32)
-            pts[:, 0] = pts[:, 0] * W
-            pts[:, 1] = pts[:, 1] * H
-            polys['rocket'].append({'pts': pts, 'face_color': (212, 212, 232), 'edge_color': None})
+            polys.append({'pts': pts, 'face_color': (212, 212, 232), 'edge_color': None})
 
             # upper wing (right)
             pts = np.array([[0.15972222, 0.3933975 ],
                            [0.3784722 , 0.303989  ],
                            [0.3784722 , 0.2352132 ],
                            [0.22916667, 0.23658872]], dtype=np.float32)
-            pts[:, 0] = pts[:, 0] * W
-            pts[:, 1] = pts[:, 1] * H
-            polys['rocket'].append({'pts': pts, 'face_color': (42, 42, 42), 'edge_color': None})
+            polys.append({'pts': pts, 'face_color': (42, 42, 42), 'edge_color': None})
 
             # upper wing (left)
             pts = np.array([[-0.15972222,  0.3933975 ],
                            [-0.3784722 ,  0.303989  ],
                            [-0.3784722 ,  0.2352132 ],
                            [-0.22916667,  0.23658872]], dtype=np.float32)
-            pts[:, 0] = pts[:, 0] * W
-            pts[:, 1] = pts[:, 1] * H
-            polys['rocket'].append({'pts': pts, 'face_color': (42, 42, 42), 'edge_color': None})
+            polys.append({'pts': pts, 'face_color': (42, 42, 42), 'edge_color': None})
 
             # lower wing (right)
             pts = np.array([[ 0.2326389 , -0.16368638],
                            [ 0.4548611 , -0.33562586],
                            [ 0.4548611 , -0.48555708],
                            [ 0.2638889 , -0.48555708]], dtype=np.float32)
-            pts[:, 0] = pts[:, 0] * W
-            pts[:, 1] = pts[:, 1] * H
-            polys['rocket'].append({'pts': pts, 'face_color': (100, 100, 100), 'edge_color': None})
+            polys.append({'pts': pts, 'face_color': (100, 100, 100), 'edge_color': None})
 
             # lower wing (left)
             pts = np.array([[-0.2326389 , -0.16368638],
                            [-0.4548611 , -0.33562586],
                            [-0.4548611 , -0.48555708],
                            [-0.2638889 , -0.48555708]], dtype=np.float32)
-            pts[:, 0] = pts[:, 0] * W
-            pts[:, 1] = pts[:, 1] * H
-            polys['rocket'].append({'pts': pts, 'face_color': (100, 100, 100), 'edge_color': None})
+            polys.append({'pts': pts, 'face_color': (100, 100, 100), 'edge_color': None})
+
+            # outlines are given in units of the rocket size
+            for poly in polys:
+                poly['pts'] = poly['pts'] * np.array([W, H], dtype=np.float32)
 
         else:
             raise NotImplementedError('rocket type [%s] is not found, please choose one '
                                       'from (falcon, starship)' % self.rocket_type)
 
-        # engine work
-        f, phi = self.state['f'], self.state['phi']
-        c, s = np.cos(phi), np.sin(phi)
+        # engine flame: up to 4 squares of side size*dl below the nozzle, the k-th one is
+        # pushed k*dl further along the nozzle direction (flame_dist), see create_polygons
+        dl = self.H / 30
+        flame_pts, flame_dist = [], []
+        for k, size in [(2, 1), (5, 1.5), (8, 2), (12, 3)]:
+            flame_pts.append(utils.create_rectangle_poly(center=(0, -self.H/2), w=size*dl, h=size*dl))
+            flame_dist.append([k*dl] * 4)
+
+        sizes = [len(poly['pts']) for poly in polys]
+        return {
+            'pts': np.concatenate([np.asarray(poly['pts'], dtype=np.float64) for poly in polys]),
+            'offsets': np.concatenate([[0], np.cumsum(sizes)]),
+            'colors': [(poly['face_color'], poly['edge_color']) for poly in polys],
+            'flame_pts': np.array(flame_pts, dtype=np.float64).reshape(-1, 2),
+            'flame_dist': np.array(flame_dist, dtype=np.float64).reshape(-1, 1),
+        }
+
+    def create_polygons(self):
+
+        template = self.rocket_template
 
+        # engine work: the number of flame squares grows with the thrust
+        f, phi = self.state[F], self.state[PHI]
         if f > 0 and f < 0.5 * self.g:
-            pts1 = utils.create_rectangle_poly(center=(2 * dl * s, -H / 2 - 2 * dl * c), w=dl, h=dl)
-            pts2 = utils.create_rectangle_poly(center=(5 * dl * s, -H / 2 - 5 * dl * c), w=1.5 * dl, h=1.5 * dl)
-            polys['engine_work'].append({'pts': pts1, 'face_color': (255, 255, 255), 'edge_color': None})
-            polys['engine_work'].append({'pts': pts2, 'face_color': (255, 255, 255), 'edge_color': None})
+            n_flames = 2
         elif f > 0.5 * self.g and f < 1.5 * self.g:
-            pts1 = utils.create_rectangle_poly(center=(2 * dl * s, -H / 2 - 2 * dl * c), w=dl, h=dl)
-            pts2 = utils.create_rectangle_poly(center=(5 * dl * s, -H / 2 - 5 * dl * c), w=1.5 * dl, h=1.5 * dl)
-            pts3 = utils.create_rectangle_poly(center=(8 * dl * s, -H / 2 - 8 * dl * c), w=2 * dl, h=2 * dl)
-            polys['engine_work'].append({'pts': pts1, 'face_color': (255, 255, 255), 'edge_color': None})
-            polys['engine_work'].append({'pts': pts2, 'face_color': (255, 255, 255), 'edge_color': None})
-            polys['engine_work'].append({'pts': pts3, 'face_color': (255, 255, 255), 'edge_color': None})
+            n_flames = 3
         elif f > 1.5 * self.g:
-            pts1 = utils.create_rectangle_poly(center=(2 * dl * s, -H / 2 - 2 * dl * c), w=dl, h=dl)
-            pts2 = utils.create_rectangle_poly(center=(5 * dl * s, -H / 2 - 5 * dl * c), w=1.5 * dl, h=1.5 * dl)
-            pts3 = utils.create_rectangle_poly(center=(8 * dl * s, -H / 2 - 8 * dl * c), w=2 * dl, h=2 * dl)
-            pts4 = utils.create_rectangle_poly(center=(12 * dl * s, -H / 2 - 12 * dl * c), w=3 * dl, h=3 * dl)
-            polys['engine_work'].append({'pts': pts1, 'face_color': (255, 255, 255), 'edge_color': None})
-            polys['engine_work'].append({'pts': pts2, 'face_color': (255, 255, 255), 'edge_color': None})
-            polys['engine_work'].append({'pts': pts3, 'face_color': (255, 255, 255), 'edge_color': None})
-            polys['engine_work'].append({'pts': pts4, 'face_color': (255, 255, 255), 'edge_color': None})
-        # target region
-        if self.task == 'hover':
-            pts1 = utils.create_rectangle_poly(center=(self.target_x, self.target_y), w=0, h=self.target_r/3.0)
-            pts2 = utils.create_rectangle_poly(center=(self.target_x, self.target_y), w=self.target_r/3.0, h=0)
-            polys['target_region'].append({'pts': pts1, 'face_color': None, 'edge_color': (242, 242, 242)})
-            polys['target_region'].append({'pts': pts2, 'face_color': None, 'edge_color': (242, 242, 242)})
+            n_flames = 4
         else:
-            pts1 = utils.create_ellipse_poly(center=(0, 0), rx=self.target_r, ry=self.target_r/4.0)
-            pts2 = utils.create_rectangle_poly(center=(0, 0), w=self.target_r/3.0, h=0)
-            pts3 = utils.create_rectangle_poly(center=(0, 0), w=0, h=self.target_r/6.0)
-            polys['target_region'].append({'pts': pts1, 'face_color': None, 'edge_color': (242, 242, 242)})
-            polys['target_region'].append({'pts': pts2, 'face_color': None, 'edge_color': (242, 242, 242)})
-            polys['target_region'].append({'pts': pts3, 'face_color': None, 'edge_color': (242, 242, 242)})
-
-        # apply transformation
-        for poly in polys['rocket'] + polys['engine_work']:
-            M = utils.create_pose_matrix(tx=self.state['x'], ty=self.state['y'], rz=self.state['theta'])
-            pts = np.array(poly['pts'])
-            pts = np.concatenate([pts, np.ones_like(pts)], axis=-1)  # attach z=1, w=1
-            pts = np.matmul(M, pts.T).T
-            poly['pts'] = pts[:, 0:2]
+            n_flames = 0
+        flame_dir = np.array([np.sin(phi), -np.cos(phi)])
+        flame_pts = template['flame_pts'][:4*n_flames] + template['flame_dist'][:4*n_flames] * flame_dir
+
+        # apply transformation: one 2D rotation + translation for all vertices
+        c, s = np.cos(self.state[THETA]), np.sin(self.state[THETA])
+        pts = np.concatenate([template['pts'], flame_pts])
+        pts = np.matmul(pts, np.array([[c, s], [-s, c]])) + np.array([self.state[X], self.state[Y]])
+
+        offsets = template['offsets']
+        polys = {'rocket': [], 'engine_work': []}
+        for (face_color, edge_color), i0, i1 in zip(template['colors'], offsets[:-1], offsets[1:]):
+            polys['rocket'].append({'pts': pts[i0:i1], 'face_color': face_color, 'edge_color': edge_color})
+        for i0 in range(offsets[-1], len(pts), 4):
+            polys['engine_work'].append({'pts': pts[i0:i0+4], 'face_color': (255, 255, 255), 'edge_color': None})
 
         return polys
 
 
-    def draw_a_polygon(self, canvas, poly):
+    def draw_a_polygon(self, canvas, poly, offset=(0, 0)):
+        # offset: pixel position of the canvas' top-left corner in the full viewport
+
+        pts_px = self.wd2pxl(poly['pts']) - np.array(offset, dtype=int)
+        return self.draw_a_polygon_px(canvas, pts_px, poly['face_color'], poly['edge_color'])
+
+
+    def draw_polygons(self, canvas, polys, offset=(0, 0)):
+        # like draw_a_polygon for a list of polygons, with a single world -> pixel transform for all of them
+
+        if len(polys) == 0:
+            return canvas
+        offset = np.array(offset, dtype=int)
+        for poly, pts_px in zip(polys, self.wd2pxl_batch([poly['pts'] for poly in polys])):
+            self.draw_a_polygon_px(canvas, pts_px - offset, poly['face_color'], poly['edge_color'])
+
+        return canvas
+
+
+    def draw_a_polygon_px(self, canvas, pts_px, face_color, edge_color):
 
-        pts, face_color, edge_color = poly['pts'], poly['face_color'], poly['edge_color']
-        pts_px = self.wd2pxl(pts)
         if face_color is not None:
             cv2.fillPoly(canvas, [pts_px], color=face_color, lineType=cv2.LINE_AA)
         if edge_color is not None:
@@ -469,22 +505,23 @@ class Rocket(object):
 
 
     def wd2pxl(self, pts, to_int=True):
+        # pts: array-like of world points (..., 2), all converted at once
 
-        pts_px = np.zeros_like(pts)
-
-        scale = self.viewport_w / (self.world_x_max - self.world_x_min)
-        for i in range(len(pts)):
-            pt = pts[i]
-            x_p = (pt[0] - self.world_x_min) * scale
-            y_p = (pt[1] - self.world_y_min) * scale
-            y_p = self.viewport_h - y_p
-            pts_px[i] = [x_p, y_p]
+        pts_px = (np.asarray(pts, dtype=np.float64) - self.pxl_origin) * self.pxl_scale
+        pts_px[..., 1] = self.viewport_h - pts_px[..., 1]
 
         if to_int:
             return pts_px.astype(int)
         else:
             return pts_px
 
+    def wd2pxl_batch(self, pts_list, to_int=True):
+        # many point sets (e.g. polygons) converted with one call: concatenate, transform, split back
+
+        sizes = [len(pts) for pts in pts_list]
+        pts = np.concatenate([np.asarray(pts, dtype=np.float64).reshape(-1, 2) for pts in pts_list])
+        return np.split(self.wd2pxl(pts, to_int=to_int), np.cumsum(sizes)[:-1])
+
     def draw_text(self, canvas, color=(255, 255, 0)):
 
         def put_text(vis, text, pt):
@@ -501,17 +538,17 @@ class Rocket(object):
 
         pt = (10, 60)
         text = "x: %.2f m, y: %.2f m" % \
-               (self.state['x'], self.state['y'])
+               (self.state[X], self.state[Y])
         put_text(canvas, text, pt)
 
         pt = (10, 80)
         text = "vx: %.2f m/s, vy: %.2f m/s" % \
-               (self.state['vx'], self.state['vy'])
+               (self.state[VX], self.state[VY])
         put_text(canvas, text, pt)
 
         pt = (10, 100)
         text = "a: %.2f degree, va: %.2f degree/s" % \
-               (self.state['theta'] * 180 / np.pi, self.state['vtheta'] * 180 / np.pi)
+               (self.state[THETA] * 180 / np.pi, self.state[VTHETA] * 180 / np.pi)
         put_text(canvas, text, pt)
 
 
@@ -522,39 +559,26 @@ class Rocket(object):
 
         sw, sh = pannel_w/self.viewport_w, pannel_h/self.viewport_h  # scale factors
 
-        # draw horizon line
+        # draw horizon line and vertical line
         range_x, range_y = self.world_x_max - self.world_x_min, self.world_y_max - self.world_y_min
-        pts = [[self.world_x_min + range_x/3, self.H/2], [self.world_x_max - range_x/3, self.H/2]]
-        pts_px = self.wd2pxl(pts)
-        x1, y1 = int(pts_px[0][0]*sw), int(pts_px[0][1]*sh)
-        x2, y2 = int(pts_px[1][0]*sw), int(pts_px[1][1]*sh)
-        cv2.line(traj_pannel, pt1=(x1, y1), pt2=(x2, y2),
+        pts = [[self.world_x_min + range_x/3, self.H/2], [self.world_x_max - range_x/3, self.H/2],
+               [0, self.H/2], [0, self.H/2+range_y/20]]
+        pts_px = (self.wd2pxl(pts) * [sw, sh]).astype(int)
+        cv2.line(traj_pannel, pt1=tuple(pts_px[0]), pt2=tuple(pts_px[1]),
                  color=(0, 0, 0), thickness=1, lineType=cv2.LINE_AA)
-
-        # draw vertical line
-        pts = [[0, self.H/2], [0, self.H/2+range_y/20]]
-        pts_px = self.wd2pxl(pts)
-        x1, y1 = int(pts_px[0][0]*sw), int(pts_px[0][1]*sh)
-        x2, y2 = int(pts_px[1][0]*sw), int(pts_px[1][1]*sh)
-        cv2.line(traj_pannel, pt1=(x1, y1), pt2=(x2, y2),
+        cv2.line(traj_pannel, pt1=tuple(pts_px[2]), pt2=tuple(pts_px[3]),
                  color=(0, 0, 0), thickness=1, lineType=cv2.LINE_AA)
 
-        if len(self.state_buffer) < 2:
+        traj = self.trajectory
+        if traj is None or len(traj) < 2 or X not in traj.fields or Y not in traj.fields:
             return
 
-        # draw traj
-        pts = []
-        for state in self.state_buffer:
-            pts.append([state['x'], state['y']])
-        pts_px = self.wd2pxl(pts)
-
+        # draw traj (every dn-th point)
         dn = 5
-        for i in range(0, len(pts_px)-dn, dn):
-
-            x1, y1 = int(pts_px[i][0]*sw), int(pts_px[i][1]*sh)
-            x1_, y1_ = int(pts_px[i+dn][0]*sw), int(pts_px[i+dn][1]*sh)
-
-            cv2.line(traj_pannel, pt1=(x1, y1), pt2=(x1_, y1_), color=color, thickness=2, lineType=cv2.LINE_AA)
+        pts = np.stack([traj.column(X)[::dn], traj.column(Y)[::dn]], axis=1)
+        pts_px = (self.wd2pxl(pts) * [sw, sh]).astype(int)
+        for i in range(len(pts_px) - 1):
+            cv2.line(traj_pannel, pt1=tuple(pts_px[i]), pt2=tuple(pts_px[i+1]), color=color, thickness=2, lineType=cv2.LINE_AA)
 
         roi_x1, roi_x2 = self.viewport_w - 10 - pannel_w, self.viewport_w - 10
         roi_y1, roi_y2 = 10, 10 + pannel_h
@@ -562,8 +586,8 @@ class Rocket(object):
 
 
 
-    def crop_alongwith_camera(self, vis, crop_scale=0.4):
-        x, y = self.state['x'], self.state['y']
+    def camera_crop_box(self, crop_scale=0.4):
+        x, y = self.state[X], self.state[Y]
         xp, yp = self.wd2pxl([[x, y]])[0]
         crop_w_half, crop_h_half = int(self.viewport_w*crop_scale), int(self.viewport_h*crop_scale)
         # check boundary
@@ -576,9 +600,33 @@ class Rocket(object):
         if yp >= self.viewport_h - crop_h_half - 1:
             yp = self.viewport_h - crop_h_half - 1
 
-        x1, x2, y1, y2 = xp-crop_w_half, xp+crop_w_half, yp-crop_h_half, yp+crop_h_half
+        return xp-crop_w_half, xp+crop_w_half, yp-crop_h_half, yp+crop_h_half
+
+    def crop_alongwith_camera(self, vis, crop_scale=0.4):
+        x1, x2, y1, y2 = self.camera_crop_box(crop_scale=crop_scale)
         vis = vis[y1:y2, x1:x2, :]
 
         vis = cv2.resize(vis, (self.viewport_w, self.viewport_h))
         return vis
 
+    def render_offscreen(self, with_trajectory=True, with_camera_tracking=True,
+                         crop_scale=0.4):
+        # one RGB frame (rocket with engine flame), no cv2 window involved;
+        # only the rocket and flame are drawn on top of the cached static layer,
+        # and with camera tracking only the cropped region is copied and drawn
+        if with_camera_tracking:
+            x1, x2, y1, y2 = self.camera_crop_box(crop_scale=crop_scale)
+        else:
+            x1, x2, y1, y2 = 0, self.viewport_w, 0, self.viewport_h
+        canvas = self.get_static_layer()[y1:y2, x1:x2].copy()
+
+        polys = self.create_polygons()
+        self.draw_polygons(canvas, polys['rocket'] + polys['engine_work'], offset=(x1, y1))
+
+        if with_camera_tracking:
+            canvas = cv2.resize(canvas, (self.viewport_w, self.viewport_h))
+
+        if with_trajectory:
+            self.draw_trajectory(canvas)
+        self.draw_text(canvas, color=(0, 0, 0))
+        return canvas
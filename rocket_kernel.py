@@ -0,0 +1,190 @@
+import math
+
+# Numba is optional: with it the kernels below are compiled to machine code,
+# without it they run as plain Python (still avoiding NumPy ufuncs on floats)
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda fn: fn
+
+
+# layout of the rocket state vector (Rocket.state), the first 8 entries are the observation
+X, Y, VX, VY, THETA, VTHETA, T, PHI, F, ACTION = range(10)
+STATE_KEYS = ('x', 'y', 'vx', 'vy', 'theta', 'vtheta', 't', 'phi', 'f', 'action_')
+
+
+def kernel_params(env):
+    # constants of a Rocket / BatchRocket packed in the order step_kernel expects
+    return (float(env.g), float(env.H), float(env.I), float(env.dt), 1 / (125/(env.g/2.0))**0.5,
+            float(env.world_y_max), float(env.world_x_max - env.world_x_min),
+            float(env.world_y_max - env.world_y_min), float(env.target_x), float(env.target_y),
+            float(env.target_r), float(env.max_steps))
+
+
+# integrators of the rocket dynamics, see integrate()
+EXPLICIT, SEMI_IMPLICIT, RK4 = range(3)
+INTEGRATORS = ('explicit', 'semi_implicit', 'rk4')
+
+
+def integrator_id(name):
+    if name not in INTEGRATORS:
+        raise NotImplementedError('integrator [%s] is not found, please choose one '
+                                  'from (explicit, semi_implicit, rk4)' % name)
+    return INTEGRATORS.index(name)
+
+
+@njit(cache=True)
+def accelerations(vx, vy, theta, phi, f, params):
+    # linear and angular acceleration for thrust f at nozzle angle phi, with drag rho*v
+    g, H, I, dt, rho = params[0], params[1], params[2], params[3], params[4]
+
+    ft, fr = -f*math.sin(phi), f*math.cos(phi)
+    fx = ft*math.cos(theta) - fr*math.sin(theta)
+    fy = ft*math.sin(theta) + fr*math.cos(theta)
+
+    return fx-rho*vx, fy-g-rho*vy, ft*H/2 / I
+
+
+@njit(cache=True)
+def integrate(x, y, vx, vy, theta, vtheta, phi, f, vphi, already_landing, integrator, substeps, params):
+    """
+    Advance one rocket by one control step (params dt) split into `substeps`
+    substeps of the given integrator; thrust f is held and the nozzle turns
+    at vphi. EXPLICIT is the original constant-acceleration update
+    (x += v*dt + a*dt^2/2, v += a*dt), SEMI_IMPLICIT updates v first and
+    moves x with the new v, RK4 is the classical 4th order Runge-Kutta.
+    Returns (x, y, vx, vy, theta, vtheta, phi, f).
+    """
+    dt = params[3] / substeps
+
+    # a rocket that already landed stays where it is
+    if already_landing:
+        vx, vy, theta, vtheta = 0., 0., 0., 0.
+        phi, f = 0., 0.
+
+    for _ in range(substeps):
+        if already_landing:
+            pass
+        elif integrator == EXPLICIT:
+            ax, ay, atheta = accelerations(vx, vy, theta, phi, f, params)
+            x = x + vx*dt + 0.5 * ax * (dt**2)
+            y = y + vy*dt + 0.5 * ay * (dt**2)
+            vx, vy = vx + ax * dt, vy + ay * dt
+            theta, vtheta = theta + vtheta*dt + 0.5 * atheta * (dt**2), vtheta + atheta * dt
+        elif integrator == SEMI_IMPLICIT:
+            ax, ay, atheta = accelerations(vx, vy, theta, phi, f, params)
+            vx, vy, vtheta = vx + ax * dt, vy + ay * dt, vtheta + atheta * dt
+            x, y, theta = x + vx * dt, y + vy * dt, theta + vtheta * dt
+        else:
+            # the nozzle keeps turning during the substep, evaluate it at the stage times
+            phi_mid = min(max(phi + 0.5*dt*vphi, -20/180*3.1415926), 20/180*3.1415926)
+            phi_end = min(max(phi + dt*vphi, -20/180*3.1415926), 20/180*3.1415926)
+            ax1, ay1, at1 = accelerations(vx, vy, theta, phi, f, params)
+            vx2, vy2, vt2 = vx + 0.5*dt*ax1, vy + 0.5*dt*ay1, vtheta + 0.5*dt*at1
+            ax2, ay2, at2 = accelerations(vx2, vy2, theta + 0.5*dt*vtheta, phi_mid, f, params)
+            vx3, vy3, vt3 = vx + 0.5*dt*ax2, vy + 0.5*dt*ay2, vtheta + 0.5*dt*at2
+            ax3, ay3, at3 = accelerations(vx3, vy3, theta + 0.5*dt*vt2, phi_mid, f, params)
+            vx4, vy4, vt4 = vx + dt*ax3, vy + dt*ay3, vtheta + dt*at3
+            ax4, ay4, at4 = accelerations(vx4, vy4, theta + dt*vt3, phi_end, f, params)
+            x = x + dt/6 * (vx + 2*vx2 + 2*vx3 + vx4)
+            y = y + dt/6 * (vy + 2*vy2 + 2*vy3 + vy4)
+            theta = theta + dt/6 * (vtheta + 2*vt2 + 2*vt3 + vt4)
+            vx = vx + dt/6 * (ax1 + 2*ax2 + 2*ax3 + ax4)
+            vy = vy + dt/6 * (ay1 + 2*ay2 + 2*ay3 + ay4)
+            vtheta = vtheta + dt/6 * (at1 + 2*at2 + 2*at3 + at4)
+
+        phi = phi + dt*vphi
+        phi = max(phi, -20/180*3.1415926)
+        phi = min(phi, 20/180*3.1415926)
+
+    return x, y, vx, vy, theta, vtheta, phi, f
+
+
+@njit(cache=True)
+def step_kernel(x, y, vx, vy, theta, vtheta, phi, f, vphi, already_landing, step_id, landing_task,
+                integrator, substeps, params):
+    """
+    One step of one rocket: integrate() followed by
+    Rocket.check_landing_success, Rocket.check_crash and
+    Rocket.calculate_reward, evaluated in the same order and with the same
+    arithmetic. step_id is the already incremented step counter. Returns
+    (x, y, vx, vy, theta, vtheta, phi, f, landing, crash, reward).
+    """
+    g, H, I, dt, rho, world_y_max, x_range, y_range, target_x, target_y, target_r, max_steps = params
+
+    x, y, vx, vy, theta, vtheta, phi, f = integrate(x, y, vx, vy, theta, vtheta, phi, f, vphi,
+                                                    already_landing, integrator, substeps, params)
+
+    v = (vx**2 + vy**2)**0.5
+    on_ground = y <= 0 + H / 2.0
+    upright = abs(theta) < 10/180*math.pi and abs(vtheta) < 10/180*math.pi
+
+    # check_landing_success / check_crash
+    if landing_task:
+        landing = on_ground and v < 15.0 and abs(x) < target_r and upright
+        crash = y >= world_y_max - H / 2.0 or (on_ground and (v >= 15.0 or abs(x) >= target_r or not upright))
+    else:
+        landing = False
+        crash = y <= H / 2.0 or y >= world_y_max - H / 2.0
+
+    # calculate_reward
+    dist_x = abs(x - target_x)
+    dist_y = abs(y - target_y)
+    dist_norm = dist_x / x_range + dist_y / y_range
+    dist_reward = 0.1*(1.0 - dist_norm)
+
+    if abs(theta) <= math.pi / 6.0:
+        pose_reward = 0.1
+    else:
+        pose_reward = abs(theta) / (0.5*math.pi)
+        pose_reward = 0.1 * (1.0 - pose_reward)
+
+    reward = dist_reward + pose_reward
+
+    if landing_task:
+        if crash:
+            reward = (reward + 5*math.exp(-1*v/10.)) * (max_steps - step_id)
+        if landing:
+            reward = (1.0 + 5*math.exp(-1*v/10.))*(max_steps - step_id)
+    else:
+        dist = (dist_x**2 + dist_y**2)**0.5
+        if dist <= 2*target_r:  # hit target
+            reward = 0.25
+        if dist <= 1*target_r:  # hit target
+            reward = 0.5
+        if abs(theta) > 90 / 180 * math.pi:
+            reward = 0.
+
+    return x, y, vx, vy, theta, vtheta, phi, f, landing, crash, reward
+
+
+@njit(cache=True)
+def step_batch_kernel(x, y, vx, vy, theta, vtheta, phi, f, step_id, already_landing, already_crash,
+                      thrust, vphi, landing_task, integrator, substeps, action_repeat, params, reward):
+    """
+    step_kernel over N rockets held as structure-of-arrays (BatchRocket),
+    updated in place. Each action is held for up to action_repeat steps, a
+    rocket stops early once it lands, crashes or reaches max_steps; reward
+    receives the sum over the repeated steps.
+    """
+    max_steps = params[11]
+    for i in range(len(x)):
+        total = 0.
+        for _ in range(action_repeat):
+            step_id[i] += 1
+            xi, yi, vxi, vyi, thetai, vthetai, phii, fi, landing, crash, r = step_kernel(
+                x[i], y[i], vx[i], vy[i], theta[i], vtheta[i], phi[i], thrust[i], vphi[i],
+                already_landing[i], step_id[i], landing_task, integrator, substeps, params)
+            x[i], y[i], vx[i], vy[i] = xi, yi, vxi, vyi
+            theta[i], vtheta[i], phi[i], f[i] = thetai, vthetai, phii, fi
+            already_landing[i], already_crash[i] = landing, crash
+            total += r
+            if landing or crash or step_id[i] >= max_steps:
+                break
+        reward[i] = total
@@ -2,10 +2,10 @@ import os
 import time
 from datetime import datetime
 
-import torch
 import numpy as np
 
-from PPO import PPO  # Assuming PPO is your policy class
+import evaluator
+from numpy_policy import NumpyPolicy, export_actor
 from rocket import Rocket  # Import your Rocket environment class
 
 #################################### Testing ###################################
@@ -19,10 +19,15 @@ def test():
     has_continuous_action_space = False
     max_ep_len = 1000           # Max timesteps in one episode
 
-    render = True               # Render environment on screen
+    render = True               # Replay some episodes on screen after the evaluation
     frame_delay = 1             # Delay between frames (in seconds)
+    render_episodes = 3         # Number of rendered episodes
 
-    total_test_episodes = 10    # Total number of testing episodes
+    total_test_episodes = 2000  # Total number of (seeded) evaluation episodes
+    num_workers = 4             # Evaluation processes
+    envs_per_worker = 250       # Rockets simulated at once by each process
+    eval_seed = 0               # Seed of the evaluation episodes
+    use_numpy_policy = True     # Replay with the NumPy actor (the evaluation always uses it), torch is not imported
 
     K_epochs = 80               # Update policy for K epochs
     eps_clip = 0.2              # Clip parameter for PPO
@@ -39,26 +44,52 @@ def test():
     state_dim = env.state_dims
     action_dim = env.action_dims
 
-    # Initialize a PPO agent
-    ppo_agent = PPO(state_dim, action_dim, lr_actor, lr_critic, gamma, K_epochs, eps_clip, has_continuous_action_space)
-
     # Pretrained weights directory
     random_seed = 0             # Set this to load a specific checkpoint trained on a random seed
     run_num_pretrained = 13      # Set this to load a specific checkpoint number
 
     directory = "PPO_preTrained" + '/' + env_name + '/'
     checkpoint_path = directory + "PPO_{}_{}_{}.pth".format(env_name, random_seed, run_num_pretrained)
-    print("loading network from : " + checkpoint_path)
 
-    # Load pretrained model
-    ppo_agent.load(checkpoint_path)
+    npz_path = os.path.splitext(checkpoint_path)[0] + '.npz'
+    # re-exported whenever the checkpoint is newer, a stale .npz would run the old weights;
+    # a shipped .npz alone is enough (the .pth, and torch, are then never touched)
+    if os.path.exists(checkpoint_path):
+        if not os.path.exists(npz_path) or os.path.getmtime(checkpoint_path) > os.path.getmtime(npz_path):
+            print("exporting actor weights to : " + npz_path)
+            export_actor(checkpoint_path, npz_path, has_continuous_action_space)
+    elif not os.path.exists(npz_path):
+        raise FileNotFoundError('neither the checkpoint [%s] nor its exported actor [%s] is found'
+                                % (checkpoint_path, npz_path))
+
+    if use_numpy_policy:
+        print("loading network from : " + npz_path)
+        ppo_agent = NumpyPolicy(npz_path)
+    else:
+        from PPO import PPO
+
+        # Initialize a PPO agent
+        ppo_agent = PPO(state_dim, action_dim, lr_actor, lr_critic, gamma, K_epochs, eps_clip, has_continuous_action_space)
+        print("loading network from : " + checkpoint_path)
+
+        # Load pretrained model
+        ppo_agent.load(checkpoint_path)
 
     print("--------------------------------------------------------------------------------------------")
 
-    test_running_reward = 0
-    
-    
-    for ep in range(1, total_test_episodes + 1):
+    # Batched evaluation over a process pool: success rate, crash causes, touchdown speed, lengths
+    start_time = time.time()
+    summary = evaluator.evaluate(npz_path, num_episodes=total_test_episodes, task=task, max_steps=max_ep_len,
+                                 num_workers=num_workers, envs_per_worker=envs_per_worker, seed=eval_seed)
+    print(evaluator.format_report(summary))
+    print("evaluation time : {:.1f}s".format(time.time() - start_time))
+
+    print("============================================================================================")
+
+    if not render:
+        return
+
+    for ep in range(1, render_episodes + 1):
         ep_reward = 0
         state = env.reset()
 
@@ -67,25 +98,17 @@ def test():
             state, reward, done, _ = env.step(action)
             ep_reward += reward
 
-            if render:
-                env.render(window_name="Rocket Test", wait_time=frame_delay)  # Adjust for Rocket render method
+            env.render(window_name="Rocket Test", wait_time=frame_delay)  # Adjust for Rocket render method
 
             if done:
                 break
 
         # Clear PPO agent buffer after each episode
-        ppo_agent.buffer.clear()
+        if not use_numpy_policy:
+            ppo_agent.buffer.clear()
 
-        test_running_reward += ep_reward
         print('Episode: {} \t\t Reward: {}'.format(ep, round(ep_reward, 2)))
 
-    env.close()
-
-    print("============================================================================================")
-
-    avg_test_reward = test_running_reward / total_test_episodes
-    print("average test reward : " + str(round(avg_test_reward, 2)))
-
     print("============================================================================================")
 
 
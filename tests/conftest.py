@@ -0,0 +1,17 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+# the modules are flat scripts at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def bg_img(tmp_path_factory):
+    # Rocket loads a background image on construction, a blank one is enough here
+    path = str(tmp_path_factory.mktemp('img') / 'bg.jpg')
+    cv2.imwrite(path, np.full((64, 64, 3), 255, dtype=np.uint8))
+    return path
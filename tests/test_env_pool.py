@@ -0,0 +1,44 @@
+import numpy as np
+
+from batch_rocket import BatchRocket
+from env_pool import RocketEnvPool
+
+
+def test_pool_auto_reset_and_outcomes():
+    workers, per_worker, max_steps, seed = 2, 3, 60, 7
+    pool = RocketEnvPool(workers, per_worker, max_steps=max_steps, task='landing', seed=seed)
+    # the same rockets, stepped in this process: worker k simulates seed + k
+    refs = [BatchRocket(per_worker, max_steps, task='landing', seed=seed + k) for k in range(workers)]
+    try:
+        obs = pool.reset()
+        np.testing.assert_array_equal(obs, np.concatenate([ref.reset() for ref in refs]))
+        rng = np.random.default_rng(0)
+        num_ended = 0
+        for _ in range(3 * max_steps):
+            actions = rng.integers(0, 9, pool.num_envs)
+            obs, rewards, dones, truncated = pool.step(actions)
+
+            steps = [ref.step(actions[k*per_worker:(k+1)*per_worker]) for k, ref in enumerate(refs)]
+            step_obs = np.concatenate([s[0] for s in steps])
+            np.testing.assert_array_equal(rewards, np.concatenate([s[1] for s in steps]))
+            np.testing.assert_array_equal(dones, np.concatenate([s[2] for s in steps]))
+            step_id = np.concatenate([ref.step_id for ref in refs])
+            landed = np.concatenate([ref.already_landing for ref in refs])
+            np.testing.assert_array_equal(truncated, (step_id >= max_steps) & ~dones)
+
+            ended = dones | truncated
+            assert not (dones & truncated).any()
+            np.testing.assert_array_equal(pool.final_obs, step_obs)
+            np.testing.assert_array_equal(pool.episode_length, step_id)
+            np.testing.assert_array_equal(pool.landed, landed)
+            assert np.isnan(pool.touchdown_speed[truncated]).all()
+            assert (pool.touchdown_speed[landed] >= 0).all()
+
+            # finished rockets come back as the first observation of a new episode
+            resets = np.concatenate([ref.reset(ended[k*per_worker:(k+1)*per_worker]) for k, ref in enumerate(refs)])
+            np.testing.assert_array_equal(obs, resets)
+            np.testing.assert_array_equal(np.concatenate([ref.step_id for ref in refs])[ended], 0)
+            num_ended += ended.sum()
+        assert num_ended >= pool.num_envs
+    finally:
+        pool.close()
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+import rocket_kernel
+from batch_rocket import BatchRocket
+from rocket import Rocket
+
+INTEGRATORS = ['explicit', 'semi_implicit', 'rk4']
+
+
+@pytest.mark.skipif(not rocket_kernel.HAS_NUMBA, reason='numba is not installed')
+@pytest.mark.parametrize('task', ['landing', 'hover'])
+@pytest.mark.parametrize('integrator', INTEGRATORS)
+@pytest.mark.parametrize('substeps, action_repeat', [(1, 1), (4, 3)])
+def test_kernel_matches_numpy(task, integrator, substeps, action_repeat):
+    kw = dict(task=task, seed=1, integrator=integrator, substeps=substeps, action_repeat=action_repeat)
+    kernel = BatchRocket(64, 300, use_kernel=True, **kw)
+    numpy = BatchRocket(64, 300, use_kernel=False, **kw)
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        actions = rng.integers(0, kernel.action_dims, kernel.num_envs)
+        obs_k, reward_k, done_k, _ = kernel.step(actions)
+        obs_n, reward_n, done_n, _ = numpy.step(actions)
+        np.testing.assert_allclose(obs_k, obs_n, rtol=1e-5, atol=1e-5)
+        np.testing.assert_allclose(reward_k, reward_n, rtol=1e-9, atol=1e-9)
+        np.testing.assert_array_equal(done_k, done_n)
+        np.testing.assert_array_equal(kernel.step_id, numpy.step_id)
+        ended = done_k | (kernel.step_id >= 300)
+        kernel.reset(ended)
+        numpy.reset(ended)
+
+
+@pytest.mark.parametrize('task', ['landing', 'hover'])
+@pytest.mark.parametrize('integrator', INTEGRATORS)
+@pytest.mark.parametrize('substeps, action_repeat', [(1, 1), (4, 3)])
+def test_batch_matches_rocket_step(bg_img, task, integrator, substeps, action_repeat):
+    kw = dict(task=task, integrator=integrator, substeps=substeps, action_repeat=action_repeat)
+    env = Rocket(300, path_to_bg_img=bg_img, **kw)
+    batch = BatchRocket(1, 300, seed=1, use_kernel=False, **kw)
+    env.reset(np.array([batch.x[0], batch.y[0], batch.vx[0], batch.vy[0], batch.theta[0], 0, 0, 0, 0, 0]))
+    for t in range(300):
+        action = (t * 5) % env.action_dims
+        obs, reward, done, _ = env.step(action)
+        obs_b, reward_b, done_b, _ = batch.step([action])
+        np.testing.assert_allclose(obs, obs_b[0], rtol=1e-6, atol=1e-6)
+        assert reward == pytest.approx(reward_b[0], rel=1e-9, abs=1e-9)
+        assert done == done_b[0] and env.step_id == batch.step_id[0]
+        if done or env.step_id >= 300:
+            break
+
+
+def test_unknown_integrator(bg_img):
+    with pytest.raises(NotImplementedError):
+        Rocket(10, integrator='verlet', path_to_bg_img=bg_img)
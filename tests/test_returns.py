@@ -0,0 +1,36 @@
+import numpy as np
+import torch
+
+from PPO import discounted_returns, gae_advantages
+
+
+def _rollout(T=64, num_envs=4, seed=0):
+    rng = np.random.default_rng(seed)
+    rewards = torch.tensor(rng.normal(size=(T, num_envs)))
+    values = torch.tensor(rng.normal(size=(T, num_envs)))
+    is_terminals = torch.tensor(rng.random((T, num_envs)) < 0.05)
+    truncated = torch.tensor(rng.random((T, num_envs)) < 0.05) & ~is_terminals
+    final_values = torch.tensor(rng.normal(size=(T, num_envs))) * truncated
+    # every episode ends inside the rollout, the Monte Carlo returns have no tail to bootstrap
+    is_terminals[-1] = True
+    truncated[-1] = False
+    return rewards, values, is_terminals, truncated, final_values
+
+
+def test_gae_lambda_one_is_monte_carlo():
+    rewards, values, is_terminals, truncated, final_values = _rollout()
+    returns = discounted_returns(rewards, is_terminals, 0.99, truncated, final_values)
+    advantages, targets = gae_advantages(rewards, values, is_terminals, torch.zeros(values.shape[1]),
+                                         0.99, 1.0, truncated, final_values)
+    torch.testing.assert_close(advantages, returns - values)
+    torch.testing.assert_close(targets, returns)
+
+
+def test_returns_stop_at_episode_ends():
+    rewards = torch.ones(4, 1, dtype=torch.float64)
+    is_terminals = torch.tensor([[False], [True], [False], [True]])
+    truncated = torch.tensor([[True], [False], [False], [False]])
+    final_values = torch.tensor([[10.], [0.], [0.], [0.]], dtype=torch.float64)
+    returns = discounted_returns(rewards, is_terminals, 0.5, truncated, final_values)
+    # row 0 is cut off by the time limit and bootstraps from its final value, not from row 1
+    torch.testing.assert_close(returns[:, 0], torch.tensor([6., 1., 1.5, 1.], dtype=torch.float64))
@@ -4,12 +4,48 @@ from datetime import datetime
 
 import torch
 import numpy as np
-
-from PPO import PPO  # Assuming PPO is your policy class
-from rocket import Rocket  # Import your Rocket environment class
+from torch.utils.tensorboard import SummaryWriter
+
+from PPO import PPO, device_name  # Assuming PPO is your policy class
+from rocket import Rocket, T, PHI, F, ACTION  # Import your Rocket environment class
+from env_pool import RocketEnvPool
+from recorder import VideoRecorder
+from progress_plotter import ProgressPlotter
+from evaluator import CheckpointEvaluator
+from metrics_logger import MetricsLogger
+from profiler import PhaseTimer
+from live_plot import update_live_plot
+import checkpoint
+import metrics_logger
+import profiler
+import utils
 
 import matplotlib.pyplot as plt
 
+
+def crossed(time_step, freq, step_size):
+    # True if the last step_size timesteps went past a multiple of freq
+    return time_step // freq > (time_step - step_size) // freq
+
+
+def mirror_state(env, state, action):
+    # copy one rocket of the env pool into a local Rocket so that it can be rendered
+    t = int(round(float(state[T]) * 100.))
+    if t <= env.step_id:
+        env.trajectory.clear()  # a new episode
+    env.state[:PHI+1] = np.asarray(state, dtype=np.float64) * 100.
+    env.state[T], env.state[F], env.state[ACTION] = t, env.action_table[action][0], action
+    env.step_id = t
+    env.trajectory.append(env.state)
+
+
+def render_frame(env, frame):
+    # runs on the video recorder's thread, which owns the local Rocket in headless mode
+    state, action = frame
+    mirror_state(env, state, action)
+    return env.render_offscreen()
+
+
 ################################### Training ###################################
 def train():
     print("============================================================================================")
@@ -19,30 +55,48 @@ def train():
     task = 'landing'  # 'hover' or 'landing'
 
     render = True
+    headless = False                    # No GUI: render to video files, plot progress from the log in a separate process
 
     has_continuous_action_space = False  # Discrete action space for Rocket
 
     max_ep_len = 1000                   # Max timesteps in one episode
     max_training_timesteps = int(2.4e6) # 2.4M timesteps (40% of full 6M training)
 
-    print_freq = max_ep_len * 10        # Print avg reward in the interval (in num timesteps)
+    print_freq = max_ep_len * 10        # Print avg reward and the throughput report in the interval (in num timesteps)
     log_freq = max_ep_len * 2           # Log avg reward in the interval (in num timesteps)
     save_model_freq = int(1e5)          # Save model every 100K timesteps
+    eval_episodes = 1000                # Seeded episodes per saved checkpoint, run by a background process (0 = off)
+    eval_envs = 250                     # Rockets simulated at once by the evaluator
+
+    num_workers = 4                     # Simulator subprocesses collecting rollouts in parallel
+    envs_per_worker = 1                 # Rockets simulated by each worker
+    num_envs = num_workers * envs_per_worker
+
+    integrator = 'explicit'             # Physics integrator: 'explicit', 'semi_implicit' or 'rk4'
+    substeps = 1                        # Integrator substeps per physics step (dt)
+    action_repeat = 1                   # Physics steps per policy decision (timesteps count decisions)
+
+    profile = True                      # Time every phase of the training loop (False: only steps/s is measured)
     #####################################################
 
     ################ PPO hyperparameters ################
     update_timestep = max_ep_len * 4    # Update policy every n timesteps
     K_epochs = 80                       # Update policy for K epochs in one PPO update
+    minibatch_size = None               # None = one full-batch step per epoch, else e.g. 256 (with K_epochs ~10)
+    target_kl = None                    # Stop the update early once approx KL exceeds this (None = never)
     eps_clip = 0.2                      # Clip parameter for PPO
     gamma = 0.99                        # Discount factor
     lr_actor = 0.0003                   # Learning rate for actor network
     lr_critic = 0.001                   # Learning rate for critic network
     random_seed = 0                     # Set random seed if required (0 = no random seed)
+    resume_path = None                  # Training state (PPO_<env>_<seed>_<run>_train.pt) to resume exactly from
+    advantage_estimator = 'mc'          # 'mc' (Monte Carlo returns) or 'gae'
+    gae_lambda = 0.95                   # Lambda for GAE
     #####################################################
 
     print("training environment name : " + env_name)
 
-    # Initialize the Rocket environment
+    # Initialize the Rocket environment (used for rendering, rollouts are collected by the env pool)
     env = Rocket(max_steps=max_ep_len, task=task, rocket_type='starship')  # Adjust as needed for the hover task
 
     # Set state and action dimensions
@@ -58,9 +112,24 @@ def train():
     if not os.path.exists(log_dir):
         os.makedirs(log_dir)
 
-    run_num = len(next(os.walk(log_dir))[2])
+    train_state = None
+    if resume_path is not None:
+        # continue the run (its log, checkpoints and counters) that wrote this training state
+        train_state = checkpoint.load_checkpoint(resume_path)
+        run_num = train_state['run_num']
+        print("resuming from : " + resume_path + " at timestep " + str(train_state['time_step']))
+    else:
+        run_num = len(next(os.walk(log_dir))[2])
     log_f_name = log_dir + '/PPO_' + env_name + "_log_" + str(run_num) + ".csv"
     print("logging at : " + log_f_name)
+    # per-episode outcomes and throughput, kept out of log_dir whose file count numbers the runs
+    metrics_dir = log_dir + 'metrics/'
+    if not os.path.exists(metrics_dir):
+        os.makedirs(metrics_dir)
+    episode_f_name = metrics_dir + 'PPO_' + env_name + "_episodes_" + str(run_num) + ".csv"
+    throughput_f_name = metrics_dir + 'PPO_' + env_name + "_throughput_" + str(run_num) + ".csv"
+    profile_f_name = metrics_dir + 'PPO_' + env_name + "_profile_" + str(run_num) + ".csv"
+    tensorboard_dir = log_dir + 'tensorboard/run_' + str(run_num)
     #####################################################
 
     ################### checkpointing ###################
@@ -74,17 +143,60 @@ def train():
 
     checkpoint_path = directory + "PPO_{}_{}_{}.pth".format(env_name, random_seed, run_num)
     print("save checkpoint path : " + checkpoint_path)
+
+    # every save is also kept per timestep, the best one found by the evaluator is copied to best_path
+    versioned_path = directory + "PPO_{}_{}_{}_{{}}.pth".format(env_name, random_seed, run_num)
+    best_path = directory + "PPO_{}_{}_{}_best.pth".format(env_name, random_seed, run_num)
+    # full training state (policy, optimizer, rollout buffer, counters, RNGs, simulators) written in the background
+    train_state_path = directory + "PPO_{}_{}_{}_train.pt".format(env_name, random_seed, run_num)
+    checkpoint_writer = checkpoint.CheckpointWriter()
+    eval_dir = log_dir + 'eval/'  # kept out of log_dir, whose file count numbers the runs
+    if not os.path.exists(eval_dir):
+        os.makedirs(eval_dir)
+    eval_f_name = eval_dir + 'PPO_' + env_name + "_eval_" + str(run_num) + ".csv"
     #####################################################
 
     # Initialize a PPO agent
-    ppo_agent = PPO(state_dim, action_dim, lr_actor, lr_critic, gamma, K_epochs, eps_clip, has_continuous_action_space)
+    ppo_agent = PPO(state_dim, action_dim, lr_actor, lr_critic, gamma, K_epochs, eps_clip, has_continuous_action_space,
+                    buffer_size=update_timestep, num_envs=num_envs,
+                    advantage_estimator=advantage_estimator, gae_lambda=gae_lambda,
+                    minibatch_size=minibatch_size, target_kl=target_kl)
+    print("============================================================================================")
+    print("Device set to : " + device_name(ppo_agent.device))
+    print("============================================================================================")
 
     # Track total training time
     start_time = datetime.now().replace(microsecond=0)
     print("Started training at (GMT) : ", start_time)
 
-    log_f = open(log_f_name, "w+")
-    log_f.write('episode,timestep,reward\n')
+    # a resumed run drops the rows logged after its checkpoint and appends to the logs
+    resuming = train_state is not None
+    if resuming:
+        for f_name in [log_f_name, eval_f_name, episode_f_name, throughput_f_name, profile_f_name]:
+            metrics_logger.truncate(f_name, train_state['time_step'])
+    # rows are buffered and written in batches by a background thread (the reward log, read by
+    # the progress plotter, is handed over row by row)
+    log_f = MetricsLogger(log_f_name, [('episode', 'i8'), ('timestep', 'i8'), ('reward', 'f8')],
+                          batch_size=1, append=resuming)
+    episode_log = MetricsLogger(episode_f_name, [('episode', 'i8'), ('timestep', 'i8'), ('reward', 'f8'),
+                                                 ('length', 'i8'), ('landed', '?'), ('crashed', '?'),
+                                                 ('timeout', '?'), ('touchdown_speed', 'f8')],
+                                append=resuming)
+    throughput_log = MetricsLogger(throughput_f_name, [('timestep', 'i8'), ('wall_time', 'f8'),
+                                                       ('env_steps_per_s', 'f8'), ('update_time', 'f8')],
+                                   batch_size=16, append=resuming)
+    print("logging episodes at : " + episode_f_name)
+
+    # time spent per phase of the training loop, reported every print_freq timesteps to stdout,
+    # the profile log and TensorBoard
+    phases = ['select_action', 'env_step', 'update', 'render', 'logging', 'checkpoint', 'plotting']
+    timer = PhaseTimer(phases, enabled=profile)
+    profile_columns = [('timestep', 'i8'), ('steps_per_s', 'f8')]
+    if profile:
+        profile_columns += [(name + '_pct', 'f8') for name in phases + ['other']]
+    profile_log = MetricsLogger(profile_f_name, profile_columns, batch_size=1, append=resuming)
+    # a resumed run drops the TensorBoard points logged after its checkpoint
+    tb_writer = SummaryWriter(tensorboard_dir, purge_step=train_state['time_step'] + 1 if resuming else None)
 
     # Initialize logging variables
     print_running_reward = 0
@@ -95,119 +207,221 @@ def train():
     time_step = 0
     i_episode = 0
 
-    episode_rewards = []
+    episode_rewards = []  # the first window_size rewards, plotted until the moving average starts
     window_size = 10  # Window size for moving average and standard deviation
+    plot_interval = 1.0  # Redraw the live plot at most once per this many seconds
 
-    # Initialize the plot for real-time updating
-    plt.ion()  # Turn on interactive mode
-    fig, ax = plt.subplots()
-    ax.set_xlabel('Episode')
-    ax.set_ylabel('Reward')
-    ax.set_title('Training Progress')
-    plt.show(block=False)
-    window_size = 10  # Window size for moving average and standard deviation
+    # moving average / std over the last window_size episodes, O(1) per episode
+    reward_window = utils.WindowedStats(window_size)
+    reward_curve = {'episode': [], 'mean': [], 'std': []}
+    last_plot_time = 0.0
+
+    graph_dir = "training_graphs"
+    if not os.path.exists(graph_dir):
+        os.makedirs(graph_dir)
+    graph_path = graph_dir + '/' + env_name + '_final_graph.png'
+
+    if headless:
+        # rendering goes to video files, the progress graph is redrawn from the log by another process
+        # the loop only queues state copies, the frames are drawn and encoded by the recorder's thread
+        recorder = VideoRecorder("PPO_videos/" + env_name + "/run_" + str(run_num),
+                                 render_fn=lambda frame: render_frame(env, frame))
+        plotter = ProgressPlotter(log_f_name, graph_path, window_size=window_size)
+    else:
+        # Initialize the plot for real-time updating
+        plt.ion()  # Turn on interactive mode
+        fig, ax = plt.subplots()
+        ax.set_xlabel('Episode')
+        ax.set_ylabel('Reward')
+        ax.set_title('Training Progress')
+        plt.show(block=False)
+
+    checkpoint_evaluator = None
+    if eval_episodes > 0:
+        checkpoint_evaluator = CheckpointEvaluator(eval_f_name, best_path, num_episodes=eval_episodes, task=task,
+                                                   max_steps=max_ep_len, num_envs=eval_envs,
+                                                   integrator=integrator, substeps=substeps,
+                                                   action_repeat=action_repeat)
+        print("evaluating checkpoints into : " + eval_f_name)
+
+    # Initialize the env pool
+    pool = RocketEnvPool(num_workers, envs_per_worker, max_steps=max_ep_len, task=task,
+                         seed=random_seed if random_seed else None,
+                         integrator=integrator, substeps=substeps, action_repeat=action_repeat)
+    print("collecting rollouts with {} workers x {} envs".format(num_workers, envs_per_worker))
+
+    state = pool.reset()
+    current_ep_reward = np.zeros(num_envs)
+    wall_start = time.time()
+    last_update_time, last_update_step = wall_start, 0
+
+    if train_state is not None:
+        ppo_agent.load_training_state(train_state['agent'])
+        state = pool.set_state(train_state['pool'])
+        checkpoint.set_rng_state(train_state['rng'])
+        time_step, i_episode = train_state['time_step'], train_state['i_episode']
+        current_ep_reward = train_state['current_ep_reward']
+        print_running_reward, print_running_episodes = train_state['print_running']
+        log_running_reward, log_running_episodes = train_state['log_running']
+        # the reward history is not checkpointed, it is rebuilt from the episode log (cut at this timestep)
+        rewards = metrics_logger.read_columns(episode_f_name)['reward']
+        episode_rewards = list(rewards[:window_size])
+        moving_avg, moving_std = utils.windowed_curve(rewards, window_size)
+        reward_curve = {'episode': list(range(window_size - 1, len(rewards))),
+                        'mean': list(moving_avg), 'std': list(moving_std)}
+        for reward in rewards[-window_size:]:
+            reward_window.update(reward)
+        train_state = None
+    last_update_step = time_step
+    render_episode = render
+    if render_episode and headless:
+        # videos are named by timestep, a resumed run does not overwrite the ones it already wrote
+        recorder.start_episode('step_{}_episode_{}'.format(time_step, i_episode))
 
     # Training loop
     while time_step <= max_training_timesteps:
-        state = env.reset()
-        current_ep_reward = 0
-
-        for t in range(1, max_ep_len + 1):
-            # Select action with policy
+        # Select action with policy
+        with timer.phase('select_action'):
             action = ppo_agent.select_action(state)
-            state, reward, done, _ = env.step(action)
-
-            # Save reward and terminal state
-            ppo_agent.buffer.rewards.append(reward)
-            ppo_agent.buffer.is_terminals.append(done)
-
-            time_step += 1
-            current_ep_reward += reward
-
-            if render and i_episode % 50 == 0:
-                env.render()
-                
-            # Update PPO agent
-            if time_step % update_timestep == 0:
-                ppo_agent.update()
-
+        with timer.phase('env_step'):
+            state, reward, done, truncated = pool.step(action)
+
+        # Save reward and terminal state; episodes cut off at max_steps were reset by the pool, their
+        # returns are bootstrapped from the value of their last state instead of the next episode's first
+        final_value = None
+        if truncated.any():
+            final_value = np.zeros(num_envs, dtype=np.float32)
+            final_value[truncated] = ppo_agent.state_value(pool.final_obs[truncated])
+        ppo_agent.buffer.add_reward(reward, done, truncated, final_value)
+
+        time_step += num_envs
+        timer.add_steps(num_envs)
+        current_ep_reward += reward
+
+        # render the first rocket of the pool, from its state before an auto-reset
+        if render_episode:
+            with timer.phase('render'):
+                if headless:
+                    recorder.add_frame((pool.final_obs[0].copy(), action[0]))
+                else:
+                    mirror_state(env, pool.final_obs[0], action[0])
+                    env.render()
+
+        # Update PPO agent
+        if crossed(time_step, update_timestep, num_envs):
+            update_start = time.time()
+            with timer.phase('update'):
+                ppo_agent.update(next_state=state)
+            now = time.time()
+            # env steps per second over the rollout and update since the previous update
+            throughput_log.log(time_step, now - wall_start,
+                               (time_step - last_update_step) / max(now - last_update_time, 1e-9),
+                               now - update_start)
+            last_update_time, last_update_step = now, time_step
+
+        with timer.phase('logging'):
             # Log to file
-            if time_step % log_freq == 0:
+            if crossed(time_step, log_freq, num_envs) and log_running_episodes > 0:
                 log_avg_reward = log_running_reward / log_running_episodes
-                log_f.write('{},{},{}\n'.format(i_episode, time_step, round(log_avg_reward, 4)))
+                log_f.log(i_episode, time_step, round(log_avg_reward, 4))
                 log_running_reward, log_running_episodes = 0, 0
 
             # Print average reward
-            if time_step % print_freq == 0:
+            if crossed(time_step, print_freq, num_envs) and print_running_episodes > 0:
                 print_avg_reward = print_running_reward / print_running_episodes
                 print("Episode : {} \t\t Timestep : {} \t\t Average Reward : {}".format(i_episode, time_step, round(print_avg_reward, 2)))
                 print_running_reward, print_running_episodes = 0, 0
 
-            # Save model weights
-            if time_step % save_model_freq == 0:
+        # Save model weights
+        save_checkpoint = crossed(time_step, save_model_freq, num_envs)
+        if save_checkpoint:
+            with timer.phase('checkpoint'):
                 ppo_agent.save(checkpoint_path)
                 print("Model saved at timestep: ", time_step)
-
-            if done:
-                break
-
-        print_running_reward += current_ep_reward
-        print_running_episodes += 1
-        log_running_reward += current_ep_reward
-        log_running_episodes += 1
-        i_episode += 1
-        
-        episode_rewards.append(current_ep_reward)
+                step_path = versioned_path.format(time_step)
+                ppo_agent.save(step_path)
+                if checkpoint_evaluator is not None:
+                    npz_path = ppo_agent.export_numpy(os.path.splitext(step_path)[0] + '.npz')
+                    checkpoint_evaluator.submit(time_step, step_path, npz_path)
+
+        with timer.phase('logging'):
+            for i in np.flatnonzero(done | truncated):
+                print_running_reward += current_ep_reward[i]
+                print_running_episodes += 1
+                log_running_reward += current_ep_reward[i]
+                log_running_episodes += 1
+                i_episode += 1
+                episode_log.log(i_episode, time_step, current_ep_reward[i], pool.episode_length[i], pool.landed[i],
+                                done[i] and not pool.landed[i], truncated[i], pool.touchdown_speed[i])
+
+                if len(episode_rewards) < window_size:
+                    episode_rewards.append(current_ep_reward[i])
+                reward_window.update(current_ep_reward[i])
+                if reward_window.full:
+                    reward_curve['episode'].append(i_episode - 1)
+                    reward_curve['mean'].append(reward_window.mean)
+                    reward_curve['std'].append(reward_window.std)
+                current_ep_reward[i] = 0
+
+                if i == 0:
+                    if render_episode and headless:
+                        recorder.end_episode()
+                    render_episode = render and i_episode % 50 == 0
+                    if render_episode and headless:
+                        recorder.start_episode('step_{}_episode_{}'.format(time_step, i_episode))
+
+        # Report the throughput and the time spent per phase
+        if crossed(time_step, print_freq, num_envs):
+            report = timer.report()
+            print(profiler.format_report(report))
+            tb_writer.add_scalar('throughput/steps_per_s', report['steps_per_s'], time_step)
+            row = [time_step, report['steps_per_s']]
+            if profile:
+                for name, pct in report['percent'].items():
+                    tb_writer.add_scalar('phase_percent/' + name, pct, time_step)
+                for name, ms in report['ms_per_call'].items():
+                    tb_writer.add_scalar('phase_ms_per_call/' + name, ms, time_step)
+                row += list(report['percent'].values())
+            profile_log.log(*row)
+
+        # Save the full training state, after this step's episode bookkeeping so that a resume continues here
+        if save_checkpoint:
+            with timer.phase('checkpoint'):
+                # the logs must hold every row up to here for a resume to continue them
+                for logger in [log_f, episode_log, throughput_log, profile_log]:
+                    logger.flush()
+                tb_writer.flush()
+                checkpoint_writer.save(train_state_path, {
+                    'run_num': run_num, 'time_step': time_step, 'i_episode': i_episode,
+                    'agent': ppo_agent.training_state(), 'rng': checkpoint.rng_state(),
+                    'pool': pool.get_state(), 'current_ep_reward': current_ep_reward,
+                    'print_running': (print_running_reward, print_running_episodes),
+                    'log_running': (log_running_reward, log_running_episodes)})
 
         # Update the plot
-        if len(episode_rewards) >= window_size:
-            # Calculate moving average and standard deviation
-            moving_avg = np.convolve(
-                episode_rewards, np.ones(window_size)/window_size, mode='valid'
-            )
-            moving_std = np.array([
-                np.std(episode_rewards[i-window_size+1:i+1]) 
-                for i in range(window_size-1, len(episode_rewards))
-            ])
-            episodes = np.arange(window_size-1, len(episode_rewards))
-
-            # Clear the axis and redraw
-            ax.clear()
-            ax.plot(episodes, moving_avg, label='Moving Average Reward')
-
-            # Shade the area between (mean - std) and (mean + std)
-            lower_bound = moving_avg - moving_std
-            upper_bound = moving_avg + moving_std
-            ax.fill_between(episodes, lower_bound, upper_bound, color='blue', alpha=0.2, label='Standard Deviation')
-
-            # Set labels and title
-            ax.set_xlabel('Episode')
-            ax.set_ylabel('Reward')
-            ax.set_title('Training Progress with Variability Shading')
-            ax.legend()
-            plt.draw()
-            plt.pause(0.01)
-        else:
-            # For initial episodes where we don't have enough data for moving average
-            ax.clear()
-            ax.plot(range(len(episode_rewards)), episode_rewards, label='Episode Reward')
-            ax.set_xlabel('Episode')
-            ax.set_ylabel('Reward')
-            ax.set_title('Training Progress')
-            ax.legend()
-            plt.draw()
-            plt.pause(0.01)
-
-    log_f.close()
+        if not headless and time.time() - last_plot_time >= plot_interval:
+            with timer.phase('plotting'):
+                update_live_plot(ax, episode_rewards, reward_curve)
+            last_plot_time = time.time()
+
+    for logger in [log_f, episode_log, throughput_log, profile_log]:
+        logger.close()
+    tb_writer.close()
+    pool.close()
+    checkpoint_writer.close()
+    if checkpoint_evaluator is not None:
+        print("Waiting for the checkpoint evaluations...")
+        checkpoint_evaluator.stop()
+    if not headless:
+        update_live_plot(ax, episode_rewards, reward_curve)
     
     # Save final training graph
     print("Saving final training graph...")
-    graph_dir = "training_graphs"
-    if not os.path.exists(graph_dir):
-        os.makedirs(graph_dir)
-    
-    graph_path = graph_dir + '/' + env_name + '_final_graph.png'
-    plt.savefig(graph_path, dpi=300, bbox_inches='tight')
+    if headless:
+        recorder.close()
+        plotter.stop()
+    else:
+        plt.savefig(graph_path, dpi=300, bbox_inches='tight')
     print("Training graph saved at:", graph_path)
     
     print("Finished training at : ", datetime.now().replace(microsecond=0))
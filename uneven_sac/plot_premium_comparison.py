@@ -8,11 +8,13 @@ import matplotlib.pyplot as plt
 import numpy as np
 import os
 
+import utils
+
 def moving_average(data, window_size=50):
-    """Calculate moving average"""
+    """Calculate moving average (vectorized, utils.windowed_curve)"""
     if len(data) < window_size:
         return data
-    return np.convolve(data, np.ones(window_size)/window_size, mode='valid')
+    return utils.windowed_curve(data, window_size)[0]
 
 def plot_premium_comparison():
     # Read both logs
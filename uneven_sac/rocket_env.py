@@ -12,6 +12,11 @@ import os
 import random
 
 
+# layout of the rocket state vector (RocketLandingEnv.state), the first 8 entries are the observation
+X, Y, VX, VY, THETA, VTHETA, T, PHI, F, ACTION = range(10)
+STATE_KEYS = ('x', 'y', 'vx', 'vy', 'theta', 'vtheta', 't', 'phi', 'f', 'action_')
+
+
 class RocketLandingEnv(gym.Env):
     """
     Continuous action space rocket landing environment for SAC with uneven terrain.
@@ -32,7 +37,8 @@ class RocketLandingEnv(gym.Env):
     
     def __init__(self, max_steps=1000, task='landing', rocket_type='starship',
                  viewport_h=768, path_to_bg_img=None, render_mode=None,
-                 enable_terrain=True, terrain_difficulty='moderate'):
+                 enable_terrain=True, terrain_difficulty='moderate', terrain_points=100,
+                 terrain_bank=None, record_trajectory=True, trajectory_fields=None, seed=None):
         super().__init__()
         
         self.task = task
@@ -40,6 +46,9 @@ class RocketLandingEnv(gym.Env):
         self.render_mode = render_mode
         self.enable_terrain = enable_terrain
         self.terrain_difficulty = terrain_difficulty
+        self.terrain_points = terrain_points  # heightmap resolution
+        self.terrain_bank = terrain_bank  # utils.TerrainBank, terrains are taken from it instead of generated
+        self.rng = np.random.default_rng(seed)  # own generator for the bank draws, independent of np.random
         
         self.g = 9.8
         self.H = 50  # rocket height (meters)
@@ -52,8 +61,9 @@ class RocketLandingEnv(gym.Env):
         self.world_y_max = 570
         
         # Generate uneven terrain
+        self.terrain_index = None
         if self.enable_terrain:
-            self.terrain = self.generate_terrain(difficulty=terrain_difficulty)
+            self.select_terrain()
         else:
             self.terrain = None
         
@@ -81,7 +91,10 @@ class RocketLandingEnv(gym.Env):
             path_to_bg_img = os.path.join(script_dir, task+'.jpg')
         self.bg_img = utils.load_bg_img(path_to_bg_img, w=self.viewport_w, h=self.viewport_h)
         
-        self.state_buffer = []
+        # per-step record of the state vector (trajectory_fields = which entries, None = all),
+        # record_trajectory=False turns it off when nothing draws or inspects it
+        self.trajectory = utils.TrajectoryBuffer(max_steps, len(STATE_KEYS), trajectory_fields) \
+            if record_trajectory else None
         
         # Define action and observation spaces for Gymnasium
         # Action: [thrust, nozzle_angle_velocity]
@@ -98,80 +111,57 @@ class RocketLandingEnv(gym.Env):
             dtype=np.float32
         )
         
-        self.state = None
+        # state vector (see STATE_KEYS) and observation, both updated in place
+        self.state = np.zeros(len(STATE_KEYS), dtype=np.float64)
+        self.obs = np.zeros(8, dtype=np.float32)
     
     def generate_terrain(self, difficulty='moderate'):
         """
         Generate uneven terrain with craters and hills.
         Returns a dictionary with terrain points and parameters.
         """
-        terrain = {
-            'points': [],
-            'difficulty': difficulty
-        }
-        
-        # Configure terrain roughness based on difficulty
-        if difficulty == 'easy':
-            num_features = 3
-            max_height_variation = 15  # meters
-            crater_depth = 10
-        elif difficulty == 'moderate':
-            num_features = 5
-            max_height_variation = 25
-            crater_depth = 15
-        else:  # hard
-            num_features = 8
-            max_height_variation = 40
-            crater_depth = 20
-        
-        # Generate terrain points from left to right
-        x_points = np.linspace(self.world_x_min, self.world_x_max, 100)
-        y_base = 0  # base ground level
-        
-        # Start with flat terrain
-        y_points = np.ones_like(x_points) * y_base
-        
-        # Add random features (craters and hills)
-        for _ in range(num_features):
-            feature_center = np.random.uniform(self.world_x_min + 50, self.world_x_max - 50)
-            feature_width = np.random.uniform(30, 80)
-            feature_type = np.random.choice(['crater', 'hill'])
-            
-            if feature_type == 'crater':
-                feature_depth = -np.random.uniform(crater_depth * 0.5, crater_depth)
-            else:
-                feature_depth = np.random.uniform(max_height_variation * 0.3, max_height_variation)
-            
-            # Apply Gaussian-like feature
-            for i, x in enumerate(x_points):
-                distance = abs(x - feature_center)
-                if distance < feature_width:
-                    influence = np.exp(-((distance / feature_width) ** 2) * 3)
-                    y_points[i] += feature_depth * influence
-        
-        # Smooth the terrain
-        window_size = 5
-        y_points = np.convolve(y_points, np.ones(window_size)/window_size, mode='same')
-        
-        # Store terrain points
-        for x, y in zip(x_points, y_points):
-            terrain['points'].append((x, y))
-        
-        return terrain
-    
+        x_points, heights = utils.generate_terrains(1, self.world_x_min, self.world_x_max,
+                                                    difficulty=difficulty, num_points=self.terrain_points)
+        return utils.make_terrain(x_points, heights[0], difficulty)
+
+    def select_terrain(self, terrain_index=None):
+        """
+        Use terrain `terrain_index` of the terrain bank (a random one if None),
+        or generate a new terrain when the env has no bank.
+        """
+        if self.terrain_bank is None:
+            self.terrain_index = None
+            self.terrain = self.generate_terrain(difficulty=self.terrain_difficulty)
+        else:
+            if terrain_index is None:
+                terrain_index = self.terrain_bank.sample_index(self.rng)
+            self.terrain_index = int(terrain_index)
+            self.terrain = self.terrain_bank.get_terrain(self.terrain_index)
+
     def get_terrain_height(self, x_pos):
         """
-        Get the terrain height at a given x position using interpolation.
+        Get the terrain height at a given x position (scalar or array) using
+        linear interpolation between heightmap samples, clamped at the edges.
         """
         if not self.enable_terrain or self.terrain is None:
-            return 0
-        
-        points = self.terrain['points']
-        x_coords = [p[0] for p in points]
-        y_coords = [p[1] for p in points]
-        
-        # Linear interpolation
-        return np.interp(x_pos, x_coords, y_coords)
+            return 0 if np.isscalar(x_pos) else np.zeros(np.shape(x_pos))
+
+        heights = self.terrain['heights']
+        last = len(heights) - 1
+
+        if np.isscalar(x_pos):
+            # grid cell found by index arithmetic, no search
+            u = (x_pos - self.terrain['x0']) / self.terrain['dx']
+            if u <= 0:
+                return heights[0]
+            if u >= last:
+                return heights[last]
+            i = int(u)
+            return heights[i] + (u - i) * (heights[i+1] - heights[i])
+
+        u = np.clip((np.asarray(x_pos, dtype=np.float64) - self.terrain['x0']) / self.terrain['dx'], 0, last)
+        i = np.minimum(u.astype(np.intp), last - 1)
+        return heights[i] + (u - i) * (heights[i+1] - heights[i])
         
     def reset(self, seed=None, options=None):
         super().reset(seed=seed)
@@ -179,21 +169,23 @@ class RocketLandingEnv(gym.Env):
         if seed is not None:
             np.random.seed(seed)
             random.seed(seed)
+            self.rng = np.random.default_rng(seed)
         
-        # Regenerate terrain for each episode
+        # New terrain for each episode, options={'terrain_index': i} picks terrain i of the bank
         if self.enable_terrain:
-            self.terrain = self.generate_terrain(difficulty=self.terrain_difficulty)
+            self.select_terrain((options or {}).get('terrain_index'))
             target_height = self.get_terrain_height(0)
             self.target_y = target_height + self.H/2.0
         
-        self.state = self.create_random_state()
-        self.state_buffer = []
+        self.state[:] = self.create_random_state()
+        if self.trajectory is not None:
+            self.trajectory.clear()
         self.step_id = 0
         self.already_landing = False
         self.already_crash = False
         
-        observation = self.flatten(self.state)
-        info = {}
+        observation = self.flatten(self.state).copy()
+        info = {'terrain_index': self.terrain_index}
         
         return observation, info
     
@@ -203,10 +195,7 @@ class RocketLandingEnv(gym.Env):
         vphi = np.clip(action[1], -30/180*np.pi, 30/180*np.pi)  # nozzle angular velocity
         
         # Current state
-        x, y = self.state['x'], self.state['y']
-        vx, vy = self.state['vx'], self.state['vy']
-        theta, vtheta = self.state['theta'], self.state['vtheta']
-        phi = self.state['phi']
+        x, y, vx, vy, theta, vtheta, _, phi = self.state[:PHI+1].tolist()
         
         # Physics simulation
         ft, fr = -f*np.sin(phi), f*np.cos(phi)
@@ -234,14 +223,11 @@ class RocketLandingEnv(gym.Env):
         phi_new = max(phi_new, -20/180*np.pi)
         phi_new = min(phi_new, 20/180*np.pi)
         
-        # Update state dictionary
-        self.state = {
-            'x': x_new, 'y': y_new, 'vx': vx_new, 'vy': vy_new,
-            'theta': theta_new, 'vtheta': vtheta_new,
-            'phi': phi_new, 'f': f,
-            't': self.step_id, 'action_': 0
-        }
-        self.state_buffer.append(self.state)
+        # Update state vector
+        self.state[:] = (x_new, y_new, vx_new, vy_new, theta_new, vtheta_new,
+                         self.step_id, phi_new, f, 0)
+        if self.trajectory is not None:
+            self.trajectory.append(self.state)
         
         # Check terminal conditions
         self.already_landing = self.check_landing_success(self.state)
@@ -251,7 +237,7 @@ class RocketLandingEnv(gym.Env):
         done = self.already_crash or self.already_landing or self.step_id >= self.max_steps
         truncated = self.step_id >= self.max_steps
         
-        observation = self.flatten(self.state)
+        observation = self.flatten(self.state).copy()
         info = {
             'landed': self.already_landing,
             'crashed': self.already_crash,
@@ -271,25 +257,20 @@ class RocketLandingEnv(gym.Env):
         theta = np.random.uniform(-10/180*np.pi, 10/180*np.pi)
         vtheta = np.random.uniform(-5/180*np.pi, 5/180*np.pi)
         
-        state_dict = {
-            'x': x, 'y': y, 'vx': vx, 'vy': vy,
-            'theta': theta, 'vtheta': vtheta,
-            'phi': 0, 'f': 0,
-            't': 0, 'action_': 0
-        }
-        return state_dict
+        state = np.zeros(len(STATE_KEYS), dtype=np.float64)
+        state[X], state[Y], state[VX], state[VY], state[THETA], state[VTHETA] = x, y, vx, vy, theta, vtheta
+        return state
     
     def flatten(self, state):
-        x = np.array([
-            state['x'], state['y'], state['vx'], state['vy'],
-            state['theta'], state['vtheta'], state['t'],
-            state['phi']
-        ], dtype=np.float32) / 100.
-        return x
+        # written into self.obs; reset / step return a copy since wrappers keep
+        # references to past observations (e.g. VecEnv terminal_observation)
+        self.obs[:] = state[:PHI+1]
+        self.obs /= 100.
+        return self.obs
     
     def check_crash(self, state):
         if self.task == 'hover':
-            x, y = state['x'], state['y']
+            x, y = state[X], state[Y]
             if x < self.world_x_min or x > self.world_x_max:
                 return True
             if y < self.world_y_min or y > self.world_y_max:
@@ -297,10 +278,7 @@ class RocketLandingEnv(gym.Env):
             return False
         
         elif self.task == 'landing':
-            x, y = state['x'], state['y']
-            vx, vy = state['vx'], state['vy']
-            theta = state['theta']
-            vtheta = state['vtheta']
+            x, y, vx, vy, theta, vtheta = state[:VTHETA+1].tolist()
             v = (vx**2 + vy**2)**0.5
             
             # Get terrain height at current position
@@ -324,10 +302,7 @@ class RocketLandingEnv(gym.Env):
         if self.task == 'hover':
             return False
         elif self.task == 'landing':
-            x, y = state['x'], state['y']
-            vx, vy = state['vx'], state['vy']
-            theta = state['theta']
-            vtheta = state['vtheta']
+            x, y, vx, vy, theta, vtheta = state[:VTHETA+1].tolist()
             v = (vx**2 + vy**2)**0.5
             
             # Get terrain height at current position
@@ -341,17 +316,19 @@ class RocketLandingEnv(gym.Env):
         x_range = self.world_x_max - self.world_x_min
         y_range = self.world_y_max - self.world_y_min
         
+        x, y, vx, vy, theta = state[:THETA+1].tolist()
+
         # Distance reward
-        dist_x = abs(state['x'] - self.target_x)
-        dist_y = abs(state['y'] - self.target_y)
+        dist_x = abs(x - self.target_x)
+        dist_y = abs(y - self.target_y)
         dist_norm = dist_x / x_range + dist_y / y_range
         dist_reward = 0.1*(1.0 - dist_norm)
         
         # Pose reward
-        if abs(state['theta']) <= np.pi / 6.0:
+        if abs(theta) <= np.pi / 6.0:
             pose_reward = 0.1
         else:
-            pose_reward = abs(state['theta']) / (0.5*np.pi)
+            pose_reward = abs(theta) / (0.5*np.pi)
             pose_reward = 0.1 * (1.0 - pose_reward)
         
         reward = dist_reward + pose_reward
@@ -361,10 +338,10 @@ class RocketLandingEnv(gym.Env):
             reward = 0.25
         if self.task == 'hover' and (dist_x**2 + dist_y**2)**0.5 <= 1*self.target_r:
             reward = 0.5
-        if self.task == 'hover' and abs(state['theta']) > 90 / 180 * np.pi:
+        if self.task == 'hover' and abs(theta) > 90 / 180 * np.pi:
             reward = 0
         
-        v = (state['vx'] ** 2 + state['vy'] ** 2) ** 0.5
+        v = (vx ** 2 + vy ** 2) ** 0.5
         if self.task == 'landing' and self.already_crash:
             reward = (reward + 5*np.exp(-1*v/10.)) * (self.max_steps - self.step_id)
         if self.task == 'landing' and self.already_landing:
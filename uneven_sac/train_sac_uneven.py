@@ -4,11 +4,17 @@ Uses Stable-Baselines3 implementation
 """
 
 import os
+import sys
 import numpy as np
 from stable_baselines3 import SAC
 from stable_baselines3.common.callbacks import BaseCallback
 import matplotlib.pyplot as plt
 from rocket_env import RocketLandingEnv
+# metrics_logger is shared with the repository root, one copy; appended, so this folder's
+# own modules still take precedence
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metrics_logger import MetricsLogger
+import utils
 import random
 
 
@@ -19,26 +25,55 @@ class TrainingCallback(BaseCallback):
         super().__init__()
         self.check_freq = check_freq
         self.log_dir = log_dir
-        self.episode_rewards = []
-        self.episode_lengths = []
+        # incremental summaries, O(1) per episode (no per-episode history is kept)
+        self.reward_stats = utils.RunningStats()
+        self.reward_window = utils.WindowedStats(100)
+        self.length_stats = utils.RunningStats()
         self.current_episode_reward = 0
         self.current_episode_length = 0
+        # rows are buffered and written in batches by a background thread
+        self.open_logs(append=False)
+        
+    def open_logs(self, append):
+        self.training_log = MetricsLogger(os.path.join(self.log_dir, 'training_log.csv'),
+                                          [('timestep', 'i8'), ('episode', 'i8'), ('reward', 'f8')],
+                                          append=append)
+        self.episode_log = MetricsLogger(os.path.join(self.log_dir, 'episodes.csv'),
+                                         [('timestep', 'i8'), ('episode', 'i8'), ('reward', 'f8'),
+                                          ('length', 'i8'), ('landed', '?'), ('crashed', '?'),
+                                          ('timeout', '?'), ('touchdown_speed', 'f8')],
+                                         append=append)
+
+    def close_logs(self):
+        self.training_log.close()
+        self.episode_log.close()
+
+    def _on_training_start(self):
+        self.rocket_height = self.training_env.get_attr('H')[0]
         
     def _on_step(self):
         self.current_episode_reward += self.locals['rewards'][0]
         self.current_episode_length += 1
         
         if self.locals['dones'][0]:
-            self.episode_rewards.append(self.current_episode_reward)
-            self.episode_lengths.append(self.current_episode_length)
+            self.reward_stats.update(self.current_episode_reward)
+            self.reward_window.update(self.current_episode_reward)
+            self.length_stats.update(self.current_episode_length)
+            num_episodes = self.reward_stats.count
+
+            info = self.locals['infos'][0]
+            ground = info['y'] - info.get('terrain_height', 0.) <= self.rocket_height / 2.0
+            self.episode_log.log(self.num_timesteps, num_episodes, self.current_episode_reward,
+                                 self.current_episode_length, info['landed'], info['crashed'],
+                                 not (info['landed'] or info['crashed']),
+                                 info['velocity'] if ground else np.nan)
+
+            # Log to file
+            if num_episodes % 10 == 0:
+                self.training_log.log(self.num_timesteps, num_episodes, self.current_episode_reward)
+
             self.current_episode_reward = 0
             self.current_episode_length = 0
-            
-            # Log to file
-            if len(self.episode_rewards) % 10 == 0:
-                log_file = os.path.join(self.log_dir, 'training_log.csv')
-                with open(log_file, 'a') as f:
-                    f.write(f"{self.num_timesteps},{len(self.episode_rewards)},{self.episode_rewards[-1]}\n")
         
         return True
 
@@ -57,28 +92,37 @@ def train_sac_uneven():
     os.makedirs(model_dir, exist_ok=True)
     os.makedirs(graph_dir, exist_ok=True)
     
-    # Initialize log file
+    # Terrain: one fixed, seeded bank per difficulty (generated on first use), shared with evaluation
+    terrain_difficulty = 'moderate'  # 'easy', 'moderate', 'hard'
+    terrain_bank_dir = './terrain_bank/'
+    terrain_bank_size = 1000  # terrains per difficulty
+    
+    # training_log.csv and episodes.csv are (re)created by the callback
     log_file = os.path.join(log_dir, 'training_log.csv')
-    with open(log_file, 'w') as f:
-        f.write('timestep,episode,reward\n')
     
     print("=" * 50)
     print("SAC Training - Uneven Terrain")
     print("=" * 50)
     print(f"Algorithm: SAC (Soft Actor-Critic)")
     print(f"Action Space: Continuous [thrust, nozzle_angle_velocity]")
-    print(f"Terrain: Enabled (Difficulty: moderate)")
+    print(f"Terrain: Enabled (Difficulty: {terrain_difficulty})")
     print(f"Total Timesteps: 300,000")
     print(f"Expected Time: ~20-30 minutes")
     print("=" * 50)
     
     # Create environment with uneven terrain
+    # Episodes draw their terrain from the bank of the configured difficulty
+    terrain_banks = utils.build_terrain_banks(terrain_bank_dir, terrain_bank_size, seed=seed)
+    terrain_bank = terrain_banks[terrain_difficulty]
     env = RocketLandingEnv(
         max_steps=1000, 
         task='landing', 
         rocket_type='starship',
         enable_terrain=True,
-        terrain_difficulty='moderate'
+        terrain_difficulty=terrain_difficulty,
+        terrain_bank=terrain_bank,
+        record_trajectory=False,
+        seed=seed
     )
     
     # Create SAC model
@@ -107,24 +151,28 @@ def train_sac_uneven():
     total_timesteps = 300000
     save_freq = 50000
     
-    for i in range(0, total_timesteps, save_freq):
-        remaining = min(save_freq, total_timesteps - i)
-        model.learn(
-            total_timesteps=remaining,
-            callback=callback,
-            reset_num_timesteps=False,
-            progress_bar=True
-        )
+    try:
+        for i in range(0, total_timesteps, save_freq):
+            remaining = min(save_freq, total_timesteps - i)
+            model.learn(
+                total_timesteps=remaining,
+                callback=callback,
+                reset_num_timesteps=False,
+                progress_bar=True
+            )
         
-        # Save model checkpoint
-        checkpoint_path = os.path.join(model_dir, f'sac_rocket_uneven_{i+remaining}.zip')
-        model.save(checkpoint_path)
-        print(f"\nCheckpoint saved: {checkpoint_path}")
+            # Save model checkpoint
+            checkpoint_path = os.path.join(model_dir, f'sac_rocket_uneven_{i+remaining}.zip')
+            model.save(checkpoint_path)
+            print(f"\nCheckpoint saved: {checkpoint_path}")
     
-    # Save final model
-    final_model_path = os.path.join(model_dir, 'sac_rocket_uneven_final.zip')
-    model.save(final_model_path)
-    print(f"\nFinal model saved: {final_model_path}")
+        # Save final model
+        final_model_path = os.path.join(model_dir, 'sac_rocket_uneven_final.zip')
+        model.save(final_model_path)
+        print(f"\nFinal model saved: {final_model_path}")
+    finally:
+        # flush and close the logs even if training stops early (error or Ctrl+C)
+        callback.close_logs()
     
     # Plot training progress
     plot_training_results(log_file, graph_dir)
@@ -132,10 +180,10 @@ def train_sac_uneven():
     print("\n" + "=" * 50)
     print("Training Complete!")
     print("=" * 50)
-    print(f"Total Episodes: {len(callback.episode_rewards)}")
-    if len(callback.episode_rewards) > 0:
-        print(f"Average Reward (last 100): {np.mean(callback.episode_rewards[-100:]):.2f}")
-        print(f"Max Reward: {np.max(callback.episode_rewards):.2f}")
+    print(f"Total Episodes: {callback.reward_stats.count}")
+    if callback.reward_stats.count > 0:
+        print(f"Average Reward (last 100): {callback.reward_window.mean:.2f}")
+        print(f"Max Reward: {callback.reward_stats.max:.2f}")
     print(f"Models saved in: {model_dir}")
     print(f"Graphs saved in: {graph_dir}")
     print("=" * 50)
@@ -166,7 +214,7 @@ def plot_training_results(log_file, save_dir):
     
     # Calculate moving average
     window = min(20, len(rewards))
-    moving_avg = np.convolve(rewards, np.ones(window)/window, mode='valid')
+    moving_avg, _ = utils.windowed_curve(rewards, window)
     
     # Create figure with 2 subplots
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
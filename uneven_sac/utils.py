@@ -1,4 +1,5 @@
 import numpy as np
+import os
 import cv2
 
 ################ Some helper functions... ####################
@@ -44,6 +45,95 @@ def create_rectangle_poly(center, w, h):
     pts = [[x0-w/2, y0+h/2], [x0+w/2, y0+h/2], [x0+w/2, y0-h/2], [x0-w/2, y0-h/2]]
     return pts
 
+################ Streaming statistics... ####################
+
+class RunningStats(object):
+    """Mean, std, min and max of every value seen so far (Welford's algorithm), O(1) per update."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def update(self, x):
+        x = float(x)
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    @property
+    def var(self):
+        return self.m2 / self.count if self.count > 0 else 0.0
+
+    @property
+    def std(self):
+        return self.var ** 0.5
+
+
+class WindowedStats(object):
+    """Mean and std (ddof=0, like np.std) of the last `window` values, kept in a ring buffer, O(1) per update."""
+
+    def __init__(self, window):
+        self.window = int(window)
+        self.values = np.zeros(self.window)
+        self.count = 0  # values currently in the window
+        self.pos = 0    # next slot of the ring buffer
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, x):
+        x = float(x)
+        if self.count < self.window:
+            # window still filling: plain Welford step
+            self.count += 1
+            delta = x - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (x - self.mean)
+        else:
+            # sliding Welford step: x replaces the oldest value
+            old = self.values[self.pos]
+            old_mean = self.mean
+            self.mean += (x - old) / self.window
+            self.m2 += (x - old) * (x - self.mean + old - old_mean)
+        self.values[self.pos] = x
+        self.pos = (self.pos + 1) % self.window
+
+    @property
+    def full(self):
+        return self.count == self.window
+
+    @property
+    def var(self):
+        return max(self.m2, 0.0) / self.count if self.count > 0 else 0.0
+
+    @property
+    def std(self):
+        return self.var ** 0.5
+
+
+def windowed_curve(values, window):
+    """
+    Moving mean and std (ddof=0) of every full window of a whole array, e.g. a
+    saved log, vectorized with cumulative sums (the means match
+    np.convolve(values, np.ones(window)/window, 'valid')). Live bookkeeping
+    that sees one value at a time uses WindowedStats instead.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < window:
+        return np.zeros(0), np.zeros(0)
+    # centered first, so the running sums stay small and the variance keeps its precision
+    centered = values - values.mean()
+    s1 = np.concatenate([[0.0], np.cumsum(centered)])
+    s2 = np.concatenate([[0.0], np.cumsum(centered * centered)])
+    mean = (s1[window:] - s1[:-window]) / window
+    var = (s2[window:] - s2[:-window]) / window - mean * mean
+    return mean + values.mean(), np.sqrt(np.maximum(var, 0.0))
+
 
 ################ Let's do some math... ####################
 
@@ -116,3 +206,163 @@ def create_pose_matrix(tx=0., ty=0., tz=0.,
 
     return np.array(PoseMatrix)
 
+
+################ Terrain... ####################
+
+# difficulty -> (number of craters/hills, max hill height, max crater depth), in meters
+TERRAIN_DIFFICULTY = {
+    'easy': (3, 15, 10),
+    'moderate': (5, 25, 15),
+    'hard': (8, 40, 20),
+}
+
+
+def generate_terrains(num_terrains, x_min, x_max, difficulty='moderate', num_points=100, rng=np.random):
+    """
+    Generate num_terrains uneven terrains with craters and hills at once.
+    Returns the sample positions x_points (num_points,) and the heights
+    (num_terrains, num_points). rng can be np.random or a np.random.Generator.
+    """
+    # unknown difficulties are generated as 'hard'
+    num_features, max_height_variation, crater_depth = \
+        TERRAIN_DIFFICULTY.get(difficulty, TERRAIN_DIFFICULTY['hard'])
+
+    x_points = np.linspace(x_min, x_max, num_points)
+
+    # random features (craters and hills), one row per terrain
+    shape = (num_terrains, num_features)
+    feature_center = rng.uniform(x_min + 50, x_max - 50, size=shape)
+    feature_width = rng.uniform(30, 80, size=shape)
+    is_crater = rng.uniform(0, 1, size=shape) < 0.5
+    u = rng.uniform(0, 1, size=shape)
+    feature_depth = np.where(is_crater, -crater_depth * (0.5 + 0.5 * u),
+                             max_height_variation * (0.3 + 0.7 * u))
+
+    # Gaussian-like features, all of them applied to all points in one broadcast
+    distance = np.abs(x_points - feature_center[..., None]) / feature_width[..., None]
+    influence = np.where(distance < 1, np.exp(-3 * distance ** 2), 0.)
+    heights = np.einsum('mk,mkp->mp', feature_depth, influence)
+
+    # smooth with a moving average over ~30 m (5 points at the default resolution),
+    # zero padded at the ends like np.convolve(mode='same')
+    half = int(round(2 * (num_points - 1) / 99.))
+    padded = np.pad(heights, ((0, 0), (half, half)))
+    heights = sum(padded[:, k:k+num_points] for k in range(2*half + 1)) / (2*half + 1)
+
+    return x_points, heights
+
+
+def make_terrain(x_points, heights, difficulty='moderate'):
+    # terrain dict of one row of generate_terrains: a heightmap on the uniform grid x_points
+    heights = np.ascontiguousarray(heights, dtype=np.float64)
+    return {
+        'difficulty': difficulty,
+        'heights': heights,
+        'x0': float(x_points[0]),
+        'dx': float(x_points[1] - x_points[0]),
+        'points': np.stack([x_points, heights], axis=1),
+    }
+
+
+class TerrainBank(object):
+    """
+    A fixed set of num_terrains terrains of one difficulty, generated once from
+    `seed` and saved as a (num_terrains, num_points) heightmap .npy file in
+    bank_dir. The file is opened memory-mapped and read-only, so every env /
+    worker process using the bank shares the same pages instead of generating
+    its own terrains, and terrain i is the same everywhere.
+
+    """
+
+    def __init__(self, bank_dir, difficulty='moderate', num_terrains=1000, num_points=100,
+                 x_min=-300, x_max=300, seed=0):
+
+        if difficulty not in TERRAIN_DIFFICULTY:
+            raise NotImplementedError('terrain difficulty [%s] is not found, please choose one '
+                                      'from (easy, moderate, hard)' % difficulty)
+
+        self.difficulty = difficulty
+        self.x_points = np.linspace(x_min, x_max, num_points)
+        self.path = os.path.join(bank_dir, 'terrain_%s_n%d_p%d_seed%d.npy'
+                                 % (difficulty, num_terrains, num_points, seed))
+
+        if not os.path.exists(self.path):
+            if not os.path.exists(bank_dir):
+                os.makedirs(bank_dir, exist_ok=True)
+            rng = np.random.default_rng([seed, list(TERRAIN_DIFFICULTY).index(difficulty)])
+            _, heights = generate_terrains(num_terrains, x_min, x_max, difficulty=difficulty,
+                                           num_points=num_points, rng=rng)
+            # write to a temp file first, other processes may be opening the bank concurrently
+            tmp_path = '%s.%d.tmp' % (self.path, os.getpid())
+            with open(tmp_path, 'wb') as f:
+                np.save(f, heights)
+            os.replace(tmp_path, self.path)
+
+        self.heights = np.load(self.path, mmap_mode='r')
+
+    def __len__(self):
+        return len(self.heights)
+
+    def __getstate__(self):
+        # pickled (e.g. sent to a worker process) without the data, reopened from the file
+        state = self.__dict__.copy()
+        del state['heights']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.heights = np.load(self.path, mmap_mode='r')
+
+    def sample_index(self, rng=np.random):
+        return int(rng.randint(len(self))) if rng is np.random else int(rng.integers(len(self)))
+
+    def get_terrain(self, index):
+        return make_terrain(self.x_points, self.heights[index], self.difficulty)
+
+
+def build_terrain_banks(bank_dir, num_terrains=1000, num_points=100, x_min=-300, x_max=300, seed=0):
+    # one bank per difficulty, generated (once) up front
+    return {difficulty: TerrainBank(bank_dir, difficulty, num_terrains, num_points, x_min, x_max, seed)
+            for difficulty in TERRAIN_DIFFICULTY}
+
+################ Trajectory recording... ####################
+
+class TrajectoryBuffer(object):
+    """
+    Preallocated record of one episode: row i holds the chosen `fields` (indices
+    into the state vector, None = the whole vector) after step i. Once more than
+    `capacity` steps are appended the oldest rows are overwritten.
+    """
+
+    def __init__(self, capacity, state_size, fields=None):
+        self.fields = list(range(state_size)) if fields is None else list(fields)
+        self.capacity = int(capacity)
+        self.data = np.zeros((self.capacity, len(self.fields)), dtype=np.float64)
+        self.size = 0  # steps appended since clear(), may exceed capacity
+
+        # contiguous fields are copied out of the state with a slice
+        first = self.fields[0]
+        if self.fields == list(range(first, first + len(self.fields))):
+            self.index = slice(first, first + len(self.fields))
+        else:
+            self.index = np.array(self.fields)
+
+    def __len__(self):
+        return min(self.size, self.capacity)
+
+    def clear(self):
+        self.size = 0
+
+    def append(self, state):
+        self.data[self.size % self.capacity] = state[self.index]
+        self.size += 1
+
+    def view(self):
+        # recorded rows in time order: a view of the buffer, copied only once it has wrapped around
+        if self.size <= self.capacity:
+            return self.data[:self.size]
+        return np.roll(self.data, -(self.size % self.capacity), axis=0)
+
+    def column(self, field):
+        # one recorded field over time, e.g. column(X)
+        return self.view()[:, self.fields.index(field)]
@@ -44,6 +44,95 @@ def create_rectangle_poly(center, w, h):
     pts = [[x0-w/2, y0+h/2], [x0+w/2, y0+h/2], [x0+w/2, y0-h/2], [x0-w/2, y0-h/2]]
     return pts
 
+################ Streaming statistics... ####################
+
+class RunningStats(object):
+    """Mean, std, min and max of every value seen so far (Welford's algorithm), O(1) per update."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def update(self, x):
+        x = float(x)
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    @property
+    def var(self):
+        return self.m2 / self.count if self.count > 0 else 0.0
+
+    @property
+    def std(self):
+        return self.var ** 0.5
+
+
+class WindowedStats(object):
+    """Mean and std (ddof=0, like np.std) of the last `window` values, kept in a ring buffer, O(1) per update."""
+
+    def __init__(self, window):
+        self.window = int(window)
+        self.values = np.zeros(self.window)
+        self.count = 0  # values currently in the window
+        self.pos = 0    # next slot of the ring buffer
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, x):
+        x = float(x)
+        if self.count < self.window:
+            # window still filling: plain Welford step
+            self.count += 1
+            delta = x - self.mean
+            self.mean += delta / self.count
+            self.m2 += delta * (x - self.mean)
+        else:
+            # sliding Welford step: x replaces the oldest value
+            old = self.values[self.pos]
+            old_mean = self.mean
+            self.mean += (x - old) / self.window
+            self.m2 += (x - old) * (x - self.mean + old - old_mean)
+        self.values[self.pos] = x
+        self.pos = (self.pos + 1) % self.window
+
+    @property
+    def full(self):
+        return self.count == self.window
+
+    @property
+    def var(self):
+        return max(self.m2, 0.0) / self.count if self.count > 0 else 0.0
+
+    @property
+    def std(self):
+        return self.var ** 0.5
+
+
+def windowed_curve(values, window):
+    """
+    Moving mean and std (ddof=0) of every full window of a whole array, e.g. a
+    saved log, vectorized with cumulative sums (the means match
+    np.convolve(values, np.ones(window)/window, 'valid')). Live bookkeeping
+    that sees one value at a time uses WindowedStats instead.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < window:
+        return np.zeros(0), np.zeros(0)
+    # centered first, so the running sums stay small and the variance keeps its precision
+    centered = values - values.mean()
+    s1 = np.concatenate([[0.0], np.cumsum(centered)])
+    s2 = np.concatenate([[0.0], np.cumsum(centered * centered)])
+    mean = (s1[window:] - s1[:-window]) / window
+    var = (s2[window:] - s2[:-window]) / window - mean * mean
+    return mean + values.mean(), np.sqrt(np.maximum(var, 0.0))
+
 
 ################ Let's do some math... ####################
 
@@ -116,3 +205,45 @@ def create_pose_matrix(tx=0., ty=0., tz=0.,
 
     return np.array(PoseMatrix)
 
+
+################ Trajectory recording... ####################
+
+class TrajectoryBuffer(object):
+    """
+    Preallocated record of one episode: row i holds the chosen `fields` (indices
+    into the state vector, None = the whole vector) after step i. Once more than
+    `capacity` steps are appended the oldest rows are overwritten.
+    """
+
+    def __init__(self, capacity, state_size, fields=None):
+        self.fields = list(range(state_size)) if fields is None else list(fields)
+        self.capacity = int(capacity)
+        self.data = np.zeros((self.capacity, len(self.fields)), dtype=np.float64)
+        self.size = 0  # steps appended since clear(), may exceed capacity
+
+        # contiguous fields are copied out of the state with a slice
+        first = self.fields[0]
+        if self.fields == list(range(first, first + len(self.fields))):
+            self.index = slice(first, first + len(self.fields))
+        else:
+            self.index = np.array(self.fields)
+
+    def __len__(self):
+        return min(self.size, self.capacity)
+
+    def clear(self):
+        self.size = 0
+
+    def append(self, state):
+        self.data[self.size % self.capacity] = state[self.index]
+        self.size += 1
+
+    def view(self):
+        # recorded rows in time order: a view of the buffer, copied only once it has wrapped around
+        if self.size <= self.capacity:
+            return self.data[:self.size]
+        return np.roll(self.data, -(self.size % self.capacity), axis=0)
+
+    def column(self, field):
+        # one recorded field over time, e.g. column(X)
+        return self.view()[:, self.fields.index(field)]